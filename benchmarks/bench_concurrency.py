@@ -0,0 +1,97 @@
+"""Measure read throughput and "database is locked" errors while a writer is busy, with and without --concurrent.
+
+    python benchmarks/bench_concurrency.py --readers 8 --seconds 5
+"""
+# bench_concurrency.py
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from library.database import DatabaseHandler  # noqa: E402
+from library.errors import LibraryError  # noqa: E402
+
+
+def populate(handler: DatabaseHandler, books: int):
+    with handler._conn as conn:
+        conn.executemany('INSERT INTO Genre (GenreName) VALUES (?)', ((f"Genre{i}",) for i in range(20)))
+        conn.executemany('INSERT INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)',
+                         ((f"First{i}", f"Last{i}", "1970-01-01") for i in range(100)))
+        conn.executemany('INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
+                         ((f"Title {i}", i % 20 + 1, None, i % 100 + 1) for i in range(books)))
+
+
+def run(concurrent: bool, readers: int, seconds: float, books: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        DatabaseHandler.my_library = os.path.join(directory, "bench.db")
+        setup = DatabaseHandler(concurrent)
+        setup.init_table()
+        populate(setup, books)
+
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        lock = threading.Lock()
+
+        def record(key: str):
+            with lock:
+                counts[key] += 1
+
+        def connect() -> DatabaseHandler:
+            # One handler, as in `serve --concurrent`: pooled readers plus the shared writer.
+            # Without it every thread needs its own connection to the same file.
+            return setup if concurrent else DatabaseHandler()
+
+        def read_loop():
+            handler = connect()
+            while not stop.is_set():
+                try:
+                    for _ in handler.search_book_by_genre(7, 0, 50):
+                        pass
+                    record("reads")
+                except (sqlite3.OperationalError, LibraryError):
+                    record("locked")
+
+        def write_loop():
+            handler = connect()
+            i = 0
+            while not stop.is_set():
+                try:
+                    handler.add_book(f"New {i}", i % 20 + 1, None, i % 100 + 1)
+                    record("writes")
+                except (sqlite3.OperationalError, LibraryError):
+                    record("locked")
+                i += 1
+
+        threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+        threads.append(threading.Thread(target=write_loop))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long each mode runs.")
+    parser.add_argument("--books", type=int, default=100_000, help="Books to generate before starting.")
+    args = parser.parse_args()
+
+    for concurrent in (False, True):
+        counts = run(concurrent, args.readers, args.seconds, args.books)
+        mode = "concurrent (WAL)" if concurrent else "default"
+        print(f"{mode}: {counts['reads'] / args.seconds:,.0f} reads/s, "
+              f"{counts['writes'] / args.seconds:,.0f} writes/s, {counts['locked']} locked errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Measure small-write throughput and latency from many threads, committing each write alone or in groups.
+
+    python benchmarks/bench_group_commit.py --writers 16 --seconds 5 --delays-ms 0,1,5
+"""
+# bench_group_commit.py
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from library.database import DatabaseHandler  # noqa: E402
+from library.writequeue import WriteQueue  # noqa: E402
+
+
+def percentile(values: list, p: float) -> float:
+    return sorted(values)[max(math.ceil(p / 100 * len(values)) - 1, 0)] if values else 0.0
+
+
+def run(writers: int, seconds: float, delay, batch: int) -> dict:
+    """One handler as in `serve --concurrent`, with a WriteQueue unless `delay` is None."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        write_queue = WriteQueue(path, delay, batch) if delay is not None else None
+        handler = DatabaseHandler(True, path, write_queue=write_queue)
+        handler.init_table()
+        # The default is NORMAL, which doesn't sync WAL commits; compare like with like.
+        handler._conn.execute('PRAGMA synchronous = FULL')
+
+        stop = threading.Event()
+        latencies = [[] for _ in range(writers)]
+
+        def write_loop(n: int):
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                handler.add_genre(f"Genre {n}-{i}")
+                latencies[n].append(time.perf_counter() - started)
+                i += 1
+
+        threads = [threading.Thread(target=write_loop, args=(n,)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if write_queue is not None:
+            write_queue.close()
+        handler._conn.close()
+        values = [value for thread in latencies for value in thread]
+        return {"writes": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99),
+                "batches": write_queue.batches if write_queue else len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=16, help="Writer threads.")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long each mode runs.")
+    parser.add_argument("--delays-ms", default="0,1,5", help="Comma-separated group commit delays to try.")
+    parser.add_argument("--batch", type=int, default=256, help="Writes per group commit at most.")
+    args = parser.parse_args()
+
+    modes = [None] + [float(delay) / 1000 for delay in args.delays_ms.split(",")]
+    for delay in modes:
+        result = run(args.writers, args.seconds, delay, args.batch)
+        mode = "commit per write" if delay is None else f"group commit, {delay * 1000:g} ms"
+        print(f"{mode}: {result['writes'] / args.seconds:,.0f} writes/s in {result['batches']} commits, "
+              f"p50 {result['p50'] * 1000:.2f} ms, p99 {result['p99'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
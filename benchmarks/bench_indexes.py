@@ -0,0 +1,88 @@
+"""Show the query plan and latency of every indexed lookup before and after the index set is built.
+
+    python benchmarks/bench_indexes.py --rows 1000000
+"""
+# bench_indexes.py
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fixtures import populate  # noqa: E402
+from library.database import DatabaseHandler, INDEXES, Page  # noqa: E402
+
+LOOKUPS = [
+    ("get_author_id", ("First7", "Last7")),
+    ("search_author", ("First7", "Last7")),
+    ("get_user_id", ("First42", "Last42")),
+    ("search_user", ("First42", "Last42")),
+    ("search_loan", (42, 4242)),
+    ("get_user_with_loan", ()),
+    ("get_overdue_loan", (19723,)),
+    ("get_overdue_loan", (19723, 30)),
+    ("get_available_book", ()),
+    ("search_book_by_genre", (3,)),
+    ("search_book_by_author", (7,)),
+]
+
+
+def measure(handler: DatabaseHandler, conn: sqlite3.Connection) -> dict:
+    results = {}
+    for name, args in LOOKUPS:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        started = time.perf_counter()
+        result = getattr(handler, name)(*args)
+        if isinstance(result, list) and isinstance(result[0], Page):
+            # List and report queries are streamed; time reading all of the rows.
+            for _ in result[0]:
+                pass
+        elapsed = time.perf_counter() - started
+        conn.set_trace_callback(None)
+        plans = []
+        for statement in statements:
+            if statement.lstrip().upper().startswith("SELECT"):
+                plans.extend(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement))
+        results[name, args] = (elapsed, plans)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Books and loans to generate.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        DatabaseHandler.my_library = os.path.join(directory, "bench.db")
+        handler = DatabaseHandler()
+        handler.init_table()
+        conn = handler._conn
+        for name, _ in INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        print(f"Populating {args.rows:,} books and loans...")
+        populate(conn, args.rows)
+
+        before = measure(handler, conn)
+        started = time.perf_counter()
+        with conn:
+            for _, index in INDEXES:
+                conn.execute(index)
+        print(f"Built {len(INDEXES)} indexes in {time.perf_counter() - started:.2f}s\n")
+        after = measure(handler, conn)
+
+        for key in LOOKUPS:
+            print(f"{key[0]}{key[1]}: {before[key][0] * 1000:.1f} ms -> {after[key][0] * 1000:.1f} ms")
+            for plan in before[key][1]:
+                print(f"    before  {plan}")
+            for plan in after[key][1]:
+                print(f"    after   {plan}")
+        handler._conn.close()
+
+
+if __name__ == "__main__":
+    main()
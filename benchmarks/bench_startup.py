@@ -0,0 +1,75 @@
+"""Hold the CLI to a cold-start budget using `python -X importtime`.
+
+    python benchmarks/bench_startup.py --budget-ms 60
+
+Runs each command a few times in a fresh interpreter, reports the best wall time and cumulative
+import time, and exits non-zero if a command goes over budget or if --version/--help load sqlite3.
+"""
+# bench_startup.py
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+# Modules that must stay out of --version and --help.
+FORBIDDEN = ("sqlite3", "library.database", "library.library")
+COMMANDS = [
+    (["--version"], True),
+    (["--help"], True),
+    (["list-all-genre", "--limit", "1"], False),
+]
+
+
+def run(args: list) -> tuple:
+    """Return (wall seconds, {top-level module: cumulative microseconds}, all imported modules) for one cold run."""
+    env = dict(os.environ, PYTHONPATH=ROOT, LIBRARY_SERVER="off")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "library"] + args,
+                            capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - started
+    modules, imported = {}, set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imported.add(match.group(4))
+            # Nested imports are already counted in their parent's cumulative time.
+            if len(match.group(3)) == 1:
+                modules[match.group(4)] = int(match.group(2))
+    return elapsed, modules, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=60.0,
+                        help="Wall-time budget for --version; --help and commands get --heavy-factor times this.")
+    parser.add_argument("--heavy-factor", type=float, default=10.0, help="Budget multiplier for typer commands.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command; the best one counts.")
+    parser.add_argument("--top", type=int, default=5, help="Slowest top-level imports to list per command.")
+    args = parser.parse_args()
+
+    failed = False
+    for command, light in COMMANDS:
+        runs = [run(command) for _ in range(args.repeat)]
+        elapsed, modules, imported = min(runs, key=lambda item: item[0])
+        budget = args.budget_ms if command == ["--version"] else args.budget_ms * args.heavy_factor
+        over = elapsed * 1000 > budget
+        leaked = [name for name in FORBIDDEN if name in imported] if light else []
+        failed = failed or over or bool(leaked)
+
+        print(f"library {' '.join(command)}: {elapsed * 1000:.1f} ms (budget {budget:.0f} ms), "
+              f"{sum(modules.values()) / 1000:.1f} ms importing {len(imported)} modules"
+              + (" OVER BUDGET" if over else ""))
+        for name, micros in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {micros / 1000:8.1f} ms  {name}")
+        if leaked:
+            print(f"    loads {', '.join(leaked)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Time every public DatabaseHandler and Library operation against generated databases and write JSON percentiles.
+
+    python benchmarks/bench_suite.py --scales 10000,100000,1000000 --output results.json
+
+Each scale gets a fresh database with that many books and loans. Lookups, reports and searches run
+--repeat times with randomly chosen arguments; list and report queries record time to the first row as
+well as the time to read every row. Writes run last, against the same database, and also report
+throughput. Compare two result files to see whether a change helps or hurts.
+"""
+# bench_suite.py
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fixtures import GENRES, populate  # noqa: E402
+from library.database import DatabaseHandler, Page  # noqa: E402
+from library.library import Library  # noqa: E402
+
+# The day overdue reports are run for.
+AS_OF = 19723
+
+
+class Scale:
+    """Random arguments that exist in a database populated with `rows` books and loans."""
+
+    def __init__(self, rows: int, seed: int = 1):
+        self.rows = rows
+        self.authors, self.users = max(rows // 100, 1), max(rows // 10, 1)
+        self.rng = random.Random(seed)
+
+    def book(self) -> int:
+        return self.rng.randint(1, self.rows)
+
+    def title(self) -> str:
+        return f"Title {self.book() - 1}"
+
+    def genre(self) -> int:
+        return self.rng.randint(1, GENRES)
+
+    def genre_name(self) -> str:
+        return f"Genre{self.genre() - 1}"
+
+    def author(self) -> int:
+        return self.rng.randint(1, self.authors)
+
+    def author_name(self) -> tuple:
+        i = self.author() - 1
+        return f"First{i}", f"Last{i}"
+
+    def user(self) -> int:
+        return self.rng.randint(1, self.users)
+
+    def user_name(self) -> tuple:
+        i = self.user() - 1
+        return f"First{i}", f"Last{i}"
+
+    def token(self) -> str:
+        return f"{self.rng.randint(0, 10 ** 9):09d}"
+
+
+# (name, arguments) for the read operations; arguments are drawn afresh for every sample.
+HANDLER_READS = [
+    ("info_genre", lambda s: (s.genre(),)),
+    ("info_author", lambda s: (s.author(),)),
+    ("info_book", lambda s: (s.book(),)),
+    ("info_user", lambda s: (s.user(),)),
+    ("info_loan", lambda s: (s.book(),)),
+    ("get_genre_id", lambda s: (s.genre_name(),)),
+    ("get_author_id", lambda s: s.author_name()),
+    ("get_book_id", lambda s: (s.title(),)),
+    ("get_user_id", lambda s: s.user_name()),
+    ("get_genre_ids", lambda s: ([s.genre_name() for _ in range(100)],)),
+    ("get_author_ids", lambda s: ([s.author_name() for _ in range(100)],)),
+    ("get_book_ids", lambda s: ([s.title() for _ in range(100)],)),
+    ("get_user_ids", lambda s: ([s.user_name() for _ in range(100)],)),
+    ("search_genre", lambda s: (s.genre_name(),)),
+    ("search_author", lambda s: s.author_name()),
+    ("search_book", lambda s: (s.title(),)),
+    ("search_user", lambda s: s.user_name()),
+    ("search_loan", lambda s: (s.user(), s.book())),
+    ("check_if_available", lambda s: (s.title(),)),
+    ("search_book_by_genre", lambda s: (s.genre(),)),
+    ("search_book_by_author", lambda s: (s.author(),)),
+    ("find_book", lambda s: (f'"Title" AND "{s.book() % 1000:03d}"',)),
+    ("get_top_genres", lambda s: (10,)),
+    ("get_top_authors", lambda s: (10,)),
+    ("get_genre_with_book", lambda s: ()),
+    ("get_author_with_book", lambda s: ()),
+    ("get_overdue_loan", lambda s: (AS_OF,)),
+    ("get_overdue_loan", lambda s: (AS_OF, 30)),
+    ("list_all_genre", lambda s: ()),
+    ("list_all_author", lambda s: ()),
+    ("list_all_book", lambda s: ()),
+    ("list_all_user", lambda s: ()),
+    ("list_all_loan", lambda s: ()),
+    ("get_series_book", lambda s: ()),
+    ("get_non_series_book", lambda s: ()),
+    ("get_available_book", lambda s: ()),
+    ("get_non_available_book", lambda s: ()),
+    ("get_user_with_loan", lambda s: ()),
+    ("get_returned_loan", lambda s: ()),
+    ("export_table", lambda s: ("Loan",)),
+]
+
+LIBRARY_READS = [
+    ("info_book", lambda s: (s.book(),)),
+    ("info_loan", lambda s: (s.book(),)),
+    ("get_genre_id", lambda s: (s.genre_name(),)),
+    ("get_author_id", lambda s: s.author_name()),
+    ("get_book_id", lambda s: (s.title(),)),
+    ("get_user_id", lambda s: s.user_name()),
+    ("search_genre", lambda s: (s.genre_name(),)),
+    ("search_author", lambda s: (" ".join(s.author_name()),)),
+    ("search_book", lambda s: (s.title(),)),
+    ("search_user", lambda s: (" ".join(s.user_name()),)),
+    ("search_loan", lambda s: (" ".join(s.user_name()), s.title())),
+    ("check_if_available", lambda s: (s.title(),)),
+    ("search_book_by_genre", lambda s: (s.genre_name(),)),
+    ("search_book_by_author", lambda s: (" ".join(s.author_name()),)),
+    ("find_books", lambda s: (f"Title {s.book() % 1000:03d}",)),
+    ("top_genres", lambda s: (10,)),
+    ("top_authors", lambda s: (10,)),
+    ("genre_with_most_book", lambda s: ()),
+    ("author_with_most_book", lambda s: ()),
+    ("overdue_loan", lambda s: ("2024-01-01",)),
+    ("list_all_book", lambda s: ()),
+    ("list_all_loan", lambda s: ()),
+    ("book_in_series", lambda s: ()),
+    ("available_books_for_loan", lambda s: ()),
+    ("user_with_loan", lambda s: ()),
+    ("returned_loan", lambda s: ()),
+]
+
+HANDLER_WRITES = [
+    ("add_genre", lambda s: (f"Genre {s.token()}",)),
+    ("add_author", lambda s: (f"First{s.token()}", "Bench", "1980-01-01")),
+    ("add_book", lambda s: (f"Bench {s.token()}", s.genre(), "null", s.author())),
+    ("add_user", lambda s: (f"First{s.token()}", "Bench", "Main Street", f"{s.token()}@example.com", s.token())),
+    ("add_loan", lambda s: (s.book(), s.user(), AS_OF, AS_OF + 21)),
+    # Rewrites a genre's own name, so the Library cases can still resolve every genre.
+    ("update_fields", lambda s: (lambda genre: ("Genre", genre, {"GenreName": f"Genre{genre - 1}"}))(s.genre())),
+    ("update_fields", lambda s: ("Author", s.author(), {"Birthday": "1981-01-01"})),
+    ("update_fields", lambda s: ("Book", s.book(), {"Genre_ID": s.genre()})),
+    ("update_fields", lambda s: ("User", s.user(), {"Address": "Side Street"})),
+    ("bulk_add_book", lambda s: ([(f"Bench {s.token()}", s.genre(), None, s.author()) for _ in range(1000)],)),
+    ("bulk_add_loan", lambda s: ([(s.book(), s.user(), AS_OF, AS_OF + 21) for _ in range(1000)],)),
+    ("update_fields", lambda s: ("Loan", s.book(), {"DueDate": AS_OF + 30, "DateReturn": AS_OF + 2})),
+    ("bulk_update", lambda s: ("User", [(s.user(), {"Address": "Side Street"}) for _ in range(1000)])),
+]
+
+LIBRARY_WRITES = [
+    ("add_genre", lambda s: (f"Genre {s.token()}",)),
+    ("add_author", lambda s: (f"First{s.token()}", "Bench", "1980-01-01")),
+    ("add_book", lambda s: (f"Bench {s.token()}", s.genre_name(), "null", " ".join(s.author_name()))),
+    ("add_user", lambda s: (f"First{s.token()}", "Bench", "Main Street", f"{s.token()}@example.com", s.token())),
+    ("add_loan", lambda s: (s.title(), " ".join(s.user_name()), "2024-01-01", "2024-01-22")),
+    ("update_book", lambda s: (s.book(), "null", s.genre_name(), "null", "null", "null")),
+    ("update_user", lambda s: (s.user(), "null", "Side Street", "null", "null")),
+    ("update_loan", lambda s: (s.book(), "null", "null", "null", "2024-02-01", "null", "null")),
+    ("bulk_add_books", lambda s: ([{"title": f"Bench {s.token()}", "genre": s.genre_name(),
+                                    "author": " ".join(s.author_name())} for _ in range(1000)],)),
+    ("patch", lambda s: ("book", s.book(), {"genre": s.genre_name(), "series": "Bench Series"})),
+    ("bulk_update", lambda s: ("user", [{"id": s.user(), "address": "Side Street"} for _ in range(1000)])),
+]
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+
+    def rank(p):
+        # Nearest-rank percentile, in milliseconds.
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {"p50_ms": rank(50), "p95_ms": rank(95), "p99_ms": rank(99), "mean_ms": sum(ordered) / len(ordered) * 1000}
+
+
+def time_call(target, name: str, args: tuple) -> tuple:
+    """Return (seconds until the first row, or None if not streamed; seconds until done; rows read)."""
+    started = time.perf_counter()
+    result = getattr(target, name)(*args)
+    if isinstance(result, list) and result and isinstance(result[0], Page):
+        rows = iter(result[0])
+        first = next(rows, None)
+        first_row = time.perf_counter() - started
+        count = sum(1 for _ in rows) + (first is not None)
+        return first_row, time.perf_counter() - started, count
+    elapsed = time.perf_counter() - started
+    if hasattr(result, "inserted"):
+        return None, elapsed, result.inserted
+    return None, elapsed, len(result) if isinstance(result, list) else 1
+
+
+def run_cases(target, layer: str, cases: list, scale: Scale, repeat: int, list_repeat: int,
+              commit=None) -> list:
+    results = []
+    for name, make_args in cases:
+        first_rows, totals, rows = [], [], 0
+        sample_args = make_args(scale)
+        for i in range(repeat):
+            args = sample_args if i == 0 else make_args(scale)
+            first_row, total, count = time_call(target, name, args)
+            if commit is not None:
+                commit()
+            if first_row is not None:
+                first_rows.append(first_row)
+            totals.append(total)
+            rows += count
+            # Full listings read the whole table; a handful of samples is enough.
+            if first_rows and len(totals) >= list_repeat:
+                break
+        label = name
+        if name == "get_overdue_loan":
+            label += f"{tuple(sample_args)}"
+        elif name == "update_fields":
+            label += f"({sample_args[0]})"
+        result = {"scale": scale.rows, "layer": layer, "operation": label, "samples": len(totals),
+                  "rows_per_call": rows / len(totals), **percentiles(totals),
+                  "ops_per_sec": len(totals) / sum(totals)}
+        if first_rows:
+            result["first_row"] = percentiles(first_rows)
+        results.append(result)
+        print(f"  {scale.rows:>9,} {layer:<7} {label:<32} p50 {result['p50_ms']:9.3f} ms  "
+              f"p99 {result['p99_ms']:9.3f} ms", file=sys.stderr)
+    return results
+
+
+def bench_scale(rows: int, repeat: int, list_repeat: int, layers: list) -> list:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        handler = DatabaseHandler(path=path)
+        handler.init_table()
+        started = time.perf_counter()
+        populate(handler._conn, rows)
+        print(f"Populated {rows:,} books and loans in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        results = []
+        library = Library(path=path)
+        if "handler" in layers:
+            results += run_cases(handler, "handler", HANDLER_READS, Scale(rows), repeat, list_repeat)
+        if "library" in layers:
+            results += run_cases(library, "library", LIBRARY_READS, Scale(rows), repeat, list_repeat)
+        if "handler" in layers:
+            results += run_cases(handler, "handler", HANDLER_WRITES, Scale(rows, 2), repeat, list_repeat,
+                                 handler.commit)
+        if "library" in layers:
+            results += run_cases(library, "library", LIBRARY_WRITES, Scale(rows, 3), repeat, list_repeat,
+                                 library._dbhandler.commit)
+        handler._conn.close()
+        library._dbhandler._conn.close()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="Comma-separated database sizes, in books (and loans).")
+    parser.add_argument("--repeat", type=int, default=50, help="Samples per operation.")
+    parser.add_argument("--list-repeat", type=int, default=5,
+                        help="Samples for list and report queries, which read every matching row.")
+    parser.add_argument("--layer", choices=["handler", "library", "both"], default="both")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    layers = ["handler", "library"] if args.layer == "both" else [args.layer]
+    results = []
+    for rows in (int(value) for value in args.scales.split(",")):
+        results += bench_scale(rows, args.repeat, args.list_repeat, layers)
+
+    report = json.dumps({"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                         "platform": platform.platform(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""This module provides the generated database the benchmarks run against."""
+# fixtures.py
+
+import random
+import sqlite3
+
+GENRES = 50
+# First day of the generated loans (2023-01-01).
+LOAN_DAY = 19358
+
+
+def populate(conn: sqlite3.Connection, rows: int):
+    """Fill a new database with `rows` books and loans, rows // 100 authors and rows // 10 users.
+
+    Names are numbered from 0 (Genre7, First7 Last7, Title 7), so benchmarks can pick
+    arguments that exist without reading the database. The same `rows` give the same data.
+    """
+    rng = random.Random(0)
+    authors, users = max(rows // 100, 1), max(rows // 10, 1)
+    with conn:
+        conn.executemany('INSERT INTO Genre (GenreName) VALUES (?)', ((f"Genre{i}",) for i in range(GENRES)))
+        conn.executemany('INSERT INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)',
+                         ((f"First{i}", f"Last{i}", "1970-01-01") for i in range(authors)))
+        conn.executemany('INSERT INTO User (FirstName, LastName, Address, Email, PhoneNumber) VALUES (?,?,?,?,?)',
+                         ((f"First{i}", f"Last{i}", "Main Street", f"user{i}@example.com", f"555-{i}")
+                          for i in range(users)))
+        # One book in five belongs to a series.
+        conn.executemany('INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
+                         ((f"Title {i}", rng.randint(1, GENRES), f"Series {i // 50}, #{i % 50}" if i % 5 == 0 else None,
+                           rng.randint(1, authors)) for i in range(rows)))
+        # Most loans are history; roughly one in twenty is still out.
+        conn.executemany('INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate, LoanStatus) VALUES (?,?,?,?,?)',
+                         ((rng.randint(1, rows), rng.randint(1, users), LOAN_DAY + rng.randint(0, 300),
+                           LOAN_DAY + rng.randint(14, 365), "Not Return" if rng.random() < 0.05 else "Returned")
+                          for _ in range(rows)))
@@ -1,10 +1,17 @@
 """CLI To-Do entry point script"""
 # __main__.py
 
-from library import lib, __app_name__
+import sys
+
+from library import __app_name__, __version__
 
 
 def main():
+    # Answer --version before typer is even imported; see benchmarks/bench_startup.py.
+    if sys.argv[1:] in (["--version"], ["-v"]):
+        print(f"{__app_name__} v{__version__}")
+        return
+    from library import lib
     lib.app(prog_name=__app_name__)
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""This module provides the asyncio facade over the library."""
+# aio.py
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from library.database import FETCH_SIZE, DatabaseHandler, Page
+from library.importer import chunked
+from library.library import Library
+from library.writequeue import MAX_DELAY, MAX_OPS, WriteQueue
+
+# Batches a stream may read ahead of the coroutine consuming it.
+READ_AHEAD = 2
+
+
+class _End:
+    def __init__(self, next_after):
+        self.next_after = next_after
+
+
+class PageList(list):
+    """The rows of a page awaited directly; `next_after` is the cursor for the following page."""
+
+    def __init__(self, page: Page):
+        super().__init__(page)
+        self.next_after = page.next_after
+
+
+class AsyncRows:
+    """Async iterator over the rows of a streamed list or report query.
+
+    Each batch is read by its own executor task, so the worker is handed back between
+    batches and a slow consumer never holds one; at most READ_AHEAD batches are read ahead
+    of the coroutine consuming them. `next_after` is the cursor for the following page once
+    the rows are exhausted. Stopping early releases the query's connection: call `aclose()`,
+    use `async with`, or just drop the object.
+    """
+
+    def __init__(self, run):
+        # run(function) runs function() on the executor and returns an awaitable future.
+        self.column_names = None
+        self.next_after = None
+        self._run = run
+        self._queue = asyncio.Queue()
+        self._page = None
+        self._batches = None
+        self._reading = False
+        self._batch = iter(())
+
+    async def _open(self, query):
+        page, self.column_names = await self._run(query)
+        self._page, self._batches = page, chunked(page, FETCH_SIZE)
+        self._read_ahead()
+
+    @staticmethod
+    def _read(page: Page, batches):
+        batch = next(batches, None)
+        return _End(page.next_after) if batch is None else batch
+
+    def _read_ahead(self):
+        if self._reading or self._batches is None or self._queue.qsize() >= READ_AHEAD:
+            return
+        self._reading = True
+        self._run(partial(self._read, self._page, self._batches)).add_done_callback(self._received)
+
+    def _received(self, future):
+        self._reading = False
+        if self._batches is None or future.cancelled():
+            return
+        item = future.exception() or future.result()
+        self._queue.put_nowait(item)
+        if isinstance(item, list):
+            self._read_ahead()
+        else:
+            self._page = self._batches = None
+
+    async def _receive(self):
+        item = await self._queue.get()
+        self._read_ahead()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple:
+        while True:
+            row = next(self._batch, None)
+            if row is not None:
+                return row
+            item = await self._receive()
+            if isinstance(item, _End):
+                self.next_after = item.next_after
+                raise StopAsyncIteration
+            self._batch = iter(item)
+
+    async def aclose(self):
+        """Stop reading early; the query's connection is released with the last batch being read."""
+        self._page = self._batches = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class AsyncLibrary:
+    """Run Library operations on a dedicated thread pool so they don't block the event loop.
+
+    Every worker thread opens its own Library (and so its own connections) in concurrent
+    mode. Await any Library method by name; failures raise LibraryError instead of
+    exiting. List and report methods awaited directly return their rows as a PageList,
+    which carries `next_after`; use `stream` to iterate over large results instead. With `group_commit`, the workers'
+    adds and updates share one WriteQueue, so concurrent writes are committed in batches.
+
+        async with AsyncLibrary() as library:
+            await library.add_genre("Poetry")
+            rows = await library.stream("list_all_book", limit=100)
+            async for row in rows:
+                ...
+    """
+
+    def __init__(self, max_workers: int = 8, group_commit: bool = False, commit_delay: float = MAX_DELAY,
+                 commit_batch: int = MAX_OPS):
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="library")
+        self._local = threading.local()
+        self._write_queue = WriteQueue(DatabaseHandler.my_library, commit_delay, commit_batch) if group_commit else None
+
+    def _library(self) -> Library:
+        library = getattr(self._local, "library", None)
+        if library is None:
+            library = self._local.library = Library(concurrent=True, write_queue=self._write_queue)
+        return library
+
+    def _call(self, method: str, args: tuple, kwargs: dict):
+        result = getattr(self._library(), method)(*args, **kwargs)
+        if isinstance(result, list) and result and isinstance(result[0], Page):
+            result = [PageList(result[0])] + result[1:]
+        return result
+
+    def _open(self, method: str, args: tuple, kwargs: dict):
+        return getattr(self._library(), method)(*args, **kwargs)
+
+    def __getattr__(self, method: str):
+        if method.startswith("_") or not callable(getattr(Library, method, None)):
+            raise AttributeError(method)
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(self._call, method, args, kwargs))
+
+        return call
+
+    async def stream(self, method: str, *args, **kwargs) -> AsyncRows:
+        """Start a list or report query and return its rows for `async for`; column_names is set on return."""
+        rows = AsyncRows(partial(asyncio.get_running_loop().run_in_executor, self._executor))
+        await rows._open(partial(self._open, method, args, kwargs))
+        return rows
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._write_queue is not None:
+            self._write_queue.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
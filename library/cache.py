@@ -0,0 +1,56 @@
+"""This module provides the name-to-ID resolution cache."""
+# cache.py
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class ResolutionCache:
+    """Bounded LRU of (kind, name) -> ID lookups.
+
+    Entries of one kind are dropped when this process renames a row of that kind,
+    and everything is dropped when `PRAGMA data_version` shows that another
+    connection has committed since the last check.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._data_version = None
+        # A concurrent server shares one cache between its request threads.
+        self._lock = threading.Lock()
+
+    def sync(self, data_version: int):
+        with self._lock:
+            if data_version != self._data_version:
+                self._entries.clear()
+                self._data_version = data_version
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: int):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, kind: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == kind]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
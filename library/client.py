@@ -0,0 +1,70 @@
+"""This module provides the thin client for a running library server."""
+# client.py
+
+import os
+import socket
+from typing import Optional
+
+from library.errors import LibraryError
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+PROBE_TIMEOUT = 0.05
+
+
+def server_address() -> Optional[tuple]:
+    """Return (host, port) from LIBRARY_SERVER, or None when client mode is turned off."""
+    address = os.environ.get("LIBRARY_SERVER", DEFAULT_ADDRESS)
+    if address.lower() in ("", "off", "none"):
+        return None
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def connect_server():
+    """Return a RemoteLibrary if a server is listening, otherwise None."""
+    address = server_address()
+    if address is None:
+        return None
+    try:
+        with socket.create_connection(address, timeout=PROBE_TIMEOUT):
+            pass
+    except OSError:
+        return None
+    return RemoteLibrary(*address)
+
+
+class RemoteLibrary:
+    """Forward Library method calls to the server and unwrap their results."""
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self._call(method, list(args), kwargs)
+
+        return call
+
+    def _call(self, method: str, args: list, kwargs: dict):
+        # Imported here so that commands run without a server don't pay for the HTTP client.
+        import json
+        from http.client import HTTPConnection, HTTPException
+
+        conn = HTTPConnection(self._host, self._port, timeout=self._timeout)
+        try:
+            conn.request("POST", "/call", body=json.dumps({"method": method, "args": args, "kwargs": kwargs}),
+                         headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            body = json.loads(response.read())
+        except (OSError, HTTPException, ValueError) as e:
+            raise LibraryError(f"Error while contacting the library server: {e}") from e
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise LibraryError(body.get("error", "Request failed."))
+        return body["result"]
@@ -2,287 +2,881 @@
 # database.py
 
 
+import os
+import queue
 import sqlite3
-from typing import List
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
-import typer
+from library.errors import LibraryError
+from library.instrument import STATS, connection_factory, instrument_methods
 
+if TYPE_CHECKING:
+    from library.writequeue import WriteQueue
 
+FETCH_SIZE = 500
+BUSY_TIMEOUT = 5.0
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+READER_POOL = 8
+SNAPSHOT_PAGES = 256
+SNAPSHOT_SLEEP = 0.005
+SNAPSHOT_RESTARTS = 3
+
+# The lookup indexes of the current schema, which benchmarks/bench_indexes.py drops and rebuilds.
+# The migrations spell out their own statements, as a shipped migration must never change.
+INDEXES = [
+    ('idx_author_name', 'CREATE INDEX IF NOT EXISTS idx_author_name ON Author (FirstName, LastName)'),
+    ('idx_user_name', 'CREATE INDEX IF NOT EXISTS idx_user_name ON User (FirstName, LastName)'),
+    ('idx_book_genre', 'CREATE INDEX IF NOT EXISTS idx_book_genre ON Book (Genre_ID)'),
+    ('idx_book_author', 'CREATE INDEX IF NOT EXISTS idx_book_author ON Book (Author_ID)'),
+    ('idx_book_status', 'CREATE INDEX IF NOT EXISTS idx_book_status ON Book (LoanStatus)'),
+    ('idx_loan_user_book', 'CREATE INDEX IF NOT EXISTS idx_loan_user_book ON Loan (User_ID, Book_ID)'),
+    # Partial index: only loans that are still out, which is all the overdue and
+    # borrower reports ever look at.
+    ('idx_loan_open_due', """CREATE INDEX IF NOT EXISTS idx_loan_open_due ON Loan (LoanStatus, DueDate)
+                             WHERE LoanStatus = 'Not Return'"""),
+    # Partial index: the open loan of each book, which checkin closes.
+    ('idx_loan_open_book', """CREATE INDEX IF NOT EXISTS idx_loan_open_book ON Loan (Book_ID, LoanStatus)
+                              WHERE LoanStatus = 'Not Return'"""),
+    # Partial index: the open loans in Loan_ID order, which check-user-with-loan pages through.
+    ('idx_loan_open_id', """CREATE INDEX IF NOT EXISTS idx_loan_open_id ON Loan (LoanStatus, Loan_ID)
+                            WHERE LoanStatus = 'Not Return'"""),
+]
+
+# The tables whose names the shell completes: (table, key, name columns). Migration 7 spells out
+# the triggers that log their changes, as a shipped migration must never change.
+NAMED_TABLES = [
+    ("Genre", "Genre_ID", ("GenreName",)),
+    ("Author", "Author_ID", ("FirstName", "LastName")),
+    ("Book", "Book_ID", ("Title",)),
+    ("User", "User_ID", ("FirstName", "LastName")),
+]
+
+# Each migration is a list of statements that moves the schema up one version, recorded in
+# PRAGMA user_version. Append new migrations; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: the original tables, book status triggers and lookup indexes. Written with IF NOT EXISTS
+    # so that databases created before schema versioning upgrade cleanly.
+    [
+        '''CREATE TABLE IF NOT EXISTS Genre
+                    (Genre_ID INTEGER NOT NULL,
+                     GenreName TEXT UNIQUE,
+                     PRIMARY KEY(Genre_ID AUTOINCREMENT)
+                     );''',
+        '''CREATE TABLE IF NOT EXISTS Author
+                    (Author_ID	INTEGER NOT NULL,
+                    FirstName	TEXT,
+                    LastName	TEXT,
+                    Birthday	TEXT,
+                    PRIMARY KEY(Author_ID AUTOINCREMENT)
+                    );''',
+        '''CREATE TABLE IF NOT EXISTS Book
+                    (Book_ID INTEGER NOT NULL,
+                    Title TEXT UNIQUE,
+                    Genre_ID INTEGER,
+                    Series TEXT,
+                    Author_ID INTEGER,
+                    LoanStatus TEXT DEFAULT 'Available',
+                    FOREIGN KEY(Author_ID) REFERENCES Author(Author_ID)
+                    FOREIGN KEY(Genre_ID) REFERENCES Genre(Genre_ID),
+                    PRIMARY KEY(Book_ID AUTOINCREMENT)
+                    );''',
+        '''CREATE TABLE IF NOT EXISTS User
+                    (User_ID INTEGER NOT NULL,
+                    FirstName TEXT,
+                    LastName TEXT,
+                    Address TEXT,
+                    Email TEXT UNIQUE,
+                    PhoneNumber TEXT UNIQUE,
+                    PRIMARY KEY(User_ID AUTOINCREMENT)
+                    );''',
+        '''CREATE TABLE IF NOT EXISTS Loan
+                    (Loan_ID INTEGER NOT NULL,
+                    Book_ID INTEGER,
+                    User_ID INTEGER,
+                    LoanDate TEXT DEFAULT CURRENT_DATE,
+                    DueDate INTEGER, DateReturn INTEGER,
+                    LoanStatus TEXT DEFAULT "Not Return",
+                    FOREIGN KEY(Book_ID) REFERENCES Book(Book_ID),
+                    FOREIGN KEY(User_ID) REFERENCES User(User_ID),
+                    PRIMARY KEY(Loan_ID AUTOINCREMENT)
+                    );''',
+        '''CREATE TRIGGER IF NOT EXISTS update_book_status
+                    AFTER INSERT ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Book
+                        SET LoanStatus = 'Not Available'
+                        WHERE Book_ID = NEW.Book_ID;
+                    END''',
+        '''CREATE TRIGGER IF NOT EXISTS update_book_status_return
+                    AFTER UPDATE OF LoanStatus ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Book
+                        SET LoanStatus = 'Available'
+                        WHERE Book_ID = OLD.Book_ID;
+                    END''',
+        'CREATE INDEX IF NOT EXISTS idx_author_name ON Author (FirstName, LastName)',
+        'CREATE INDEX IF NOT EXISTS idx_user_name ON User (FirstName, LastName)',
+        'CREATE INDEX IF NOT EXISTS idx_book_genre ON Book (Genre_ID)',
+        'CREATE INDEX IF NOT EXISTS idx_book_author ON Book (Author_ID)',
+        'CREATE INDEX IF NOT EXISTS idx_book_status ON Book (LoanStatus)',
+        'CREATE INDEX IF NOT EXISTS idx_loan_user_book ON Loan (User_ID, Book_ID)',
+        """CREATE INDEX IF NOT EXISTS idx_loan_open_due ON Loan (LoanStatus, DueDate)
+                    WHERE LoanStatus = 'Not Return'""",
+    ],
+    # 2: per-genre and per-author book counts, kept up to date by triggers on Book so that the
+    # leaderboards read the top of an index instead of grouping the whole catalog.
+    [
+        '''CREATE TABLE GenreBookCount
+                    (Genre_ID INTEGER PRIMARY KEY,
+                    BookCount INTEGER NOT NULL DEFAULT 0
+                    );''',
+        '''CREATE TABLE AuthorBookCount
+                    (Author_ID INTEGER PRIMARY KEY,
+                    BookCount INTEGER NOT NULL DEFAULT 0
+                    );''',
+        'CREATE INDEX idx_genre_book_count ON GenreBookCount (BookCount)',
+        'CREATE INDEX idx_author_book_count ON AuthorBookCount (BookCount)',
+        '''INSERT INTO GenreBookCount (Genre_ID, BookCount)
+                    SELECT Genre_ID, COUNT(*) FROM Book WHERE Genre_ID IS NOT NULL GROUP BY Genre_ID''',
+        '''INSERT INTO AuthorBookCount (Author_ID, BookCount)
+                    SELECT Author_ID, COUNT(*) FROM Book WHERE Author_ID IS NOT NULL GROUP BY Author_ID''',
+        '''CREATE TRIGGER count_book_insert
+                    AFTER INSERT ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO GenreBookCount (Genre_ID, BookCount) SELECT NEW.Genre_ID, 1
+                        WHERE NEW.Genre_ID IS NOT NULL
+                        ON CONFLICT (Genre_ID) DO UPDATE SET BookCount = BookCount + 1;
+                        INSERT INTO AuthorBookCount (Author_ID, BookCount) SELECT NEW.Author_ID, 1
+                        WHERE NEW.Author_ID IS NOT NULL
+                        ON CONFLICT (Author_ID) DO UPDATE SET BookCount = BookCount + 1;
+                    END''',
+        '''CREATE TRIGGER count_book_delete
+                    AFTER DELETE ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE GenreBookCount SET BookCount = BookCount - 1 WHERE Genre_ID = OLD.Genre_ID;
+                        UPDATE AuthorBookCount SET BookCount = BookCount - 1 WHERE Author_ID = OLD.Author_ID;
+                    END''',
+        '''CREATE TRIGGER count_book_genre_update
+                    AFTER UPDATE OF Genre_ID ON Book
+                    FOR EACH ROW WHEN OLD.Genre_ID IS NOT NEW.Genre_ID
+                    BEGIN
+                        UPDATE GenreBookCount SET BookCount = BookCount - 1 WHERE Genre_ID = OLD.Genre_ID;
+                        INSERT INTO GenreBookCount (Genre_ID, BookCount) SELECT NEW.Genre_ID, 1
+                        WHERE NEW.Genre_ID IS NOT NULL
+                        ON CONFLICT (Genre_ID) DO UPDATE SET BookCount = BookCount + 1;
+                    END''',
+        '''CREATE TRIGGER count_book_author_update
+                    AFTER UPDATE OF Author_ID ON Book
+                    FOR EACH ROW WHEN OLD.Author_ID IS NOT NEW.Author_ID
+                    BEGIN
+                        UPDATE AuthorBookCount SET BookCount = BookCount - 1 WHERE Author_ID = OLD.Author_ID;
+                        INSERT INTO AuthorBookCount (Author_ID, BookCount) SELECT NEW.Author_ID, 1
+                        WHERE NEW.Author_ID IS NOT NULL
+                        ON CONFLICT (Author_ID) DO UPDATE SET BookCount = BookCount + 1;
+                    END''',
+    ],
+    # 3: full-text index over book titles, series, author names and genre names for `find`. The
+    # trigram tokenizer matches any substring of three or more characters; rowid is the Book_ID.
+    [
+        '''CREATE VIRTUAL TABLE BookSearch USING fts5
+                    (Title, Series, Author, Genre, tokenize = 'trigram')''',
+        '''INSERT INTO BookSearch (rowid, Title, Series, Author, Genre)
+                    SELECT Book.Book_ID, Book.Title, Book.Series,
+                           Author.FirstName || ' ' || Author.LastName, Genre.GenreName
+                    FROM Book
+                    LEFT JOIN Author ON Author.Author_ID = Book.Author_ID
+                    LEFT JOIN Genre ON Genre.Genre_ID = Book.Genre_ID''',
+        '''CREATE TRIGGER search_book_insert
+                    AFTER INSERT ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO BookSearch (rowid, Title, Series, Author, Genre)
+                        VALUES (NEW.Book_ID, NEW.Title, NEW.Series,
+                                (SELECT FirstName || ' ' || LastName FROM Author WHERE Author_ID = NEW.Author_ID),
+                                (SELECT GenreName FROM Genre WHERE Genre_ID = NEW.Genre_ID));
+                    END''',
+        '''CREATE TRIGGER search_book_update
+                    AFTER UPDATE OF Title, Series, Author_ID, Genre_ID ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        DELETE FROM BookSearch WHERE rowid = OLD.Book_ID;
+                        INSERT INTO BookSearch (rowid, Title, Series, Author, Genre)
+                        VALUES (NEW.Book_ID, NEW.Title, NEW.Series,
+                                (SELECT FirstName || ' ' || LastName FROM Author WHERE Author_ID = NEW.Author_ID),
+                                (SELECT GenreName FROM Genre WHERE Genre_ID = NEW.Genre_ID));
+                    END''',
+        '''CREATE TRIGGER search_book_delete
+                    AFTER DELETE ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        DELETE FROM BookSearch WHERE rowid = OLD.Book_ID;
+                    END''',
+        '''CREATE TRIGGER search_author_update
+                    AFTER UPDATE OF FirstName, LastName ON Author
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE BookSearch SET Author = NEW.FirstName || ' ' || NEW.LastName
+                        WHERE rowid IN (SELECT Book_ID FROM Book WHERE Author_ID = NEW.Author_ID);
+                    END''',
+        '''CREATE TRIGGER search_genre_update
+                    AFTER UPDATE OF GenreName ON Genre
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE BookSearch SET Genre = NEW.GenreName
+                        WHERE rowid IN (SELECT Book_ID FROM Book WHERE Genre_ID = NEW.Genre_ID);
+                    END''',
+    ],
+    # 4: loan dates become integer days since 1970-01-01, so that they compare as numbers and the
+    # overdue report is a range scan of idx_loan_open_due. SQLite can't change a column's type, so
+    # Loan is rebuilt; values that weren't dates become NULL. Dropping the old table drops its
+    # triggers and indexes, which are created again.
+    [
+        '''CREATE TABLE Loan_new
+                    (Loan_ID INTEGER NOT NULL,
+                    Book_ID INTEGER,
+                    User_ID INTEGER,
+                    LoanDate INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER) / 86400),
+                    DueDate INTEGER, DateReturn INTEGER,
+                    LoanStatus TEXT DEFAULT "Not Return",
+                    FOREIGN KEY(Book_ID) REFERENCES Book(Book_ID),
+                    FOREIGN KEY(User_ID) REFERENCES User(User_ID),
+                    PRIMARY KEY(Loan_ID AUTOINCREMENT)
+                    );''',
+        '''INSERT INTO Loan_new (Loan_ID, Book_ID, User_ID, LoanDate, DueDate, DateReturn, LoanStatus)
+                    SELECT Loan_ID, Book_ID, User_ID,
+                           CASE WHEN typeof(LoanDate) = 'text' THEN CAST(strftime('%s', LoanDate) AS INTEGER) / 86400 END,
+                           CASE WHEN typeof(DueDate) = 'text' THEN CAST(strftime('%s', DueDate) AS INTEGER) / 86400 END,
+                           CASE WHEN typeof(DateReturn) = 'text' THEN CAST(strftime('%s', DateReturn) AS INTEGER) / 86400 END,
+                           LoanStatus
+                    FROM Loan''',
+        'DROP TABLE Loan',
+        'ALTER TABLE Loan_new RENAME TO Loan',
+        '''CREATE TRIGGER update_book_status
+                    AFTER INSERT ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Book
+                        SET LoanStatus = 'Not Available'
+                        WHERE Book_ID = NEW.Book_ID;
+                    END''',
+        '''CREATE TRIGGER update_book_status_return
+                    AFTER UPDATE OF LoanStatus ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE Book
+                        SET LoanStatus = 'Available'
+                        WHERE Book_ID = OLD.Book_ID;
+                    END''',
+        'CREATE INDEX IF NOT EXISTS idx_loan_user_book ON Loan (User_ID, Book_ID)',
+        """CREATE INDEX IF NOT EXISTS idx_loan_open_due ON Loan (LoanStatus, DueDate)
+                    WHERE LoanStatus = 'Not Return'""",
+    ],
+    # 5: loans per status, kept up to date by triggers on Loan so that metrics can read the number of
+    # open loans without counting them.
+    [
+        '''CREATE TABLE LoanStatusCount
+                    (LoanStatus TEXT PRIMARY KEY,
+                    LoanCount INTEGER NOT NULL DEFAULT 0
+                    );''',
+        '''INSERT INTO LoanStatusCount (LoanStatus, LoanCount)
+                    SELECT LoanStatus, COUNT(*) FROM Loan WHERE LoanStatus IS NOT NULL GROUP BY LoanStatus''',
+        '''CREATE TRIGGER count_loan_insert
+                    AFTER INSERT ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO LoanStatusCount (LoanStatus, LoanCount) SELECT NEW.LoanStatus, 1
+                        WHERE NEW.LoanStatus IS NOT NULL
+                        ON CONFLICT (LoanStatus) DO UPDATE SET LoanCount = LoanCount + 1;
+                    END''',
+        '''CREATE TRIGGER count_loan_delete
+                    AFTER DELETE ON Loan
+                    FOR EACH ROW
+                    BEGIN
+                        UPDATE LoanStatusCount SET LoanCount = LoanCount - 1 WHERE LoanStatus = OLD.LoanStatus;
+                    END''',
+        '''CREATE TRIGGER count_loan_status_update
+                    AFTER UPDATE OF LoanStatus ON Loan
+                    FOR EACH ROW WHEN OLD.LoanStatus IS NOT NEW.LoanStatus
+                    BEGIN
+                        UPDATE LoanStatusCount SET LoanCount = LoanCount - 1 WHERE LoanStatus = OLD.LoanStatus;
+                        INSERT INTO LoanStatusCount (LoanStatus, LoanCount) SELECT NEW.LoanStatus, 1
+                        WHERE NEW.LoanStatus IS NOT NULL
+                        ON CONFLICT (LoanStatus) DO UPDATE SET LoanCount = LoanCount + 1;
+                    END''',
+    ],
+    # 6: the open loan of each book, which checkin looks up.
+    [
+        """CREATE INDEX IF NOT EXISTS idx_loan_open_book ON Loan (Book_ID, LoanStatus)
+                    WHERE LoanStatus = 'Not Return'""",
+    ],
+    # 7: a log of renamed and deleted genres, authors, books and users, so that the shell's name
+    # completion can catch up without reloading every name. Only the last 10000 changes are kept.
+    [
+        '''CREATE TABLE NameChange
+                    (Seq INTEGER PRIMARY KEY,
+                    TableName TEXT NOT NULL,
+                    Row_ID INTEGER NOT NULL
+                    );''',
+        '''CREATE TRIGGER name_change_prune
+                    AFTER INSERT ON NameChange
+                    FOR EACH ROW
+                    BEGIN
+                        DELETE FROM NameChange WHERE Seq <= NEW.Seq - 10000;
+                    END''',
+        '''CREATE TRIGGER name_change_genre_update
+                    AFTER UPDATE OF GenreName ON Genre
+                    FOR EACH ROW WHEN OLD.GenreName IS NOT NEW.GenreName
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Genre', NEW.Genre_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_genre_delete
+                    AFTER DELETE ON Genre
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Genre', OLD.Genre_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_author_update
+                    AFTER UPDATE OF FirstName, LastName ON Author
+                    FOR EACH ROW WHEN OLD.FirstName IS NOT NEW.FirstName OR OLD.LastName IS NOT NEW.LastName
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Author', NEW.Author_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_author_delete
+                    AFTER DELETE ON Author
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Author', OLD.Author_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_book_update
+                    AFTER UPDATE OF Title ON Book
+                    FOR EACH ROW WHEN OLD.Title IS NOT NEW.Title
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Book', NEW.Book_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_book_delete
+                    AFTER DELETE ON Book
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('Book', OLD.Book_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_user_update
+                    AFTER UPDATE OF FirstName, LastName ON User
+                    FOR EACH ROW WHEN OLD.FirstName IS NOT NEW.FirstName OR OLD.LastName IS NOT NEW.LastName
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('User', NEW.User_ID);
+                    END''',
+        '''CREATE TRIGGER name_change_user_delete
+                    AFTER DELETE ON User
+                    FOR EACH ROW
+                    BEGIN
+                        INSERT INTO NameChange (TableName, Row_ID) VALUES ('User', OLD.User_ID);
+                    END''',
+    ],
+    # 8: loans still out in Loan_ID order, so that a page of check-user-with-loan reads only its own rows.
+    [
+        """CREATE INDEX IF NOT EXISTS idx_loan_open_id ON Loan (LoanStatus, Loan_ID)
+                    WHERE LoanStatus = 'Not Return'""",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+# The key and the columns that updates may set, per table.
+TABLE_KEYS = {"Genre": "Genre_ID", "Author": "Author_ID", "Book": "Book_ID", "User": "User_ID", "Loan": "Loan_ID"}
+UPDATABLE = {
+    "Genre": ("GenreName",),
+    "Author": ("FirstName", "LastName", "Birthday"),
+    "Book": ("Title", "Genre_ID", "Series", "Author_ID", "LoanStatus"),
+    "User": ("FirstName", "LastName", "Address", "Email", "PhoneNumber"),
+    "Loan": ("Book_ID", "User_ID", "LoanDate", "DueDate", "DateReturn", "LoanStatus"),
+}
+
+
+def is_busy(error: sqlite3.OperationalError) -> bool:
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+class BooksUnavailable(Exception):
+    """Raised inside a checkout transaction to roll it back when some of the books are already out."""
+
+    def __init__(self, book_ids: List[int]):
+        super().__init__(book_ids)
+        self.book_ids = book_ids
+
+
+class SnapshotRestarting(Exception):
+    """Raised from the backup progress callback to give up on a paced copy that keeps restarting."""
+
+
+class Page:
+    """Rows of one keyset page, keyed on their first column.
+
+    Once the rows have been consumed, `next_after` is the cursor token to pass as
+    `after` for the following page, or None when this was the last page.
+    """
+
+    def __init__(self, rows: Iterator[tuple], limit: int = -1):
+        self._rows = rows
+        self._limit = limit
+        self.count = 0
+        self.last_key = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        row = next(self._rows)
+        self.count += 1
+        self.last_key = row[0]
+        return row
+
+    @property
+    def next_after(self):
+        if self._limit > 0 and self.count == self._limit:
+            return self.last_key
+        return None
+
+
+@instrument_methods
 class DatabaseHandler:
     my_library = 'library.db'
 
-    def __init__(self):
+    def __init__(self, concurrent: bool = False, path: Optional[str] = None, read_only: bool = False,
+                 write_queue: Optional["WriteQueue"] = None, immutable: bool = True):
+        """Open the database at `path`, or `my_library` when no path is given.
+
+        With `concurrent`, the database is switched to WAL journaling: reads borrow a
+        read-only connection from a pool that keeps up to READER_POOL of them open, and
+        writes go through the single write connection, serialized by a lock and retried
+        with backoff while it's busy.
+
+        With `read_only`, the file is opened as an immutable snapshot: SQLite takes no
+        locks at all, so the file must not change while it is open. Without `immutable`,
+        it is opened read-only but with the usual shared locks, so that other processes
+        can go on writing to it; the schema is then checked but never migrated.
+
+        With a `write_queue`, single adds and updates are committed in batches by its writer
+        thread, together with those of every other handler sharing the queue.
+        """
+        self.path = path or self.my_library
+        self._write_queue = write_queue
+        self.read_only = read_only
+        self.immutable = read_only and immutable
+        self._concurrent = concurrent and not read_only
+        self._readers = queue.LifoQueue(READER_POOL)
+        self._write_lock = threading.Lock()
         try:
-            self._conn = sqlite3.connect(self.my_library)
+            if self.immutable:
+                self._conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True,
+                                             factory=connection_factory())
+            elif read_only:
+                self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT,
+                                             factory=connection_factory())
+            elif concurrent:
+                self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                             factory=connection_factory())
+                self._conn.execute('PRAGMA journal_mode = WAL')
+                self._conn.execute('PRAGMA synchronous = NORMAL')
+            else:
+                # One thread at a time, but not always the same one: the metrics gauges share a
+                # handler between the request threads of the metrics server, behind a lock.
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, factory=connection_factory())
         except sqlite3.Error as e:
-            typer.secho(f"Error while creating database: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while creating database: {e}") from e
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Lend a connection for reads: the write connection, or in concurrent mode one from the pool."""
+        if not self._concurrent:
+            yield self._conn
+            return
+        conn = self._borrow()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _borrow(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            # Connections are handed from thread to thread, but only ever used by one at a time.
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False, factory=connection_factory())
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn is self._conn:
+            return
+        try:
+            self._readers.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _write(self, *statements: tuple):
+        """Run (query, params) statements in one transaction, retrying with backoff while the database is busy."""
+        if self._write_queue is not None:
+            self._write_queue.submit(statements).result()
+            return
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                waiting = time.perf_counter()
+                with self._write_lock:
+                    STATS.record_lock_wait(time.perf_counter() - waiting)
+                    with self._conn:
+                        for query, params in statements:
+                            self._conn.execute(query, params)
+                return
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt == BUSY_RETRIES:
+                    raise
+                STATS.record_lock_wait(delay, retried=True)
+                time.sleep(delay)
+                delay *= 2
+
+    def _immediate(self, work):
+        """Run work(conn) in a BEGIN IMMEDIATE transaction and return its result, retrying while busy.
+
+        The write lock is taken before anything is read, so nothing `work` reads can change
+        before it writes. The transaction is rolled back if `work` raises.
+        """
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                waiting = time.perf_counter()
+                with self._write_lock:
+                    STATS.record_lock_wait(time.perf_counter() - waiting)
+                    self._conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        result = work(self._conn)
+                        self._conn.commit()
+                    except BaseException:
+                        self._conn.rollback()
+                        raise
+                    return result
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt == BUSY_RETRIES:
+                    raise
+                STATS.record_lock_wait(delay, retried=True)
+                time.sleep(delay)
+                delay *= 2
 
     def init_table(self):
+        """Bring the schema up to SCHEMA_VERSION; a current database costs a single PRAGMA read."""
+        try:
+            version = self.schema_version()
+            if version == SCHEMA_VERSION:
+                return
+            if version > SCHEMA_VERSION:
+                raise LibraryError(f"Error while creating tables: the database is at schema version {version}, "
+                                   f"newer than this program's {SCHEMA_VERSION}.")
+            if self.read_only:
+                raise LibraryError(f"Error while creating tables: {self.path} is at schema version {version}, "
+                                   f"this program needs {SCHEMA_VERSION}. "
+                                   + ("Please take a new snapshot." if self.immutable else
+                                      "Please open it with this program once to upgrade it."))
+            self.migrate()
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while creating tables: {e}") from e
+
+    def schema_version(self) -> int:
+        with self._write_lock:
+            return self._conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self):
+        """Apply the pending migrations in order, each in its own transaction."""
+        for version in range(1, SCHEMA_VERSION + 1):
+            # BEGIN IMMEDIATE takes the write lock before re-reading the version, so two
+            # processes opening an old database at the same time don't both migrate it.
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self.schema_version() < version:
+                    for statement in MIGRATIONS[version - 1]:
+                        self._conn.execute(statement)
+                    self._conn.execute(f'PRAGMA user_version = {version}')
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def snapshot(self, target_path: str, pages: int = SNAPSHOT_PAGES, sleep: float = SNAPSHOT_SLEEP,
+                 progress=None):
+        """Copy the database to `target_path` with the backup API, `pages` pages per step.
+
+        The copy is built next to the target and moved into place once complete, so
+        `target_path` is always either the previous snapshot or a consistent new one.
+        """
+        partial = target_path + ".partial"
+        restarts = 0
+        remaining_before = None
+
+        def step(status, remaining, total):
+            nonlocal restarts, remaining_before
+            if remaining_before is not None and remaining > remaining_before:
+                restarts += 1
+                if restarts > SNAPSHOT_RESTARTS:
+                    raise SnapshotRestarting()
+            remaining_before = remaining
+            if progress:
+                progress(status, remaining, total)
+
         try:
-            """Initialize tables."""
-            with self._conn:
-                self._conn.execute('''CREATE TABLE IF NOT EXISTS Genre
-                                (Genre_ID INTEGER NOT NULL,
-                                 GenreName TEXT UNIQUE,
-                                 PRIMARY KEY(Genre_ID AUTOINCREMENT)
-                                 );''')
-                self._conn.execute('''CREATE TABLE IF NOT EXISTS Author
-                                (Author_ID	INTEGER NOT NULL,
-                                FirstName	TEXT,
-                                LastName	TEXT,
-                                Birthday	TEXT,
-                                PRIMARY KEY(Author_ID AUTOINCREMENT)
-                                );''')
-                self._conn.execute('''CREATE TABLE IF NOT EXISTS Book
-                                (Book_ID INTEGER NOT NULL,
-                                Title TEXT UNIQUE,
-                                Genre_ID INTEGER,
-                                Series TEXT,
-                                Author_ID INTEGER,
-                                LoanStatus TEXT DEFAULT 'Available',
-                                FOREIGN KEY(Author_ID) REFERENCES Author(Author_ID)
-                                FOREIGN KEY(Genre_ID) REFERENCES Genre(Genre_ID),
-                                PRIMARY KEY(Book_ID AUTOINCREMENT)
-                                );''')
-                self._conn.execute('''CREATE TABLE IF NOT EXISTS User
-                                (User_ID INTEGER NOT NULL,
-                                FirstName TEXT,
-                                LastName TEXT,
-                                Address TEXT,
-                                Email TEXT UNIQUE,
-                                PhoneNumber TEXT UNIQUE,
-                                PRIMARY KEY(User_ID AUTOINCREMENT)
-                                );''')
-                self._conn.execute('''CREATE TABLE IF NOT EXISTS Loan
-                                (Loan_ID INTEGER NOT NULL,
-                                Book_ID INTEGER,
-                                User_ID INTEGER,
-                                LoanDate TEXT DEFAULT CURRENT_DATE,
-                                DueDate INTEGER, DateReturn INTEGER,
-                                LoanStatus TEXT DEFAULT "Not Return",
-                                FOREIGN KEY(Book_ID) REFERENCES Book(Book_ID),
-                                FOREIGN KEY(User_ID) REFERENCES User(User_ID),
-                                PRIMARY KEY(Loan_ID AUTOINCREMENT)
-                                );''')
-                self._conn.execute('''CREATE TRIGGER IF NOT EXISTS update_book_status
-                                AFTER INSERT ON Loan
-                                FOR EACH ROW
-                                BEGIN
-                                    UPDATE Book
-                                    SET LoanStatus = 'Not Available'
-                                    WHERE Book_ID = NEW.Book_ID;
-                                END''')
-                self._conn.execute('''CREATE TRIGGER IF NOT EXISTS update_book_status_return
-                                AFTER UPDATE OF LoanStatus ON Loan
-                                FOR EACH ROW
-                                BEGIN
-                                    UPDATE Book
-                                    SET LoanStatus = 'Available'
-                                    WHERE Book_ID = OLD.Book_ID;
-                                END''')
-        except sqlite3.Error as e:
-            typer.secho(f"Error while creating tables: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            source = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+            target = sqlite3.connect(partial)
+            try:
+                if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+                    # In WAL mode an open read transaction pins one version of the database for the
+                    # whole copy without blocking writers, so the paced copy never restarts.
+                    source.execute('BEGIN')
+                    source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                try:
+                    source.backup(target, pages=pages, progress=step, sleep=sleep)
+                except SnapshotRestarting:
+                    # Otherwise every commit between two steps restarts the copy. Once that keeps
+                    # happening, copy in one step, which blocks writers only while it runs.
+                    source.backup(target, progress=progress)
+                # A snapshot is opened immutable, which needs a rollback journal rather than WAL.
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+            os.replace(partial, target_path)
+        except (sqlite3.Error, OSError) as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise LibraryError(f"Error while taking snapshot: {e}") from e
 
     def rollback(self):
+        """Roll back the write connection's open transaction, such as a bulk import's."""
         try:
-            with self._conn:
+            with self._write_lock, self._conn:
                 self._conn.rollback()
         except sqlite3.Error as e:
-            typer.secho(f"Error: {e}.", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error: {e}.") from e
+
+    def _stream(self, query: str, params: tuple = (), limit: int = -1):
+        """Run a query and return [Page, column names]; rows are fetched in batches as they're consumed."""
+        conn = self._borrow() if self._concurrent else self._conn
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            column_names = [description[0] for description in cursor.description]
+        except sqlite3.Error as e:
+            self._release(conn)
+            raise LibraryError(f"Error while invoking information: {e}") from e
+        batches = self._fetch_batches(conn, cursor)
+        # Started here, so that closing a page that is never read still returns its connection.
+        next(batches)
+        return [Page(batches, limit), column_names]
+
+    def _fetch_batches(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        """Yield the cursor's rows, after a first None; the connection goes back to the pool when they end."""
+        try:
+            yield None
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
+        finally:
+            cursor.close()
+            self._release(conn)
 
     def add_genre(self, genre_name: str):
         try:
-            with self._conn:
-                self._conn.execute('INSERT INTO Genre (GenreName) VALUES (?)',
-                                   (genre_name,))
-                self._conn.commit()
+            self._write(('INSERT INTO Genre (GenreName) VALUES (?)',
+                         (genre_name,)))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_author(self, first_name: str, last_name: str, birth: str):
         try:
-            with self._conn:
-                self._conn.execute('INSERT INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)',
-                                   (first_name, last_name, birth,))
-                self._conn.commit()
+            self._write(('INSERT INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)',
+                         (first_name, last_name, birth,)))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_book(self, book_title: str, genre_id: int, series: str, author_id: int):
         try:
-            with self._conn:
-                self._conn.execute('INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
-                                   (book_title, genre_id, series, author_id,))
-                self._conn.commit()
+            self._write(('INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
+                         (book_title, genre_id, series, author_id,)))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_user(self, first_name: str, last_name: str, address: str, email: str, phone_num: str):
         try:
-            with self._conn:
-                self._conn.execute(
-                    'INSERT INTO User (FirstName, LastName, Address, Email, PhoneNumber) VALUES (?,?,?,?,?)',
-                    (first_name, last_name, address, email, phone_num,)
-                )
-                self._conn.commit()
+            self._write(('INSERT INTO User (FirstName, LastName, Address, Email, PhoneNumber) VALUES (?,?,?,?,?)',
+                         (first_name, last_name, address, email, phone_num,)))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_loan(self, book_id: int, user_id: int, loan_day: str, due_day: str):
         try:
-            with self._conn:
-                query = 'INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate) VALUES (?,?,?,?)'
-                params = (book_id, user_id, loan_day, due_day)
-                self._conn.execute(query, params)
-                self._conn.commit()
+            self._write(('INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate) VALUES (?,?,?,?)',
+                         (book_id, user_id, loan_day, due_day)))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
-    def update_genre(self, genre_id: int, new_genre: str):
+    def commit(self):
         try:
-            with self._conn:
-                self._conn.execute('''UPDATE Genre SET GenreName = ? WHERE Genre_ID = ?''', (new_genre, genre_id))
-                self._conn.commit()
+            self._conn.commit()
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
-
-    def update_author(self, author_id: int, new_firstname: str, new_lastname: str, new_birthday: str):
-        try:
-            with self._conn:
-                if new_firstname != "null":
-                    self._conn.execute('''UPDATE Author SET FirstName = ? WHERE Author_ID = ?''',
-                                       (new_firstname, author_id))
-                if new_lastname != "null":
-                    self._conn.execute('''UPDATE Author SET LastName = ? WHERE Author_ID = ?''',
-                                       (new_lastname, author_id))
-                if new_birthday != "null":
-                    self._conn.execute('''UPDATE Author SET Birthday = ? WHERE Author_ID = ?''',
-                                       (new_birthday, author_id))
-                self._conn.commit()
+            raise LibraryError(f"Error while committing information: {e}") from e
+
+    def _bulk_insert(self, query: str, rows: List[tuple]) -> int:
+        """Insert rows with one executemany call; the caller decides when to commit."""
+        try:
+            cursor = self._conn.executemany(query, rows)
+            return cursor.rowcount
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
-
-    def update_book(self, book_id: int, new_title: str, new_genre_id: int, new_series: str, new_author_id: int,
-                    new_status: str):
-        try:
-            with self._conn:
-                if new_title != "null":
-                    self._conn.execute('''UPDATE Book SET Title = ? WHERE Book_ID = ?''',
-                                       (new_title, book_id))
-                if new_genre_id != 0:
-                    self._conn.execute('''UPDATE Book SET Genre_ID = ? WHERE Book_ID = ?''',
-                                       (new_genre_id, book_id))
-                if new_series != "null":
-                    self._conn.execute('''UPDATE Book SET Series = ? WHERE Book_ID = ?''',
-                                       (new_series, book_id))
-                if new_author_id != 0:
-                    self._conn.execute('''UPDATE Book SET Author_ID = ? WHERE Book_ID = ?''',
-                                       (new_author_id, book_id))
-                if new_status != "null":
-                    self._conn.execute('''UPDATE Book SET LoanStatus = ? WHERE Book_ID = ?''',
-                                       (new_status, book_id))
-                self._conn.commit()
+            raise LibraryError(f"Error while adding information: {e}") from e
+
+    def bulk_add_genre(self, rows: List[tuple]) -> int:
+        return self._bulk_insert('INSERT OR IGNORE INTO Genre (GenreName) VALUES (?)', rows)
+
+    def bulk_add_author(self, rows: List[tuple]) -> int:
+        return self._bulk_insert('INSERT OR IGNORE INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)', rows)
+
+    def bulk_add_book(self, rows: List[tuple]) -> int:
+        return self._bulk_insert('INSERT OR IGNORE INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
+                                 rows)
+
+    def bulk_add_user(self, rows: List[tuple]) -> int:
+        return self._bulk_insert(
+            'INSERT OR IGNORE INTO User (FirstName, LastName, Address, Email, PhoneNumber) VALUES (?,?,?,?,?)', rows)
+
+    def bulk_add_loan(self, rows: List[tuple]) -> int:
+        return self._bulk_insert('INSERT OR IGNORE INTO Loan (Book_ID, User_ID, LoanDate, DueDate) VALUES (?,?,?,?)',
+                                 rows)
+
+    def checkout(self, book_ids: List[int], user_id: int, loan_day: int, due_day: int) -> List[int]:
+        """Lend every book in `book_ids` to `user_id` in one transaction, or none of them.
+
+        Books are claimed with a conditional update that only matches them while they're
+        Available, so two desks can't lend the same copy. If any book can't be claimed,
+        nothing is written and BooksUnavailable lists the ones already out.
+        """
+
+        def work(conn: sqlite3.Connection) -> List[int]:
+            claimed = conn.execute(f'''UPDATE Book SET LoanStatus = 'Not Available'
+                                       WHERE Book_ID IN ({",".join("?" * len(book_ids))})
+                                       AND LoanStatus = 'Available'
+                                       RETURNING Book_ID''', book_ids).fetchall()
+            claimed = sorted(row[0] for row in claimed)
+            if len(claimed) < len(set(book_ids)):
+                raise BooksUnavailable([book_id for book_id in book_ids if book_id not in claimed])
+            conn.executemany('INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate) VALUES (?,?,?,?)',
+                             [(book_id, user_id, loan_day, due_day) for book_id in claimed])
+            return claimed
+
+        if not book_ids:
+            return []
+        try:
+            return self._immediate(work)
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
-
-    def update_user(self, user_id: int, new_firstname: str, new_lastname: str, new_address: str, new_email: str,
-                    new_phone: str):
-        try:
-            with self._conn:
-                if new_firstname != "null":
-                    self._conn.execute('''UPDATE User SET FirstName = ? WHERE User_ID = ?''',
-                                       (new_firstname, user_id))
-                if new_lastname != "null":
-                    self._conn.execute('''UPDATE User SET LastName = ? WHERE User_ID = ?''',
-                                       (new_lastname, user_id))
-                if new_address != "null":
-                    self._conn.execute('''UPDATE User SET Address = ? WHERE User_ID = ?''',
-                                       (new_address, user_id))
-                if new_email != "null":
-                    self._conn.execute('''UPDATE User SET Email = ? WHERE User_ID = ?''',
-                                       (new_email, user_id))
-                if new_phone != "null":
-                    self._conn.execute('''UPDATE User SET PhoneNumber = ? WHERE User_ID = ?''',
-                                       (new_phone, user_id))
-                self._conn.commit()
+            raise LibraryError(f"Error while adding information: {e}") from e
+
+    def checkin(self, book_ids: List[int], return_day: int, user_id: int = 0) -> List[int]:
+        """Close the open loans of `book_ids` in one transaction and return the books that were out.
+
+        Books that aren't out, or with `user_id` set aren't out to that user, are skipped.
+        """
+
+        def work(conn: sqlite3.Connection) -> List[int]:
+            query = f'''SELECT Book_ID FROM Loan
+                        WHERE LoanStatus = 'Not Return' AND Book_ID IN ({",".join("?" * len(book_ids))})'''
+            params = list(book_ids)
+            if user_id:
+                query += ' AND User_ID = ?'
+                params.append(user_id)
+            returned = sorted({row[0] for row in conn.execute(query, params)})
+            conn.executemany('''UPDATE Loan SET DateReturn = ?, LoanStatus = 'Returned'
+                                WHERE LoanStatus = 'Not Return' AND Book_ID = ?''',
+                             [(return_day, book_id) for book_id in returned])
+            return returned
+
+        if not book_ids:
+            return []
+        try:
+            return self._immediate(work)
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
-
-    def update_loan(self, loan_id: int, new_book_id: int, new_user_id: int, new_loandate: str, new_duedate: str,
-                    new_returndate: str, new_loanstatus: str):
-        try:
-            with self._conn:
-                if new_book_id != 0:
-                    self._conn.execute('''UPDATE Loan SET Book_ID = ? WHERE Loan_ID = ?''',
-                                       (new_book_id, loan_id))
-                if new_user_id != 0:
-                    self._conn.execute('''UPDATE Loan SET User_ID = ? WHERE Loan_ID = ?''',
-                                       (new_user_id, loan_id))
-                if new_loandate != "null":
-                    self._conn.execute('''UPDATE Loan SET LoanDate = ? WHERE Loan_ID = ?''',
-                                       (new_loandate, loan_id))
-                if new_duedate != "null":
-                    self._conn.execute('''UPDATE Loan SET DueDate = ? WHERE Loan_ID = ?''',
-                                       (new_duedate, loan_id))
-                if new_returndate != "null":
-                    self._conn.execute('''UPDATE Loan SET DateReturn = ? WHERE Loan_ID = ?''',
-                                       (new_returndate, loan_id))
-                if new_loanstatus != "null":
-                    self._conn.execute('''UPDATE Loan SET LoanStatus = ? WHERE Loan_ID = ?''',
-                                       (new_loanstatus, loan_id))
-                self._conn.commit()
+            raise LibraryError(f"Error while updating information: {e}") from e
+
+    @staticmethod
+    def _update_query(table: str, columns: tuple, on_conflict: str = "") -> str:
+        # Column names are interpolated, so only known ones get through.
+        unknown = [column for column in columns if column not in UPDATABLE[table]]
+        if unknown:
+            raise ValueError(f"{table} has no updatable column {', '.join(unknown)}")
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        return f'UPDATE {on_conflict}{table} SET {assignments} WHERE {TABLE_KEYS[table]} = ?'
+
+    def update_fields(self, table: str, row_id: int, fields: dict):
+        """Set only the columns in `fields` on one row, in a single UPDATE."""
+        if not fields:
+            return
+        columns = tuple(column for column in UPDATABLE[table] if column in fields)
+        try:
+            self._write((self._update_query(table, columns), [fields[column] for column in columns] + [row_id]))
         except sqlite3.Error as e:
-            self.rollback()
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while updating information: {e}") from e
+
+    def bulk_update(self, table: str, patches: List[tuple]) -> int:
+        """Apply (row id, {column: value}) patches, one executemany per set of columns; the caller commits.
+
+        Patches for rows that don't exist or that would break a constraint are skipped, so the
+        number returned can be lower than the number of patches.
+        """
+        groups = {}
+        for row_id, fields in patches:
+            columns = tuple(column for column in UPDATABLE[table] if column in fields)
+            if columns:
+                groups.setdefault(columns, []).append([fields[column] for column in columns] + [row_id])
+        try:
+            updated = 0
+            for columns, rows in groups.items():
+                updated += self._conn.executemany(self._update_query(table, columns, "OR IGNORE "), rows).rowcount
+            return updated
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while updating information: {e}") from e
 
     def info_genre(self, genre_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT * FROM Genre WHERE Genre_ID = ?''', (genre_id,))
                 genre = cursor.fetchall()
                 return genre
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_author(self, author_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT * FROM Author WHERE Author_ID = ?''', (author_id,))
                 author = cursor.fetchall()
                 return author
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_book(self, book_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT Book_ID, Title, Series, FirstName, LastName, GenreName
                                 FROM Book
                                 INNER JOIN Author ON Book.Author_ID = Author.Author_ID
@@ -293,26 +887,25 @@ class DatabaseHandler:
                 column_names = [description[0] for description in cursor.description]
                 return [book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_user(self, user_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT * FROM User WHERE User_ID = ?''', (user_id,))
                 user = cursor.fetchall()
                 return user
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_loan(self, loan_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''
-                                SELECT Loan_ID, LoanDate, DueDate, Title, FirstName, LastName
+                                SELECT Loan_ID, date(LoanDate * 86400, 'unixepoch') AS LoanDate,
+                                date(DueDate * 86400, 'unixepoch') AS DueDate, Title, FirstName, LastName
                                 FROM Loan
                                 INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
                                 INNER JOIN User ON Loan.User_ID = User.User_ID
@@ -321,396 +914,444 @@ class DatabaseHandler:
                 column_names = [description[0] for description in cursor.description]
                 return [all_loan, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_genre(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('SELECT * FROM Genre')
-                all_genre = cursor.fetchall()
-                return all_genre
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def list_all_genre(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT * FROM Genre
+                            WHERE Genre_ID > ?
+                            ORDER BY Genre_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def list_all_author(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('SELECT * FROM Author')
-                all_author = cursor.fetchall()
-                return all_author
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def list_all_author(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT * FROM Author
+                            WHERE Author_ID > ?
+                            ORDER BY Author_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def list_all_book(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''
-                                SELECT Book_ID, Title, Series, FirstName, LastName, GenreName
-                                FROM Book
-                                INNER JOIN Author ON Book.Author_ID = Author.Author_ID
-                                INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
-                                ''')
-                all_book = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [all_book, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def list_all_book(self, after: int = 0, limit: int = -1):
+        return self._stream('''
+                            SELECT Book_ID, Title, Series, FirstName, LastName, GenreName
+                            FROM Book
+                            INNER JOIN Author ON Book.Author_ID = Author.Author_ID
+                            INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
+                            WHERE Book.Book_ID > ?
+                            ORDER BY Book.Book_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def list_all_user(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('SELECT * FROM User')
-                all_user = cursor.fetchall()
-                return all_user
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def list_all_user(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT * FROM User
+                            WHERE User_ID > ?
+                            ORDER BY User_ID LIMIT ?''',
+                            (after, limit), limit)
+
+    def list_all_loan(self, after: int = 0, limit: int = -1):
+        return self._stream('''
+                            SELECT Loan_ID, date(LoanDate * 86400, 'unixepoch') AS LoanDate,
+                            date(DueDate * 86400, 'unixepoch') AS DueDate, Title, FirstName, LastName
+                            FROM Loan
+                            INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
+                            INNER JOIN User ON Loan.User_ID = User.User_ID
+                            WHERE Loan.Loan_ID > ?
+                            ORDER BY Loan.Loan_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def list_all_loan(self):
+    def export_table(self, table: str, since: int = 0):
+        # `table` comes from EXPORT_TABLES, never from user input.
+        return self._stream(f'''SELECT * FROM {table}
+                            WHERE rowid > ?
+                            ORDER BY rowid''',
+                            (since,))
+
+    def _top(self, counts: str, key: str, table: str, columns: str, n: int) -> list:
+        """List the n rows of `table` with the most books, plus any tied with the n-th, ranked."""
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''
-                                SELECT Loan_ID, LoanDate, DueDate, Title, FirstName, LastName
-                                FROM Loan
-                                INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
-                                INNER JOIN User ON Loan.User_ID = User.User_ID
-                                ''')
-                all_loan = cursor.fetchall()
+            with self._reader() as conn:
+                cursor = conn.execute(f'''
+                    SELECT RANK() OVER (ORDER BY Counts.BookCount DESC) AS Rank, {columns}, Counts.BookCount
+                    FROM {counts} AS Counts
+                    INNER JOIN {table} ON {table}.{key} = Counts.{key}
+                    WHERE Counts.BookCount >= COALESCE((SELECT BookCount FROM {counts} WHERE BookCount > 0
+                                                        ORDER BY BookCount DESC LIMIT 1 OFFSET ?), 1)
+                    ORDER BY Counts.BookCount DESC, Counts.{key}''', (n - 1,))
                 column_names = [description[0] for description in cursor.description]
-                return [all_loan, column_names]
+                return [cursor.fetchall(), column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def get_top_genres(self, n: int):
+        return self._top('GenreBookCount', 'Genre_ID', 'Genre', 'Genre.Genre_ID, GenreName', n)
+
+    def get_top_authors(self, n: int):
+        return self._top('AuthorBookCount', 'Author_ID', 'Author', 'Author.Author_ID, FirstName, LastName', n)
 
     def get_genre_with_book(self):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                query = """
-                            SELECT Genre.GenreName, COUNT(Book.Book_ID) AS BookCount
-                            FROM Book
-                            INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
-                            GROUP BY Genre.GenreName
-                            ORDER BY BookCount DESC
-                            LIMIT 1
-                        """
-                cursor.execute(query)
-                genre_max = cursor.fetchall()
-                query = """
+            top, _ = self.get_top_genres(1)
+            genre_max = [(genre_name, book_count) for _, _, genre_name, book_count in top]
+            with self._reader() as conn:
+                cursor = conn.cursor()
+                query = f"""
                             SELECT Genre.Genre_ID, GenreName, Title
                             FROM Genre
                             INNER JOIN Book ON Genre.Genre_ID = Book.Genre_ID
-                            WHERE GenreName = ?
+                            WHERE Genre.Genre_ID IN ({", ".join("?" * len(top))})
+                            ORDER BY Genre.Genre_ID, Book.Book_ID
                         """
-                cursor.execute(query, (genre_max[0][0],))
-                author_with_book = cursor.fetchall()
+                cursor.execute(query, [row[1] for row in top])
+                genre_with_book = cursor.fetchall()
                 column_names = [description[0] for description in cursor.description]
-                return [genre_max, author_with_book, column_names]
+                return [genre_max, genre_with_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def get_author_with_book(self):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                query = """
-                            SELECT Author.FirstName, Author.LastName, COUNT(Book.Book_ID) AS BookCount
-                            FROM Book
-                            INNER JOIN Author ON Book.Author_ID = Author.Author_ID
-                            GROUP BY Author.Author_ID, Author.FirstName, Author.LastName
-                            ORDER BY BookCount DESC
-                            LIMIT 1
-                        """
-                cursor.execute(query)
-                author_max = cursor.fetchall()
-                query = """
+            top, _ = self.get_top_authors(1)
+            author_max = [(first_name, last_name, book_count) for _, _, first_name, last_name, book_count in top]
+            with self._reader() as conn:
+                cursor = conn.cursor()
+                query = f"""
                             SELECT Author.Author_ID, FirstName, LastName, Title
                             FROM Author
                             INNER JOIN Book ON Author.Author_ID = Book.Author_ID
-                            WHERE Author.FirstName = ? AND Author.LastName = ?
-
+                            WHERE Author.Author_ID IN ({", ".join("?" * len(top))})
+                            ORDER BY Author.Author_ID, Book.Book_ID
                         """
-                cursor.execute(query, (author_max[0][0], author_max[0][1],))
+                cursor.execute(query, [row[1] for row in top])
                 author_with_book = cursor.fetchall()
                 column_names = [description[0] for description in cursor.description]
                 return [author_max, author_with_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def get_series_book(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book_ID, Title, Series
-                                FROM Book
-                                WHERE Series IS NOT NULL''')
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_series_book(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book_ID, Title, Series
+                            FROM Book
+                            WHERE Series IS NOT NULL
+                            AND Book_ID > ?
+                            ORDER BY Book_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def get_non_series_book(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book_ID, Title, Series
-                                FROM Book
-                                WHERE Series IS NULL''')
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_non_series_book(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book_ID, Title, Series
+                            FROM Book
+                            WHERE Series IS NULL
+                            AND Book_ID > ?
+                            ORDER BY Book_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def get_available_book(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book_ID, Title
-                                FROM Book
-                                WHERE Book.LoanStatus = "Available"''')
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_available_book(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book_ID, Title
+                            FROM Book
+                            WHERE Book.LoanStatus = "Available"
+                            AND Book_ID > ?
+                            ORDER BY Book_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def get_non_available_book(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book_ID, Title
-                                FROM Book
-                                WHERE Book.LoanStatus = "Not Available"''')
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_non_available_book(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book_ID, Title
+                            FROM Book
+                            WHERE Book.LoanStatus = "Not Available"
+                            AND Book_ID > ?
+                            ORDER BY Book_ID LIMIT ?''',
+                            (after, limit), limit)
 
     def check_if_available(self, book_title):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT LoanStatus FROM Book WHERE Title = ?', (book_title,))
                 status = cursor.fetchone()
                 return status
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def get_user_with_loan(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Loan.Loan_ID, User.FirstName, LastName, Book.Title FROM Loan
-                                INNER JOIN User ON Loan.User_ID = User.User_ID
-                                INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
-                                WHERE Loan.LoanStatus = "Not Return" ''')
-                user_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [user_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_user_with_loan(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Loan.Loan_ID, User.FirstName, LastName, Book.Title FROM Loan
+                            INNER JOIN User ON Loan.User_ID = User.User_ID
+                            INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
+                            WHERE Loan.LoanStatus = "Not Return"
+                            AND Loan.Loan_ID > ?
+                            ORDER BY Loan.Loan_ID LIMIT ?''',
+                            (after, limit), limit)
 
-    def get_returned_loan(self):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Loan_ID, FirstName, LastName, Title, DateReturn, DueDate FROM Loan
-                                INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
-                                INNER JOIN User ON Loan.User_ID = User.User_ID
-                                WHERE Loan.LoanStatus = "Returned"''')
-                user_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [user_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def get_returned_loan(self, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Loan_ID, FirstName, LastName, Title,
+                            date(DateReturn * 86400, 'unixepoch') AS DateReturn,
+                            date(DueDate * 86400, 'unixepoch') AS DueDate FROM Loan
+                            INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
+                            INNER JOIN User ON Loan.User_ID = User.User_ID
+                            WHERE Loan.LoanStatus = "Returned"
+                            AND Loan.Loan_ID > ?
+                            ORDER BY Loan.Loan_ID LIMIT ?''',
+                            (after, limit), limit)
+
+    def get_overdue_loan(self, as_of: int, window: int = 0, after: int = 0, limit: int = -1):
+        """Loans still out whose due day is before `as_of`, or only the last `window` days of them.
 
-    def get_overdue_loan(self):
+        Rows come in idx_loan_open_due order, (DueDate, Loan_ID). The cursor is still the last
+        Loan_ID; the page after it starts from that loan's due day.
+        """
+        # Both bounds are on idx_loan_open_due, so only loans due inside the window are read.
+        earliest = as_of - window if window > 0 else None
+        return self._stream('''SELECT Loan.Loan_ID, User.FirstName, User.LastName, Book.Title,
+                            date(Loan.LoanDate * 86400, 'unixepoch') AS LoanDate,
+                            date(Loan.DueDate * 86400, 'unixepoch') AS DueDate,
+                            ? - Loan.DueDate AS DaysOverdue
+                            FROM Loan
+                            INNER JOIN User ON Loan.User_ID = User.User_ID
+                            INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
+                            WHERE Loan.LoanStatus = 'Not Return'
+                            AND Loan.DueDate < ? AND Loan.DueDate >= coalesce(?, -1)
+                            AND (Loan.DueDate, Loan.Loan_ID) >
+                                (coalesce((SELECT DueDate FROM Loan WHERE Loan_ID = ?), -1), ?)
+                            ORDER BY Loan.DueDate, Loan.Loan_ID LIMIT ?''',
+                            (as_of, as_of, earliest, after, after, limit), limit)
+
+    def get_loan_counts(self, as_of: int) -> tuple:
+        """Return (loans still out, loans overdue as of `as_of`).
+
+        The first comes from the LoanStatusCount rollup; the second counts the overdue range
+        of idx_loan_open_due, so neither reads the Loan table itself.
+        """
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Loan.Loan_ID, User.FirstName, User.LastName, Book.Title, Loan.LoanDate,
-                                Loan.DueDate, Loan.LoanStatus
-                                FROM Loan
-                                INNER JOIN User ON Loan.User_ID = User.User_ID
-                                INNER JOIN Book ON Loan.Book_ID = Book.Book_ID
-                                WHERE Loan.LoanStatus = "Not Return" AND Loan.DueDate < CURRENT_DATE''')
-                loan_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [loan_list, column_names]
+            with self._reader() as conn:
+                row = conn.execute("SELECT LoanCount FROM LoanStatusCount WHERE LoanStatus = 'Not Return'").fetchone()
+                overdue = conn.execute("SELECT COUNT(*) FROM Loan WHERE LoanStatus = 'Not Return' AND DueDate < ?",
+                                       (as_of,)).fetchone()[0]
+            return (row[0] if row else 0), overdue
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_genre(self, genre_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT GenreName FROM Genre WHERE GenreName = ?''', (genre_name,))
                 if_exist = cursor.fetchone()
                 return if_exist
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def search_author(self, first_name: str, last_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT FirstName, LastName FROM Author WHERE FirstName = ? AND LastName = ?''',
                                (first_name, last_name,))
                 if_exist = cursor.fetchone()
                 return if_exist
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def search_book(self, book_title: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT Title FROM Book WHERE Title = ?''', (book_title,))
                 if_exist = cursor.fetchone()
                 return if_exist
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
+
+    def find_book(self, match: str, after: int = 0, limit: int = -1):
+        """Books matching an FTS5 query, best first, keyed on (rank, Book_ID).
+
+        The cursor is still the last Book_ID; the page after it starts from that book's rank.
+        """
+        # Title matches weigh the most, then series, author and genre.
+        return self._stream('''WITH Hits AS (SELECT rowid AS Book_ID, Author, Genre,
+                                                bm25(BookSearch, 10.0, 4.0, 2.0, 1.0) AS Rank
+                                         FROM BookSearch WHERE BookSearch MATCH ?)
+                            SELECT Book.Book_ID, Book.Title, Book.Series, Hits.Author, Hits.Genre, Book.LoanStatus
+                            FROM Hits
+                            INNER JOIN Book ON Book.Book_ID = Hits.Book_ID
+                            WHERE ? = 0
+                            OR (Hits.Rank, Hits.Book_ID) > ((SELECT Rank FROM Hits WHERE Book_ID = ?), ?)
+                            ORDER BY Hits.Rank, Hits.Book_ID
+                            LIMIT ?''',
+                            (match, after, after, after, limit), limit)
 
     def search_user(self, first_name: str, last_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT FirstName, LastName FROM User WHERE FirstName = ? AND LastName = ?''',
                                (first_name, last_name,))
                 if_exist = cursor.fetchone()
                 return if_exist
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def search_loan(self, user_id: int, book_id: int):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''SELECT *  FROM Loan WHERE User_ID = ? AND Book_ID = ?''',
                                (user_id, book_id,))
                 if_exist = cursor.fetchone()
                 return if_exist
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
-    def search_book_by_genre(self, genre_id: int):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book.Book_ID, Book.Title, Book.Series, Genre.GenreName,
-                                Author.FirstName, Author.LastName, Book.LoanStatus
-                                FROM Book
-                                INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
-                                INNER JOIN Author ON Book.Author_ID = Author.Author_ID
-                                WHERE Book.Genre_ID = ?''',
-                               (genre_id,))
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def search_book_by_genre(self, genre_id: int, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book.Book_ID, Book.Title, Book.Series, Genre.GenreName,
+                            Author.FirstName, Author.LastName, Book.LoanStatus
+                            FROM Book
+                            INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
+                            INNER JOIN Author ON Book.Author_ID = Author.Author_ID
+                            WHERE Book.Genre_ID = ?
+                            AND Book.Book_ID > ?
+                            ORDER BY Book.Book_ID LIMIT ?''',
+                            (genre_id, after, limit), limit)
 
-    def search_book_by_author(self, author_id: int):
-        try:
-            with self._conn:
-                cursor = self._conn.cursor()
-                cursor.execute('''SELECT Book.Book_ID, Book.Title, Book.Series, Genre.GenreName,
-                                Author.FirstName, Author.LastName, Book.LoanStatus
-                                FROM Book
-                                INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
-                                INNER JOIN Author ON Book.Author_ID = Author.Author_ID
-                                WHERE Book.Author_ID = ?''',
-                               (author_id,))
-                book_list = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                return [book_list, column_names]
-        except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+    def search_book_by_author(self, author_id: int, after: int = 0, limit: int = -1):
+        return self._stream('''SELECT Book.Book_ID, Book.Title, Book.Series, Genre.GenreName,
+                            Author.FirstName, Author.LastName, Book.LoanStatus
+                            FROM Book
+                            INNER JOIN Genre ON Book.Genre_ID = Genre.Genre_ID
+                            INNER JOIN Author ON Book.Author_ID = Author.Author_ID
+                            WHERE Book.Author_ID = ?
+                            AND Book.Book_ID > ?
+                            ORDER BY Book.Book_ID LIMIT ?''',
+                            (author_id, after, limit), limit)
 
     def get_genre_id(self, genre_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT Genre_ID FROM Genre WHERE GenreName = ?', (genre_name,))
                 genre_id = cursor.fetchone()
                 return genre_id
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def get_author_id(self, first_name: str, last_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT Author_ID FROM Author WHERE FirstName = ? AND LastName = ?',
                                (first_name, last_name,))
                 author_id = cursor.fetchone()
                 return author_id
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def get_book_id(self, book_title: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT Book_ID FROM Book WHERE Title = ?', (book_title,))
                 book_id = cursor.fetchone()
                 return book_id
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
 
     def get_user_id(self, first_name: str, last_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 query = 'SELECT User_ID FROM User WHERE FirstName = ? AND LastName = ?'
                 params = (first_name, last_name)
                 cursor.execute(query, params)
                 user_id = cursor.fetchone()
                 return user_id
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking id: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking id: {e}") from e
+
+    def _get_ids(self, query: str, keys: List[tuple], key_width: int) -> dict:
+        """Resolve many keys in one statement, returning a {key: id} mapping."""
+        # Bulk imports resolve IDs inside their open transaction; they never run in concurrent
+        # mode, where the reader is the write connection itself.
+        if not keys:
+            return {}
+        try:
+            placeholders = ", ".join(["(" + ",".join("?" * key_width) + ")"] * len(keys))
+            params = [value for key in keys for value in key]
+            with self._reader() as conn:
+                return {tuple(row[1:]): row[0] for row in conn.execute(query.format(placeholders), params)}
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking id: {e}") from e
+
+    def get_genre_ids(self, genre_names: List[str]) -> dict:
+        ids = self._get_ids('SELECT Genre_ID, GenreName FROM Genre WHERE GenreName IN (VALUES {})',
+                            [(name,) for name in genre_names], 1)
+        return {key[0]: value for key, value in ids.items()}
+
+    def get_author_ids(self, names: List[tuple]) -> dict:
+        # Joined from the VALUES list, so each name is one search of idx_author_name; a row-value
+        # IN (VALUES ...) is planned as a scan of the whole index.
+        return self._get_ids('''SELECT Author.Author_ID, Author.FirstName, Author.LastName FROM (VALUES {}) AS v
+                             JOIN Author ON Author.FirstName = v.column1 AND Author.LastName = v.column2''',
+                             names, 2)
+
+    def get_book_ids(self, book_titles: List[str]) -> dict:
+        ids = self._get_ids('SELECT Book_ID, Title FROM Book WHERE Title IN (VALUES {})',
+                            [(title,) for title in book_titles], 1)
+        return {key[0]: value for key, value in ids.items()}
+
+    def get_user_ids(self, names: List[tuple]) -> dict:
+        # Joined from the VALUES list, so each name is one search of idx_user_name; a row-value
+        # IN (VALUES ...) is planned as a scan of the whole index.
+        return self._get_ids('''SELECT User.User_ID, User.FirstName, User.LastName FROM (VALUES {}) AS v
+                             JOIN User ON User.FirstName = v.column1 AND User.LastName = v.column2''',
+                             names, 2)
+
+    def data_version(self) -> int:
+        """Return a counter that changes whenever another connection commits to the database."""
+        try:
+            # Always the write connection: each connection keeps its own counter.
+            with self._write_lock:
+                return self._conn.execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def get_names(self, table: str, after: int = 0) -> list:
+        """Return (ID, name) of the rows of a NAMED_TABLES table with an ID above `after`, in ID order."""
+        key, name = self._name_columns(table)
+        try:
+            with self._reader() as conn:
+                return conn.execute(f'SELECT {key}, {name} FROM {table} WHERE {key} > ? ORDER BY {key}',
+                                    (after,)).fetchall()
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def get_names_by_id(self, table: str, row_ids: List[int]) -> list:
+        """Return (ID, name) of the given rows that still exist."""
+        key, name = self._name_columns(table)
+        ids = self._get_ids(f'SELECT {name}, {key} FROM {table} WHERE {key} IN (VALUES {{}})',
+                            [(row_id,) for row_id in row_ids], 1)
+        return [(row_id, name) for (row_id,), name in ids.items()]
+
+    def get_name_changes(self, after: int) -> tuple:
+        """Return (oldest change kept, [(seq, table, row ID)] of renames and deletes after `after`).
+
+        The log only keeps the latest changes: if the oldest one kept is past `after + 1`,
+        some were dropped and the caller has to read the names again.
+        """
+        try:
+            with self._reader() as conn:
+                oldest = conn.execute('SELECT MIN(Seq) FROM NameChange').fetchone()[0]
+                changes = conn.execute('SELECT Seq, TableName, Row_ID FROM NameChange WHERE Seq > ? ORDER BY Seq',
+                                       (after,)).fetchall()
+            return oldest, changes
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    @staticmethod
+    def _name_columns(table: str) -> tuple:
+        for name, key, columns in NAMED_TABLES:
+            if name == table:
+                return key, " || ' ' || ".join(columns)
+        raise ValueError(f"{table} has no names to complete.")
 
     def get_columns_name(self, table_name: str):
         try:
-            with self._conn:
-                cursor = self._conn.cursor()
+            with self._reader() as conn:
+                cursor = conn.cursor()
                 cursor.execute(f"PRAGMA table_info({table_name})")
                 columns = cursor.fetchall()
                 column_names = [column[1] for column in columns]
                 return column_names
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
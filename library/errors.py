@@ -0,0 +1,6 @@
+"""This module provides the exception raised when a library operation fails."""
+# errors.py
+
+
+class LibraryError(Exception):
+    """A library operation failed; the message is the one the CLI prints."""
@@ -0,0 +1,118 @@
+"""This module provides the streaming table export functionality."""
+# exporter.py
+
+import csv
+import gzip
+import json
+import os
+import struct
+from typing import IO, Iterable, Iterator, List
+
+from library.importer import chunked
+
+EXPORT_FORMATS = ("csv", "ndjson", "columnar")
+# Rows per column chunk in the columnar format.
+CHUNK_ROWS = 4096
+COLUMNAR_MAGIC = b"LIBCOL1\n"
+
+
+def open_output(path: str, compress: bool, binary: bool) -> IO:
+    opener = gzip.open if compress else open
+    if binary:
+        return opener(path, "wb")
+    return opener(path, "wt", encoding="utf-8", newline="")
+
+
+def write_csv(file: IO, rows: Iterable[tuple], column_names: List[str]) -> int:
+    writer = csv.writer(file)
+    writer.writerow(column_names)
+    count = 0
+    for batch in chunked(rows, CHUNK_ROWS):
+        writer.writerows(batch)
+        count += len(batch)
+    return count
+
+
+def write_ndjson(file: IO, rows: Iterable[tuple], column_names: List[str]) -> int:
+    count = 0
+    for batch in chunked(rows, CHUNK_ROWS):
+        file.write("".join(json.dumps(dict(zip(column_names, row))) + "\n" for row in batch))
+        count += len(batch)
+    return count
+
+
+def _encode_column(values: list) -> bytes:
+    # 'q' packs all-integer columns as int64, 'd' all-float columns as float64; anything
+    # else (text, NULLs, mixed types) is a JSON array.
+    if all(type(value) is int for value in values):
+        return b"q" + struct.pack(f"<{len(values)}q", *values)
+    if all(type(value) is float for value in values):
+        return b"d" + struct.pack(f"<{len(values)}d", *values)
+    return b"j" + json.dumps(values).encode("utf-8")
+
+
+def write_columnar(file: IO, rows: Iterable[tuple], column_names: List[str]) -> int:
+    """Write rows as column chunks.
+
+    Layout: COLUMNAR_MAGIC, a length-prefixed JSON list of column names, then one block per
+    CHUNK_ROWS rows: the row count, followed by each column as a length-prefixed typed
+    array. All lengths and counts are little-endian uint32; a zero row count ends the file.
+    """
+    header = json.dumps(column_names).encode("utf-8")
+    file.write(COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header)
+    count = 0
+    for batch in chunked(rows, CHUNK_ROWS):
+        file.write(struct.pack("<I", len(batch)))
+        for column in zip(*batch):
+            data = _encode_column(list(column))
+            file.write(struct.pack("<I", len(data)) + data)
+        count += len(batch)
+    file.write(struct.pack("<I", 0))
+    return count
+
+
+def read_columnar(path: str) -> Iterator[tuple]:
+    """Read a columnar export (gzipped or not) back as rows; the first row is the column names."""
+    with open(path, "rb") as probe:
+        compressed = probe.read(2) == b"\x1f\x8b"
+    with (gzip.open(path, "rb") if compressed else open(path, "rb")) as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar export.")
+        (length,) = struct.unpack("<I", file.read(4))
+        column_names = json.loads(file.read(length))
+        yield tuple(column_names)
+        while True:
+            (row_count,) = struct.unpack("<I", file.read(4))
+            if row_count == 0:
+                return
+            columns = []
+            for _ in column_names:
+                (length,) = struct.unpack("<I", file.read(4))
+                data = file.read(length)
+                kind, payload = data[:1], data[1:]
+                if kind == b"j":
+                    columns.append(json.loads(payload))
+                else:
+                    columns.append(struct.unpack(f"<{row_count}{kind.decode()}", payload))
+            yield from zip(*columns)
+
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "columnar": write_columnar}
+
+
+def export_rows(path: str, rows: Iterable[tuple], column_names: List[str], file_format: str,
+                compress: bool = False) -> int:
+    """Stream rows into `path` and return how many were written.
+
+    Rows are written in batches as they're read, so memory use doesn't depend on the table
+    size. The file is written under a temporary name and renamed once complete.
+    """
+    partial = path + ".partial"
+    try:
+        with open_output(partial, compress, file_format == "columnar") as file:
+            count = WRITERS[file_format](file, rows, column_names)
+        os.replace(partial, path)
+        return count
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
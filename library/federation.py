@@ -0,0 +1,108 @@
+"""This module provides the branch registry and federated queries across branch databases."""
+# federation.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from library.errors import LibraryError
+from library.library import Library
+
+DEFAULT_REGISTRY = "branches.json"
+# Library methods that may be fanned out; each returns [rows, column_names] or a single value.
+FEDERATED_METHODS = {
+    "check_if_available", "search_book_by_author", "search_book_by_genre", "find_books",
+    "list_all_book", "list_all_author", "list_all_genre", "list_all_user", "list_all_loan",
+    "book_in_series", "book_not_in_series", "available_books_for_loan", "non_available_books_for_loan",
+    "user_with_loan", "returned_loan", "overdue_loan", "top_genres", "top_authors",
+}
+# Column headings for the methods that return a single value instead of rows.
+VALUE_COLUMNS = {"check_if_available": "LoanStatus"}
+
+
+def registry_path() -> str:
+    return os.environ.get("LIBRARY_BRANCHES", DEFAULT_REGISTRY)
+
+
+def load_branches() -> Dict[str, str]:
+    """Return the {branch name: database path} registry, in the order branches were added."""
+    try:
+        with open(registry_path(), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_branches(branches: Dict[str, str]):
+    # Write to a temporary file first so that a crash never leaves half a registry behind.
+    path = registry_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(branches, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class BranchResult:
+    def __init__(self, branch: str, elapsed: float, rows: List[tuple], error: Optional[str] = None):
+        self.branch = branch
+        self.elapsed = elapsed
+        self.rows = rows
+        self.error = error
+
+
+class Federation:
+    """Run the same Library query against every branch database in parallel.
+
+    Each worker thread keeps its own read-only connection to every branch, so a query never
+    creates tables in, migrates or takes write locks on a branch that another process may be
+    serving; a branch at an older schema version is reported instead. Rows come back merged
+    in registry order with the branch name as their first column, alongside per-branch
+    latency and errors; one branch failing doesn't fail the others.
+    """
+
+    def __init__(self, branches: Dict[str, str], max_workers: Optional[int] = None):
+        self.branches = branches
+        self._executor = ThreadPoolExecutor(max_workers or max(len(branches), 1), thread_name_prefix="branch")
+        self._local = threading.local()
+
+    def _library(self, branch: str) -> Library:
+        libraries = self._local.__dict__.setdefault("libraries", {})
+        if branch not in libraries:
+            if not os.path.exists(self.branches[branch]):
+                # Say so plainly rather than with SQLite's "unable to open database file".
+                raise LibraryError(f"Database {self.branches[branch]} doesn't exist.")
+            libraries[branch] = Library(path=self.branches[branch], read_only=True, immutable=False)
+        return libraries[branch]
+
+    def _query(self, branch: str, method: str, args: tuple, kwargs: dict) -> tuple:
+        started = time.perf_counter()
+        try:
+            result = getattr(self._library(branch), method)(*args, **kwargs)
+            if isinstance(result, list):
+                rows, column_names = list(result[0]), result[1]
+            else:
+                rows, column_names = ([] if result is None else [(result,)]), [VALUE_COLUMNS.get(method, "Result")]
+        except LibraryError as e:
+            return BranchResult(branch, time.perf_counter() - started, [], str(e)), None
+        except sqlite3.Error as e:
+            return BranchResult(branch, time.perf_counter() - started, [], f"Error: {e}."), None
+        return BranchResult(branch, time.perf_counter() - started, rows), column_names
+
+    def query(self, method: str, *args, **kwargs) -> list:
+        """Return [merged rows, column names, per-branch results] for a Library method in FEDERATED_METHODS."""
+        if method not in FEDERATED_METHODS:
+            raise LibraryError(f"{method} can't be run across branches.")
+        futures = [self._executor.submit(self._query, branch, method, args, kwargs) for branch in self.branches]
+        results, column_names = [], None
+        for future in futures:
+            result, names = future.result()
+            results.append(result)
+            column_names = column_names or names
+        merged = [(result.branch,) + tuple(row) for result in results for row in result.rows]
+        return [merged, ["Branch"] + (column_names or []), results]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
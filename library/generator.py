@@ -0,0 +1,236 @@
+"""This module provides the synthetic library database generator."""
+# generator.py
+
+import os
+import random
+from datetime import timedelta
+from typing import Iterator
+
+from library.database import DatabaseHandler
+from library.importer import chunked
+from library.library import EPOCH
+
+BATCH_SIZE = 10000
+PROGRESS_ROWS = 100000
+BASE_TABLES = ("Genre", "Author", "Book", "User", "Loan")
+LOAN_DAYS = 21
+# How far back overdue loans go, in days past their due date.
+OVERDUE_DAYS = 180
+# Share of books that start a series, and how long a series runs.
+SERIES_SHARE = 0.25
+SERIES_LENGTH = (2, 7)
+# Chance that a book is in its author's usual genre.
+AUTHOR_GENRE_SHARE = 0.9
+# Zipf exponents: author productivity, and how strongly loans favour popular books.
+AUTHOR_SKEW = 1.0
+BOOK_SKEW = 0.8
+
+GENRE_NAMES = [
+    "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Historical Fiction", "Horror",
+    "Young Adult", "Children", "Biography", "History", "Poetry", "Drama", "Humor", "Travel", "Cooking",
+    "Science", "Philosophy", "Religion", "Art", "Music", "Sports", "Business", "Self Help", "Health",
+    "Graphic Novel", "Classics", "Adventure", "Crime", "Dystopian", "Memoir", "Essays", "Politics",
+    "Economics", "Psychology", "Nature", "Technology", "Mathematics", "Education", "Reference",
+]
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Daniel", "Nancy", "Matthew", "Lisa", "Anthony", "Betty", "Mark", "Margaret", "Paul", "Sandra",
+    "Minh", "Lan", "Hiroshi", "Yuki", "Ana", "Luis", "Fatima", "Omar", "Priya", "Arjun",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+    "Nguyen", "Tran", "Vo", "Tanaka", "Sato", "Silva", "Khan", "Ali", "Patel", "Sharma",
+]
+TITLE_ADJECTIVES = [
+    "Silent", "Hidden", "Broken", "Golden", "Last", "Lost", "Burning", "Frozen", "Secret", "Wild",
+    "Crimson", "Endless", "Fallen", "Distant", "Hollow", "Midnight", "Shattered", "Quiet", "Bright", "Iron",
+]
+TITLE_NOUNS = [
+    "River", "Kingdom", "Garden", "Empire", "Shadow", "Crown", "Forest", "City", "Storm", "Heart",
+    "Road", "House", "Sea", "Star", "Winter", "Island", "Mountain", "Door", "Song", "Fire",
+]
+STREETS = ["Main", "Oak", "Maple", "Cedar", "Pine", "Elm", "Lake", "Hill", "Park", "Church"]
+
+
+def zipf(rng: random.Random, n: int, skew: float) -> int:
+    """Draw a rank in 1..n, with rank k about 1/k**skew as likely as rank 1.
+
+    Uses the inverse CDF of the continuous power law, so it costs O(1) time and no memory
+    however large n is.
+    """
+    u = rng.random()
+    if skew == 1:
+        value = (n + 1) ** u
+    else:
+        value = (((n + 1) ** (1 - skew) - 1) * u + 1) ** (1 / (1 - skew))
+    return min(n, int(value))
+
+
+def author_genre(author_id: int, genres: int) -> int:
+    # A fixed pseudo-random genre per author, without keeping a table of them.
+    return author_id * 2654435761 % genres + 1
+
+
+def genre_rows(genres: int) -> Iterator[tuple]:
+    for i in range(genres):
+        yield (GENRE_NAMES[i] if i < len(GENRE_NAMES) else f"{GENRE_NAMES[i % len(GENRE_NAMES)]} {i // len(GENRE_NAMES)}",)
+
+
+def author_rows(rng: random.Random, authors: int, start_day: int) -> Iterator[tuple]:
+    # Authors are born 20 to 90 years before the first loan.
+    for _ in range(authors):
+        birthday = start_day - rng.randint(20 * 365, 90 * 365)
+        yield rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), day_text(birthday)
+
+
+def book_rows(rng: random.Random, books: int, authors: int, genres: int) -> Iterator[tuple]:
+    """Yield books whose authors follow a Zipf distribution, some grouped into series by one author."""
+    book_id = 0
+    while book_id < books:
+        author_id = zipf(rng, authors, AUTHOR_SKEW)
+        genre_id = author_genre(author_id, genres)
+        series = f"The {rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)}" if rng.random() < SERIES_SHARE else None
+        for number in range(1, (rng.randint(*SERIES_LENGTH) if series else 1) + 1):
+            if book_id == books:
+                return
+            book_id += 1
+            book_genre = genre_id if rng.random() < AUTHOR_GENRE_SHARE else rng.randint(1, genres)
+            # Titles are unique in the schema, so each one carries its Book_ID.
+            yield (f"{rng.choice(TITLE_ADJECTIVES)} {rng.choice(TITLE_NOUNS)} {book_id}", book_genre,
+                   f"{series}, #{number}" if series else None, author_id)
+
+
+def user_rows(rng: random.Random, users: int) -> Iterator[tuple]:
+    for user_id in range(1, users + 1):
+        yield (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+               f"{rng.randint(1, 9999)} {rng.choice(STREETS)} Street", f"user{user_id}@example.org",
+               f"555-{user_id:08d}")
+
+
+def loan_rows(rng: random.Random, loans: int, books: int, users: int, active: float, overdue: float,
+              start_day: int, end_day: int) -> Iterator[tuple]:
+    """Yield loans as of `end_day`: `active` of them still out, `overdue` out past their due date, the rest returned.
+
+    Returned loans are spread evenly from `start_day` to `end_day` in Loan_ID order. Popular
+    books are borrowed more often; a book is never out twice, so an open loan that draws a
+    book that is already out becomes a returned one.
+    """
+    span = max(end_day - start_day - LOAN_DAYS, 1)
+    out = set()
+    for i in range(loans):
+        book_id = zipf(rng, books, BOOK_SKEW)
+        user_id = rng.randint(1, users)
+        draw = rng.random()
+        if draw < active + overdue and book_id not in out:
+            out.add(book_id)
+            if draw < active:
+                loan_day = end_day - rng.randint(0, LOAN_DAYS - 1)
+            else:
+                loan_day = end_day - LOAN_DAYS - rng.randint(1, OVERDUE_DAYS)
+            yield book_id, user_id, loan_day, loan_day + LOAN_DAYS, None, "Not Return"
+        else:
+            loan_day = start_day + i * span // loans
+            # About one return in eight comes back late.
+            returned = min(loan_day + rng.randint(1, LOAN_DAYS + LOAN_DAYS // 3), end_day)
+            yield book_id, user_id, loan_day, loan_day + LOAN_DAYS, returned, "Returned"
+
+
+def day_text(day: int) -> str:
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+INSERTS = {
+    "Genre": 'INSERT INTO Genre (GenreName) VALUES (?)',
+    "Author": 'INSERT INTO Author (FirstName, LastName, Birthday) VALUES (?,?,?)',
+    "Book": 'INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?,?,?,?)',
+    "User": 'INSERT INTO User (FirstName, LastName, Address, Email, PhoneNumber) VALUES (?,?,?,?,?)',
+    "Loan": 'INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate, DateReturn, LoanStatus) VALUES (?,?,?,?,?,?)',
+}
+# Derived data that the dropped triggers would have maintained, rebuilt in one pass each.
+REBUILDS = [
+    '''UPDATE Book SET LoanStatus = 'Not Available'
+                WHERE Book_ID IN (SELECT Book_ID FROM Loan WHERE LoanStatus = 'Not Return')''',
+    '''INSERT INTO GenreBookCount (Genre_ID, BookCount)
+                SELECT Genre_ID, COUNT(*) FROM Book WHERE Genre_ID IS NOT NULL GROUP BY Genre_ID''',
+    '''INSERT INTO AuthorBookCount (Author_ID, BookCount)
+                SELECT Author_ID, COUNT(*) FROM Book WHERE Author_ID IS NOT NULL GROUP BY Author_ID''',
+    '''INSERT INTO LoanStatusCount (LoanStatus, LoanCount)
+                SELECT LoanStatus, COUNT(*) FROM Loan WHERE LoanStatus IS NOT NULL GROUP BY LoanStatus''',
+    '''INSERT INTO BookSearch (rowid, Title, Series, Author, Genre)
+                SELECT Book.Book_ID, Book.Title, Book.Series,
+                       Author.FirstName || ' ' || Author.LastName, Genre.GenreName
+                FROM Book
+                LEFT JOIN Author ON Author.Author_ID = Book.Author_ID
+                LEFT JOIN Genre ON Genre.Genre_ID = Book.Genre_ID''',
+]
+
+
+def generate(path: str, genres: int, authors: int, books: int, users: int, loans: int, active: float,
+             overdue: float, start_day: int, end_day: int, seed: int = 0, progress=None) -> dict:
+    """Build a new database at `path` and return the rows written per table.
+
+    The same arguments and seed always produce the same database. Rows are inserted in
+    batches with the indexes and triggers dropped; they are created again once the data is
+    in, and the rollup and search tables they would have maintained are filled in one pass.
+    The file is built under a temporary name with journaling off and renamed when complete.
+    """
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    handler = DatabaseHandler(path=partial)
+    try:
+        handler.init_table()
+        conn = handler._conn
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        deferred = conn.execute(f'''SELECT type, name, sql FROM sqlite_master
+                                    WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+                                    AND tbl_name IN ({",".join("?" * len(BASE_TABLES))})''',
+                                BASE_TABLES).fetchall()
+        for kind, name, _ in deferred:
+            conn.execute(f'DROP {kind.upper()} {name}')
+
+        tables = [
+            ("Genre", genre_rows(genres)),
+            ("Author", author_rows(random.Random(f"{seed}-author"), authors, start_day)),
+            ("Book", book_rows(random.Random(f"{seed}-book"), books, authors, genres)),
+            ("User", user_rows(random.Random(f"{seed}-user"), users)),
+            ("Loan", loan_rows(random.Random(f"{seed}-loan"), loans, books, users, active, overdue,
+                               start_day, end_day)),
+        ]
+        counts = {}
+        for table, rows in tables:
+            counts[table] = 0
+            with conn:
+                for batch in chunked(rows, BATCH_SIZE):
+                    conn.executemany(INSERTS[table], batch)
+                    counts[table] += len(batch)
+                    if progress and counts[table] % PROGRESS_ROWS == 0:
+                        progress(table, counts[table])
+            if progress:
+                progress(table, counts[table])
+
+        # Indexes first so the rebuilds can use them; triggers last so the rebuilds don't fire them.
+        with conn:
+            for kind, name, sql in deferred:
+                if kind == "index":
+                    conn.execute(sql)
+                    if progress:
+                        progress(name, None)
+            for statement in REBUILDS:
+                conn.execute(statement)
+            for kind, name, sql in deferred:
+                if kind == "trigger":
+                    conn.execute(sql)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+        os.replace(partial, path)
+        return counts
+    finally:
+        handler._conn.close()
+        if os.path.exists(partial):
+            os.remove(partial)
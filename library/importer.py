@@ -0,0 +1,80 @@
+"""This module provides the bulk import functionality."""
+# importer.py
+
+import csv
+import json
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportReport:
+    def __init__(self, table: str):
+        self.table = table
+        self.inserted = 0
+        self.rejected = 0
+        self.errors: List[str] = []
+        self._started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {reason}")
+
+    def reject_many(self, count: int, first_line: int, last_line: int, reason: str):
+        self.rejected += count
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"lines {first_line}-{last_line}: {count} row(s) skipped, {reason}")
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+        return self
+
+    @property
+    def rows_per_sec(self) -> float:
+        total = self.inserted + self.rejected
+        return total / self.elapsed if self.elapsed else float(total)
+
+
+class Record(dict):
+    """A record read from an import file, remembering the line of the file it ended on."""
+
+    def __init__(self, fields: dict, line: int):
+        super().__init__(fields)
+        self.line = line
+
+
+def read_records(path: str, file_format: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Stream records from a CSV or JSONL file one at a time."""
+    if file_format is None:
+        file_format = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield Record(record, reader.line_num)
+        elif file_format == "jsonl":
+            for number, line in enumerate(file, start=1):
+                if line.strip():
+                    yield Record(json.loads(line), number)
+        else:
+            raise ValueError(f"Unknown import format: {file_format}")
+
+
+def numbered(records: Iterable[dict]) -> Iterator[tuple]:
+    """Pair records with the file line they were read from; records built in Python are numbered from 1."""
+    for number, record in enumerate(records, start=1):
+        yield getattr(record, "line", number), record
+
+
+def chunked(records: Iterable, size: int = BATCH_SIZE) -> Iterator[list]:
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
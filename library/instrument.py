@@ -0,0 +1,335 @@
+"""This module provides the query instrumentation: latency histograms, row counts, lock waits and the slow-query log."""
+# instrument.py
+
+import atexit
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Instrumentation is on unless LIBRARY_STATS=off.
+ENABLED = os.environ.get("LIBRARY_STATS", "on").lower() not in ("off", "0", "no")
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_MS", "200"))
+# Histogram bucket i counts durations below 2**i microseconds; the last bucket takes everything longer.
+BUCKETS = 26
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+_current = threading.local()
+# Lists of placeholders that grow with the arguments: IN (?,?,...) and VALUES (?), (?), ...
+IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+ROW_LIST = re.compile(r"(\([?,\s]+\))(?:\s*,\s*\([?,\s]+\))+")
+
+
+@functools.lru_cache(maxsize=256)
+def statement_key(sql: str) -> str:
+    """Return `sql` with its placeholder lists shortened, so that one statement is one key whatever its size."""
+    return ROW_LIST.sub(r"\1, ...", IN_LIST.sub("IN (?, ...)", sql))
+
+
+class Histogram:
+    """Count, total, maximum and power-of-two microsecond buckets for a stream of durations."""
+
+    __slots__ = ("count", "total", "max", "buckets", "rows", "errors")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+        self.rows = 0
+        self.errors = 0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "max": self.max, "buckets": self.buckets,
+                "rows": self.rows, "errors": self.errors}
+
+    def merge(self, data: dict):
+        self.count += data["count"]
+        self.total += data["total"]
+        self.max = max(self.max, data["max"])
+        self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+        self.rows += data["rows"]
+        self.errors += data["errors"]
+
+
+class Stats:
+    """Process-wide aggregates, keyed by DatabaseHandler method and by SQL statement."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.methods: Dict[str, Histogram] = {}
+        self.statements: Dict[str, Histogram] = {}
+        self.lock_waits = Histogram()
+        self.busy_retries = 0
+
+    def _entry(self, table: Dict[str, Histogram], key: str) -> Histogram:
+        entry = table.get(key)
+        if entry is None:
+            entry = table.setdefault(key, Histogram())
+        return entry
+
+    def record_method(self, name: str, seconds: float, failed: bool):
+        with self._lock:
+            entry = self._entry(self.methods, name)
+            entry.record(seconds)
+            entry.errors += failed
+
+    def record_statement(self, sql: str, seconds: float, rows: int, failed: bool) -> Histogram:
+        key = statement_key(sql)
+        with self._lock:
+            entry = self._entry(self.statements, key)
+            entry.record(seconds)
+            entry.rows += rows
+            entry.errors += failed
+            return entry
+
+    def record_lock_wait(self, seconds: float, retried: bool = False):
+        with self._lock:
+            self.lock_waits.record(seconds)
+            self.busy_retries += retried
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"methods": {name: entry.as_dict() for name, entry in self.methods.items()},
+                    "statements": {sql: entry.as_dict() for sql, entry in self.statements.items()},
+                    "lock_waits": self.lock_waits.as_dict(), "busy_retries": self.busy_retries}
+
+    def merge(self, data: dict):
+        with self._lock:
+            for name, entry in data.get("methods", {}).items():
+                self._entry(self.methods, name).merge(entry)
+            for sql, entry in data.get("statements", {}).items():
+                self._entry(self.statements, sql).merge(entry)
+            if "lock_waits" in data:
+                self.lock_waits.merge(data["lock_waits"])
+            self.busy_retries += data.get("busy_retries", 0)
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+            self.statements.clear()
+            self.lock_waits = Histogram()
+            self.busy_retries = 0
+
+
+STATS = Stats()
+_log_lock = threading.Lock()
+
+
+def _path_setting(name: str) -> Optional[str]:
+    path = os.environ.get(name, "")
+    return None if path.lower() in ("", "off", "none") else path
+
+
+def slow_log_path() -> Optional[str]:
+    """Return the slow-query log, or None unless LIBRARY_SLOW_LOG names one."""
+    return _path_setting("LIBRARY_SLOW_LOG")
+
+
+def stats_path() -> Optional[str]:
+    """Return the file that CLI runs add their aggregates to, or None unless LIBRARY_STATS_FILE names one."""
+    return _path_setting("LIBRARY_STATS_FILE")
+
+
+def load_stats(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_stats():
+    """Add this process's aggregates to the stats file; best effort, as the CLI is exiting."""
+    path = stats_path()
+    if path is None or not (STATS.methods or STATS.statements):
+        return
+    totals = Stats()
+    totals.merge(load_stats(path))
+    totals.merge(STATS.as_dict())
+    try:
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(totals.as_dict(), file)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
+def persist_at_exit():
+    if ENABLED and not getattr(persist_at_exit, "registered", False):
+        persist_at_exit.registered = True
+        atexit.register(save_stats)
+
+
+def log_slow(conn: sqlite3.Connection, sql: str, params, seconds: float, rows: int):
+    """Append a slow statement and its query plan to the slow-query log, if there is one."""
+    path = slow_log_path()
+    if path is None:
+        return
+    plan = []
+    if sql.lstrip().upper().startswith(EXPLAINABLE):
+        try:
+            # A plain cursor, so that explaining isn't itself instrumented. Plan rows are
+            # (id, parent, notused, detail); children are indented under their parent.
+            levels = {0: -1}
+            for node, parent, _, detail in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params):
+                levels[node] = levels.get(parent, -1) + 1
+                plan.append("  " * levels[node] + detail)
+        except (sqlite3.Error, ValueError):
+            plan = ["(plan unavailable)"]
+    entry = (f"# {time.strftime('%Y-%m-%d %H:%M:%S')}  {seconds * 1000:.1f} ms  rows={rows}  "
+             f"method={getattr(_current, 'method', None)}\n{' '.join(sql.split())}\n"
+             + "".join(f"    {line}\n" for line in plan) + "\n")
+    with _log_lock:
+        try:
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(entry)
+        except OSError:
+            pass
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement and counts the rows it returns or changes."""
+
+    def execute(self, sql: str, params=()):
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, params)
+        except sqlite3.Error:
+            STATS.record_statement(sql, time.perf_counter() - started, 0, True)
+            raise
+        elapsed = time.perf_counter() - started
+        rows = max(self.rowcount, 0)
+        self._entry = STATS.record_statement(sql, elapsed, rows, False)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            log_slow(self.connection, sql, params, elapsed, rows)
+        return result
+
+    def executemany(self, sql: str, seq_of_params):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_params)
+        except sqlite3.Error:
+            STATS.record_statement(sql, time.perf_counter() - started, 0, True)
+            raise
+        elapsed = time.perf_counter() - started
+        rows = max(self.rowcount, 0)
+        STATS.record_statement(sql, elapsed, rows, False)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            first = seq_of_params[0] if isinstance(seq_of_params, (list, tuple)) and seq_of_params else ()
+            log_slow(self.connection, sql, first, elapsed, rows)
+        return result
+
+    def _fetched(self, rows: int):
+        # Unlocked: a row count may come up short if two threads fetch the same statement at once.
+        entry = getattr(self, "_entry", None)
+        if entry is not None:
+            entry.rows += rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._fetched(row is not None)
+        return row
+
+    def fetchmany(self, size: int = None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._fetched(len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute() and executemany(), are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts create their cursors internally, bypassing cursor().
+    def execute(self, sql: str, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def connection_factory():
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+
+def timed(name: str, method):
+    """Wrap a DatabaseHandler method so its calls are timed and its statements are attributed to it.
+
+    For list and report methods, which return a stream, this is the time to the first row.
+    """
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_current, "method", None)
+        _current.method = name
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            STATS.record_method(name, time.perf_counter() - started, failed)
+            _current.method = previous
+
+    return wrapper
+
+
+def instrument_methods(cls):
+    """Time every public method of `cls`; a no-op when instrumentation is off."""
+    if ENABLED:
+        for name, method in list(vars(cls).items()):
+            if callable(method) and not name.startswith("_"):
+                setattr(cls, name, timed(name, method))
+    return cls
+
+
+def summarize(data: dict, top: int = 10) -> tuple:
+    """Return (method rows, statement rows) from aggregates, slowest total time first; durations in ms."""
+
+    def histogram(entry: dict) -> Histogram:
+        result = Histogram()
+        result.merge(entry)
+        return result
+
+    def row(entry: Histogram) -> tuple:
+        return (entry.count, f"{entry.percentile(50) * 1000:.2f}", f"{entry.percentile(95) * 1000:.2f}",
+                f"{entry.percentile(99) * 1000:.2f}", f"{entry.max * 1000:.2f}", f"{entry.total * 1000:.1f}")
+
+    methods = sorted(((name, histogram(entry)) for name, entry in data.get("methods", {}).items()),
+                     key=lambda item: -item[1].total)
+    statements = sorted(((sql, histogram(entry)) for sql, entry in data.get("statements", {}).items()),
+                        key=lambda item: -item[1].total)
+    return ([(name,) + row(entry) + (entry.errors,) for name, entry in methods],
+            [(" ".join(sql.split())[:80],) + row(entry) + (entry.rows, entry.errors) for sql, entry in statements[:top]])
@@ -2,31 +2,62 @@
 # lib.py
 
 import typer
-from typing import Optional
-import sqlite3
-from library.library import Library
+from itertools import chain, islice
+from typing import TYPE_CHECKING, List, Optional
+from typer.core import TyperGroup
 from library import (__version__, __app_name__)
+from library.errors import LibraryError
 
-app = typer.Typer()
-lib: Optional[Library] = None
+if TYPE_CHECKING:
+    from library.library import Library
 
 
-def get_database():
+class LibraryGroup(TyperGroup):
+    """Print the message of a LibraryError raised while running a command, then exit."""
+
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except LibraryError as e:
+            typer.secho(str(e), fg=typer.colors.RED)
+            raise typer.Exit()
+
+
+app = typer.Typer(cls=LibraryGroup)
+TABLE_BATCH = 200
+AFTER_OPTION = typer.Option(0, help="Only list rows after this ID (the cursor printed with the previous page).")
+LIMIT_OPTION = typer.Option(-1, help="Maximum number of rows to list; -1 lists everything.")
+lib: Optional["Library"] = None
+# Set by --snapshot: read from this immutable copy instead of the live database.
+snapshot_path: Optional[str] = None
+# Set by the shell: its commands all reuse this Library instead of opening the database again.
+shell_library: Optional["Library"] = None
+
+
+def get_database(remote: bool = True):
+    """Use the running library server when there is one, otherwise open the database directly."""
     global lib
-    lib = Library()
+    from library.client import connect_server
+    from library.library import Library
+    from library.instrument import persist_at_exit
+    if shell_library is not None:
+        lib = shell_library
+        return
+    if snapshot_path:
+        lib = Library(path=snapshot_path, read_only=True)
+    else:
+        lib = (remote and connect_server()) or Library()
+    if isinstance(lib, Library):
+        persist_at_exit()
 
 
 @app.command()
 def init() -> None:
     """Initialize the library database."""
-    try:
-        get_database()
-        typer.secho("Initialized the database successfully."
-                    "\nThe database is C:\\Users\\Khue Vo\\training\\python\\sqlite-library\\library.db",
-                    fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while initializing the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    typer.secho("Initialized the database successfully."
+                "\nThe database is C:\\Users\\Khue Vo\\training\\python\\sqlite-library\\library.db",
+                fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -34,13 +65,9 @@ def add_genre(
         genre: str = typer.Option(..., prompt="Genre name"),
 ) -> None:
     """Add genre information into the library database."""
-    try:
-        get_database()
-        lib.add_genre(genre)
-        typer.secho(f"Genre {genre} successfully added.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error adding genre into the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.add_genre(genre)
+    typer.secho(f"Genre {genre} successfully added.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -50,13 +77,9 @@ def add_author(
         birthday: str = typer.Option(..., prompt="Birthday(YYYY-DD-MM)"),
 ) -> None:
     """Add author information into the library database."""
-    try:
-        get_database()
-        lib.add_author(first_name, last_name, birthday)
-        typer.secho(f"Author {first_name} {last_name} added successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error adding author into the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.add_author(first_name, last_name, birthday)
+    typer.secho(f"Author {first_name} {last_name} added successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -67,13 +90,9 @@ def add_book(
         author: str = typer.Option(..., prompt="Author"),
 ) -> None:
     """Add book information into the library database."""
-    try:
-        get_database()
-        lib.add_book(title, genre, series, author)
-        typer.secho(f"Book {title} successfully added.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error adding book into the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.add_book(title, genre, series, author)
+    typer.secho(f"Book {title} successfully added.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -85,13 +104,9 @@ def add_user(
         phone: str = typer.Option(..., prompt="Phone Number"),
 ) -> None:
     """Add user information into the library database."""
-    try:
-        get_database()
-        lib.add_user(first_name, last_name, address, email, phone)
-        typer.secho(f"User {first_name} {last_name} added successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error adding user into the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.add_user(first_name, last_name, address, email, phone)
+    typer.secho(f"User {first_name} {last_name} added successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -102,40 +117,133 @@ def add_loan(
         due_day: str = typer.Option(..., prompt="Due Day"),
 ) -> None:
     """Add loan information into the library database."""
+    get_database()
+    lib.add_loan(title, user, loan_day, due_day)
+    typer.secho(f"Loan added successfully.", fg=typer.colors.GREEN)
+
+
+def read_books(books: List[str], path: Optional[str]) -> List[str]:
+    """Titles or IDs from the command line, followed by those in `path` (one per line, - for stdin)."""
+    if path is None:
+        return list(books)
+    import sys
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as file:
+        return list(books) + [line.strip() for line in file if line.strip()]
+
+
+@app.command()
+def checkout(user: str = typer.Argument(..., help="The borrower's name, or their ID."),
+             books: List[str] = typer.Argument(None, help="Titles or IDs of the books to lend."),
+             from_file: Optional[str] = typer.Option(None, "--file", help="Read more titles or IDs from this file, "
+                                                                          "one per line; - reads stdin."),
+             loan_day: Optional[str] = typer.Option(None, help="Day of the loan (YYYY-MM-DD); defaults to today."),
+             days: int = typer.Option(21, min=1, help="Days until the books are due.")) -> None:
+    """Lend several books to one user at once; if any of them is out, none are lent."""
+    from datetime import date, timedelta
     try:
         get_database()
-        lib.add_loan(title, user, loan_day, due_day)
-        typer.secho(f"Loan added successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error adding loan into the database: {e}.", fg=typer.colors.RED)
+        books = read_books(books or [], from_file)
+        if not books:
+            typer.secho("Please enter at least one book.", fg=typer.colors.RED)
+            raise typer.Exit()
+        loan_day = loan_day or date.today().isoformat()
+        try:
+            due_day = (date.fromisoformat(loan_day) + timedelta(days=days)).isoformat()
+        except ValueError:
+            typer.secho(f"Please enter dates as YYYY-MM-DD, not {loan_day}.", fg=typer.colors.RED)
+            raise typer.Exit()
+        lent = lib.checkout(user, books, loan_day, due_day)
+        typer.secho(f"Lent {len(lent)} book(s) to {user}, due {due_day}.", fg=typer.colors.GREEN)
+    except OSError as e:
+        typer.secho(f"Error while checking out: {e}.", fg=typer.colors.RED)
         raise typer.Exit()
 
 
 @app.command()
-def update_genre(genre_id: int = typer.Option(..., prompt="Genre's ID"),
-                 info: str = typer.Option(..., prompt="New genre")) -> None:
-    """Update the chosen genre information in the library database."""
+def checkin(books: List[str] = typer.Argument(None, help="Titles or IDs of the books being returned."),
+            from_file: Optional[str] = typer.Option(None, "--file", help="Read more titles or IDs from this file, "
+                                                                         "one per line; - reads stdin (e.g. a scanner)."),
+            user: Optional[str] = typer.Option(None, help="Only return books lent to this user (name or ID)."),
+            return_day: Optional[str] = typer.Option(None, help="Day of the return (YYYY-MM-DD); defaults to today.")
+            ) -> None:
+    """Return a batch of books in one transaction."""
+    from datetime import date
     try:
         get_database()
-        lib.update_genre(genre_id, info)
-        typer.secho(f"Genre updated successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while updating genre: {e}.", fg=typer.colors.RED)
+        books = read_books(books or [], from_file)
+        if not books:
+            typer.secho("Please enter at least one book.", fg=typer.colors.RED)
+            raise typer.Exit()
+        returned, not_out = lib.checkin(books, return_day or date.today().isoformat(), user)
+        typer.secho(f"Returned {len(returned)} book(s).", fg=typer.colors.GREEN)
+        if not_out:
+            typer.secho(f"Not out{f' to {user}' if user else ''}: {', '.join(not_out)}", fg=typer.colors.YELLOW)
+    except OSError as e:
+        typer.secho(f"Error while checking in: {e}.", fg=typer.colors.RED)
         raise typer.Exit()
 
 
+@app.command("import")
+def import_records(
+        table: str = typer.Option(..., prompt="Table (genre/author/book/user/loan)"),
+        path: str = typer.Option(..., prompt="File path"),
+        file_format: Optional[str] = typer.Option(None, "--format", help="csv or jsonl, guessed from the extension."),
+        commit_every: int = typer.Option(0, help="Commit after this many rows; 0 imports in one transaction."),
+) -> None:
+    """Bulk import genres, authors, books, users or loans from a CSV/JSONL file."""
+    get_database(remote=False)
+    bulk_add = {
+        "genre": lib.bulk_add_genres,
+        "author": lib.bulk_add_authors,
+        "book": lib.bulk_add_books,
+        "user": lib.bulk_add_users,
+        "loan": lib.bulk_add_loans,
+    }.get(table.lower())
+    if bulk_add is None:
+        typer.secho(f"Unknown table {table}. Please enter genre, author, book, user or loan.", fg=typer.colors.RED)
+        raise typer.Exit()
+    from library.importer import read_records
+    report = bulk_add(read_records(path, file_format), commit_every)
+    typer.secho(f"Imported {report.inserted} {report.table} row(s), rejected {report.rejected} "
+                f"in {report.elapsed:.2f}s ({report.rows_per_sec:,.0f} rows/sec).", fg=typer.colors.GREEN)
+    for error in report.errors:
+        typer.secho(f"Rejected {error}", fg=typer.colors.YELLOW)
+
+
+@app.command()
+def bulk_update(
+        table: str = typer.Option(..., prompt="Table (genre/author/book/user/loan)"),
+        path: str = typer.Option(..., prompt="File path"),
+        file_format: Optional[str] = typer.Option(None, "--format", help="csv or jsonl, guessed from the extension."),
+        commit_every: int = typer.Option(0, help="Commit after this many rows; 0 applies the file in one transaction."),
+) -> None:
+    """Apply a CSV/JSONL file of patches: an id column plus the fields to change, with the import's field names."""
+    get_database(remote=False)
+    from library.importer import read_records
+    report = lib.bulk_update(table.lower(), read_records(path, file_format), commit_every)
+    typer.secho(f"Updated {report.inserted} {report.table} row(s), rejected {report.rejected} "
+                f"in {report.elapsed:.2f}s ({report.rows_per_sec:,.0f} rows/sec).", fg=typer.colors.GREEN)
+    for error in report.errors:
+        typer.secho(f"Rejected {error}", fg=typer.colors.YELLOW)
+
+
+@app.command()
+def update_genre(genre_id: int = typer.Option(..., prompt="Genre's ID"),
+                 info: str = typer.Option(..., prompt="New genre")) -> None:
+    """Update the chosen genre information in the library database."""
+    get_database()
+    lib.update_genre(genre_id, info)
+    typer.secho(f"Genre updated successfully.", fg=typer.colors.GREEN)
+
+
 @app.command()
 def update_author(author_id: int = typer.Option(..., prompt="Author's ID"),
                   new_name: str = typer.Option(..., prompt="New name"),
                   new_birthday: str = typer.Option(..., prompt="New birthday")) -> None:
     """Update the chosen author information in the library database."""
-    try:
-        get_database()
-        lib.update_author(author_id, new_name, new_birthday)
-        typer.secho(f"Author updated successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while updating author: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.update_author(author_id, new_name, new_birthday)
+    typer.secho(f"Author updated successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -146,13 +254,9 @@ def update_book(book_id: int = typer.Option(..., prompt="Book's ID"),
                 new_author: str = typer.Option(..., prompt="New author"),
                 new_status: str = typer.Option(..., prompt="New loan status")) -> None:
     """Update the chosen book information in the library database."""
-    try:
-        get_database()
-        lib.update_book(book_id, new_title, new_genre, new_series, new_author, new_status)
-        typer.secho(f"Book updated successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while updating book: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.update_book(book_id, new_title, new_genre, new_series, new_author, new_status)
+    typer.secho(f"Book updated successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -163,13 +267,9 @@ def update_user(user_id: int = typer.Option(..., prompt="User's ID"),
                 new_phone: str = typer.Option(..., prompt="New phone number")
                 ) -> None:
     """Update the chosen user information in the library database."""
-    try:
-        get_database()
-        lib.update_user(user_id, new_name, new_address, new_email, new_phone)
-        typer.secho(f"User updated successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while updating user: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.update_user(user_id, new_name, new_address, new_email, new_phone)
+    typer.secho(f"User updated successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
@@ -181,395 +281,623 @@ def update_loan(loan_id: int = typer.Option(..., prompt="Loan's ID"),
                 new_returndate: str = typer.Option(..., prompt="New return date"),
                 new_loanstatus: str = typer.Option(..., prompt="New loan status"), ) -> None:
     """Update the chosen loan information in the library database."""
-    try:
-        get_database()
-        lib.update_loan(loan_id, new_book, new_user, new_loandate, new_duedate, new_returndate, new_loanstatus)
-        typer.secho(f"Loan updated successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while updating loan: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    lib.update_loan(loan_id, new_book, new_user, new_loandate, new_duedate, new_returndate, new_loanstatus)
+    typer.secho(f"Loan updated successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
 def info_genre(genre_id: int = typer.Option(..., prompt="Genre's ID")) -> None:
     """Check a specific genre's information in the library database."""
-    try:
-        get_database()
-        genre, column_names = lib.info_genre(genre_id)
-        if len(genre) == 0:
-            typer.secho("Genre doesn't exist. Please enter another genre's ID.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table(f"Genre details:", genre, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
+    get_database()
+    genre, column_names = lib.info_genre(genre_id)
+    if len(genre) == 0:
+        typer.secho("Genre doesn't exist. Please enter another genre's ID.", fg=typer.colors.RED)
         raise typer.Exit()
+    print_table(f"Genre details:", genre, column_names)
 
 
 @app.command()
 def info_author(author_id: int = typer.Option(..., prompt="Author's ID")) -> None:
     """Check a specific author's information in the library database."""
-    try:
-        get_database()
-        author, column_names = lib.info_author(author_id)
-        if len(author) == 0:
-            typer.secho("Author doesn't exist. Please enter another author's ID.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table(f"Author details:", author, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
+    get_database()
+    author, column_names = lib.info_author(author_id)
+    if len(author) == 0:
+        typer.secho("Author doesn't exist. Please enter another author's ID.", fg=typer.colors.RED)
         raise typer.Exit()
+    print_table(f"Author details:", author, column_names)
 
 
 @app.command()
 def info_book(book_id: int = typer.Option(..., prompt="Book's ID")) -> None:
     """Check a specific book's information in the library database."""
-    try:
-        get_database()
-        book, column_names = lib.info_book(book_id)
-        if len(book) == 0:
-            typer.secho("Book doesn't exist. Please enter another book's ID.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table(f"Book details:", book, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
+    get_database()
+    book, column_names = lib.info_book(book_id)
+    if len(book) == 0:
+        typer.secho("Book doesn't exist. Please enter another book's ID.", fg=typer.colors.RED)
         raise typer.Exit()
+    print_table(f"Book details:", book, column_names)
 
 
 @app.command()
 def info_user(user_id: int = typer.Option(..., prompt="User's ID")) -> None:
     """Check a specific user's information in the library database."""
-    try:
-        get_database()
-        user, column_names = lib.info_user(user_id)
-        if len(user) == 0:
-            typer.secho("User doesn't exist. Please enter another user's ID.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table(f"User details:", user, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
+    get_database()
+    user, column_names = lib.info_user(user_id)
+    if len(user) == 0:
+        typer.secho("User doesn't exist. Please enter another user's ID.", fg=typer.colors.RED)
         raise typer.Exit()
+    print_table(f"User details:", user, column_names)
 
 
 @app.command()
 def info_loan(loan_id: int = typer.Option(..., prompt="Loan's ID")) -> None:
     """Check a specific loan's information in the library database."""
-    try:
-        get_database()
-        loan, column_names = lib.info_loan(loan_id)
-        if len(loan) == 0:
-            typer.secho("Loan doesn't exist. Please enter another loan's ID.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table(f"Loan details:", loan, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
+    get_database()
+    loan, column_names = lib.info_loan(loan_id)
+    if len(loan) == 0:
+        typer.secho("Loan doesn't exist. Please enter another loan's ID.", fg=typer.colors.RED)
         raise typer.Exit()
+    print_table(f"Loan details:", loan, column_names)
 
 
 @app.command()
-def list_all_genre() -> None:
+def list_all_genre(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Show all genres within the library database."""
-    try:
-        get_database()
-        all_genre, column_name = lib.list_all_genre()
-        if len(all_genre) == 0:
-            typer.secho("There are no genre in the table yet. Please add one first.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table("Genre", all_genre, column_name)
+    get_database()
+    all_genre, column_name = lib.list_all_genre(after, limit)
+    if print_table("Genre", all_genre, column_name,
+                   "There are no genre in the table yet. Please add one first."):
         typer.secho(f"\nGenre table listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing genres from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    print_next_page(all_genre, limit)
 
 
 @app.command()
-def list_all_author() -> None:
+def list_all_author(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Show all authors within the library database."""
-    try:
-        get_database()
-        all_author, column_name = lib.list_all_author()
-        if len(all_author) == 0:
-            typer.secho("There are no author in the table yet. Please add one first.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table("Author", all_author, column_name)
+    get_database()
+    all_author, column_name = lib.list_all_author(after, limit)
+    if print_table("Author", all_author, column_name,
+                   "There are no author in the table yet. Please add one first."):
         typer.secho(f"\nAuthor table listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing authors from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    print_next_page(all_author, limit)
 
 
 @app.command()
-def list_all_book() -> None:
+def list_all_book(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Show all books within the library database."""
-    try:
-        get_database()
-        all_book, column_name = lib.list_all_book()
-        if len(all_book) == 0:
-            typer.secho("There are no book in the table yet. Please add one first.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table("Book", all_book, column_name)
+    get_database()
+    all_book, column_name = lib.list_all_book(after, limit)
+    if print_table("Book", all_book, column_name,
+                   "There are no book in the table yet. Please add one first."):
         typer.secho(f"\nBook table listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    print_next_page(all_book, limit)
 
 
 @app.command()
-def list_all_user() -> None:
+def list_all_user(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Show all users within the library database."""
-    try:
-        get_database()
-        all_user, column_name = lib.list_all_user()
-        if len(all_user) == 0:
-            typer.secho("There are no user in the table yet. Please add one first.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table("User", all_user, column_name)
+    get_database()
+    all_user, column_name = lib.list_all_user(after, limit)
+    if print_table("User", all_user, column_name,
+                   "There are no user in the table yet. Please add one first."):
         typer.secho(f"\nUser table listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing users from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    print_next_page(all_user, limit)
 
 
 @app.command()
-def list_all_loan() -> None:
+def list_all_loan(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Show all loans within the library database."""
-    try:
-        get_database()
-        all_loan, column_name = lib.list_all_loan()
-        if len(all_loan) == 0:
-            typer.secho("There are no loan in the table yet. Please add one first.", fg=typer.colors.RED)
-            raise typer.Exit()
-        print_table("Loan", all_loan, column_name)
+    get_database()
+    all_loan, column_name = lib.list_all_loan(after, limit)
+    if print_table("Loan", all_loan, column_name,
+                   "There are no loan in the table yet. Please add one first."):
         typer.secho(f"\nLoan table listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing loans from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    print_next_page(all_loan, limit)
 
 
 @app.command()
 def show_genre_with_most_book() -> None:
     """Show the genre which have the most books stored in the library database."""
-    try:
-        get_database()
-        genre_name, book_number, genre_with_book, column_names = lib.genre_with_most_book()
-        print_table(f"\nGenre {genre_name} has the most book in the library: {book_number}", genre_with_book,
-                    column_names)
-        typer.secho(f"\nInformation listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing genre with the most books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    genre_name, book_number, genre_with_book, column_names = lib.genre_with_most_book()
+    print_table(f"\nGenre {genre_name} has the most book in the library: {book_number}", genre_with_book,
+                column_names)
+    typer.secho(f"\nInformation listed successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
 def show_author_with_most_book() -> None:
     """Show the author which have the most books stored in the library database."""
-    try:
-        get_database()
-        author_name, book_number, author_with_book, column_names = lib.author_with_most_book()
-        print_table(f"\nAuthor {author_name} has the most book in the library: {book_number}", author_with_book,
-                    column_names)
-        typer.secho(f"\nInformation listed successfully.", fg=typer.colors.GREEN)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing author with the most books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    author_name, book_number, author_with_book, column_names = lib.author_with_most_book()
+    print_table(f"\nAuthor {author_name} has the most book in the library: {book_number}", author_with_book,
+                column_names)
+    typer.secho(f"\nInformation listed successfully.", fg=typer.colors.GREEN)
 
 
 @app.command()
-def show_book_in_series() -> None:
+def top_genres(n: int = typer.Option(10, "--n", min=1, help="How many places to show; ties share a place.")) -> None:
+    """Show the genres with the most books, with tied genres sharing a rank."""
+    get_database()
+    top_genre, column_names = lib.top_genres(n)
+    print_table(f"Top {n} genres by number of books", top_genre, column_names, "There are no books in the library yet.")
+
+
+@app.command()
+def top_authors(n: int = typer.Option(10, "--n", min=1, help="How many places to show; ties share a place.")) -> None:
+    """Show the authors with the most books, with tied authors sharing a rank."""
+    get_database()
+    top_author, column_names = lib.top_authors(n)
+    print_table(f"Top {n} authors by number of books", top_author, column_names, "There are no books in the library yet.")
+
+
+@app.command()
+def show_book_in_series(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List the books which belongs to a series in the library database."""
-    try:
-        get_database()
-        series_book, column_names = lib.book_in_series()
-        print_table("Series books", series_book, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing series books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    series_book, column_names = lib.book_in_series(after, limit)
+    print_table("Series books", series_book, column_names)
+    print_next_page(series_book, limit)
 
 
 @app.command()
-def show_book_not_in_series() -> None:
+def show_book_not_in_series(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List the books which does not belong to a series in the library database."""
-    try:
-        get_database()
-        non_series_book, column_names = lib.book_not_in_series()
-        print_table("Non-series books", non_series_book, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing non-series books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    non_series_book, column_names = lib.book_not_in_series(after, limit)
+    print_table("Non-series books", non_series_book, column_names)
+    print_next_page(non_series_book, limit)
 
 
 @app.command()
-def list_available_book() -> None:
+def list_available_book(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List the books that are available for loan in the library database."""
-    try:
-        get_database()
-        available_book, column_names = lib.available_books_for_loan()
-        print_table("Available book(s) for loan", available_book, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing available books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    available_book, column_names = lib.available_books_for_loan(after, limit)
+    print_table("Available book(s) for loan", available_book, column_names)
+    print_next_page(available_book, limit)
 
 
 @app.command()
-def list_non_available_book() -> None:
+def list_non_available_book(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List the books that are not available for loan in the library database."""
-    try:
-        get_database()
-        non_available_book, column_names = lib.non_available_books_for_loan()
-        print_table("Non-available book(s) for loan", non_available_book, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while listing non-available books from the database: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    non_available_book, column_names = lib.non_available_books_for_loan(after, limit)
+    print_table("Non-available book(s) for loan", non_available_book, column_names)
+    print_next_page(non_available_book, limit)
 
 
 @app.command()
 def check_available_book(title: str = typer.Option(..., prompt="Title")) -> None:
     """Check if a specific book is available for loan or not."""
-    try:
-        get_database()
-        book_status = lib.check_if_available(title)
-        if book_status == "Available":
-            typer.secho(f"The book {title} is available for loan.", fg=typer.colors.GREEN)
-        elif book_status == "Not Available":
-            typer.secho(f"The book {title} is unavailable for loan.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking available of book: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    book_status = lib.check_if_available(title)
+    if book_status == "Available":
+        typer.secho(f"The book {title} is available for loan.", fg=typer.colors.GREEN)
+    elif book_status == "Not Available":
+        typer.secho(f"The book {title} is unavailable for loan.", fg=typer.colors.RED)
+    else:
+        typer.secho(f"Book {title} doesn't exist. Please enter another book's title.", fg=typer.colors.RED)
 
 
 @app.command()
-def check_user_with_loan() -> None:
+def check_user_with_loan(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Check which user is currently borrowing books from the library."""
-    try:
-        get_database()
-        user_with_loan, column_names = lib.user_with_loan()
-        print_table(f"The users which are currently borrowing books from library:", user_with_loan, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking user's loan status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    user_with_loan, column_names = lib.user_with_loan(after, limit)
+    print_table(f"The users which are currently borrowing books from library:", user_with_loan, column_names)
+    print_next_page(user_with_loan, limit)
 
 
 @app.command()
-def check_returned_loan() -> None:
+def check_returned_loan(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Check which loan is returned."""
-    try:
-        get_database()
-        loan_list, column_names = lib.returned_loan()
-        print_table("Loans that have been returned.", loan_list, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    loan_list, column_names = lib.returned_loan(after, limit)
+    print_table("Loans that have been returned.", loan_list, column_names)
+    print_next_page(loan_list, limit)
 
 
 @app.command()
-def check_overdue_loan() -> None:
+def check_overdue_loan(after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """Check which loan is overdue."""
-    try:
-        get_database()
-        loan_list, column_names = lib.overdue_loan()
-        print_table("Loans that is overdue.", loan_list, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    loan_list, column_names = lib.overdue_loan(after=after, limit=limit)
+    print_table("Loans that is overdue.", loan_list, column_names)
+    print_next_page(loan_list, limit)
+
+
+@app.command()
+def overdue(as_of: Optional[str] = typer.Option(None, "--as-of", help="Day to check against (YYYY-MM-DD); defaults to today."),
+            window: int = typer.Option(0, min=0, help="Only loans that fell due in the last N days; 0 lists all."),
+            after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
+    """List loans that are overdue on a given day, optionally only the recently overdue ones."""
+    get_database()
+    loan_list, column_names = lib.overdue_loan(as_of, window, after, limit)
+    print_table(f"Loans overdue as of {as_of or 'today'}.", loan_list, column_names, "No loans are overdue.")
+    print_next_page(loan_list, limit)
 
 
 @app.command()
 def search_genre(genre_name: str = typer.Option(..., prompt="Genre name")) -> None:
     """Search if a specific genre exists in the library database."""
-    try:
-        get_database()
-        exist = lib.search_genre(genre_name)
-        if exist:
-            typer.secho("Genre does exist.", fg=typer.colors.GREEN)
-        else:
-            typer.secho("Genre doesn't exist. Please enter another genre's name.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    exist = lib.search_genre(genre_name)
+    if exist:
+        typer.secho("Genre does exist.", fg=typer.colors.GREEN)
+    else:
+        typer.secho("Genre doesn't exist. Please enter another genre's name.", fg=typer.colors.RED)
 
 
 @app.command()
 def search_author(author_name: str = typer.Option(..., prompt="Author name")) -> None:
     """Search if a specific author exists in the library database."""
-    try:
-        get_database()
-        exist = lib.search_author(author_name)
-        if exist:
-            typer.secho("Author does exist.", fg=typer.colors.GREEN)
-        else:
-            typer.secho("Author doesn't exist. Please enter another author's name.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    exist = lib.search_author(author_name)
+    if exist:
+        typer.secho("Author does exist.", fg=typer.colors.GREEN)
+    else:
+        typer.secho("Author doesn't exist. Please enter another author's name.", fg=typer.colors.RED)
 
 
 @app.command()
 def search_book(book_title: str = typer.Option(..., prompt="Book title")) -> None:
     """Search if a specific book exists in the library database."""
-    try:
-        get_database()
-        exist = lib.search_book(book_title)
-        if exist:
-            typer.secho("Book does exist.", fg=typer.colors.GREEN)
-        else:
-            typer.secho("Book doesn't exist. Please enter another book's title.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    exist = lib.search_book(book_title)
+    if exist:
+        typer.secho("Book does exist.", fg=typer.colors.GREEN)
+    else:
+        typer.secho("Book doesn't exist. Please enter another book's title.", fg=typer.colors.RED)
 
 
 @app.command()
 def search_user(user_name: str = typer.Option(..., prompt="User's name")) -> None:
     """Search if a specific user exists in the library database."""
-    try:
-        get_database()
-        exist = lib.search_user(user_name)
-        if exist:
-            typer.secho("User does exist.", fg=typer.colors.GREEN)
-        else:
-            typer.secho("User doesn't exist. Please enter another user's name.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    exist = lib.search_user(user_name)
+    if exist:
+        typer.secho("User does exist.", fg=typer.colors.GREEN)
+    else:
+        typer.secho("User doesn't exist. Please enter another user's name.", fg=typer.colors.RED)
 
 
 @app.command()
 def search_loan(user_name: str = typer.Option(..., prompt="User's name"),
                 book_title: str = typer.Option(..., prompt="Book's title")) -> None:
     """Search if a specific loan exists in the library database."""
-    try:
-        get_database()
-        exist = lib.search_loan(user_name, book_title)
-        if exist:
-            typer.secho("Loan does exist.", fg=typer.colors.GREEN)
-        else:
-            typer.secho("Loan doesn't exist. Please enter another loan's information.", fg=typer.colors.RED)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    exist = lib.search_loan(user_name, book_title)
+    if exist:
+        typer.secho("Loan does exist.", fg=typer.colors.GREEN)
+    else:
+        typer.secho("Loan doesn't exist. Please enter another loan's information.", fg=typer.colors.RED)
+
+
+@app.command()
+def find(text: str = typer.Argument(..., help="Words to look for in titles, series, author and genre names."),
+         after: int = typer.Option(0, help="Show the matches ranked after this book ID (the cursor printed "
+                                           "with the previous page)."),
+         limit: int = typer.Option(20, help="Maximum number of matches to list; -1 lists everything.")) -> None:
+    """Find books by any part of their title, series, author or genre, best matches first."""
+    get_database()
+    book_list, column_names = lib.find_books(text, after, limit)
+    print_table(f"Books matching {text!r}:", book_list, column_names)
+    print_next_page(book_list, limit)
 
 
 @app.command()
-def search_by_genre(genre: str = typer.Option(..., prompt="Genre's name")) -> None:
+def search_by_genre(genre: str = typer.Option(..., prompt="Genre's name"),
+                    after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List books within a specific genre in the library database."""
-    try:
-        get_database()
-        book_list, column_names = lib.search_book_by_genre(genre)
-        print_table(f"Books under genre {genre} are:", book_list, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
-        raise typer.Exit()
+    get_database()
+    book_list, column_names = lib.search_book_by_genre(genre, after, limit)
+    print_table(f"Books under genre {genre} are:", book_list, column_names)
+    print_next_page(book_list, limit)
 
 
 @app.command()
-def search_by_author(author: str = typer.Option(..., prompt="Author's name")) -> None:
+def search_by_author(author: str = typer.Option(..., prompt="Author's name"),
+                     after: int = AFTER_OPTION, limit: int = LIMIT_OPTION) -> None:
     """List books within a specific author in the library database."""
+    get_database()
+    book_list, column_names = lib.search_book_by_author(author, after, limit)
+    print_table(f"Books under author {author} are:", book_list, column_names)
+    print_next_page(book_list, limit)
+
+
+@app.command()
+def serve(host: str = typer.Option("127.0.0.1", help="Interface to listen on."),
+          port: int = typer.Option(8765, help="Port to listen on."),
+          concurrent: bool = typer.Option(False, help="Use WAL and answer reads in parallel with one writer."),
+          metrics_port: int = typer.Option(0, min=0, help="Serve Prometheus metrics on 127.0.0.1 at this port."),
+          metrics_file: str = typer.Option(None, help="Write Prometheus metrics to this file, e.g. for a textfile collector."),
+          metrics_interval: float = typer.Option(15.0, min=0.1, help="Seconds between metrics file writes."),
+          group_commit: bool = typer.Option(False, help="Commit adds and updates from concurrent requests in batches."),
+          commit_delay_ms: float = typer.Option(1.0, min=0, help="Longest a write waits for its batch to fill."),
+          commit_batch: int = typer.Option(256, min=1, help="Writes per batch at most.")) -> None:
+    """Keep the library open and answer commands from other terminals over HTTP/JSON."""
+    from library import server
+    try:
+        from library.instrument import persist_at_exit
+        typer.secho(f"Serving the library on http://{host}:{port} (Ctrl+C to stop).", fg=typer.colors.GREEN)
+        if metrics_port:
+            typer.secho(f"Metrics on http://127.0.0.1:{metrics_port}/metrics", fg=typer.colors.GREEN)
+        persist_at_exit()
+        server.serve(host, port, concurrent, metrics_port, metrics_file, metrics_interval, group_commit,
+                     commit_delay_ms / 1000, commit_batch)
+    except OSError as e:
+        typer.secho(f"Error while starting the library server: {e}.", fg=typer.colors.RED)
+        raise typer.Exit()
+
+
+@app.command()
+def shell() -> None:
+    """Run commands on one open database, with tab completion of titles, authors, genres and users."""
+    global shell_library
+    from library.shell import run_shell
+    try:
+        get_database(remote=False)
+        shell_library = lib
+        run_shell(typer.main.get_command(app), lib._dbhandler)
+    finally:
+        shell_library = None
+
+
+@app.command()
+def snapshot(path: str = typer.Argument(..., help="File to write the copy to; replaced if it exists."),
+             pages: int = typer.Option(256, min=1, help="Pages copied per step."),
+             sleep: float = typer.Option(0.005, min=0, help="Seconds to pause between steps so writers get in.")) -> None:
+    """Take a consistent copy of the database while it stays open for writes."""
+    import time
+    get_database(remote=False)
+    started = time.perf_counter()
+
+    def progress(status, remaining, total):
+        typer.echo(f"\rCopied {total - remaining}/{total} pages", nl=False)
+
+    lib.snapshot(path, pages, sleep, progress)
+    typer.secho(f"\nSnapshot written to {path} in {time.perf_counter() - started:.2f}s. "
+                f"Read it with: python -m library --snapshot {path} <command>", fg=typer.colors.GREEN)
+
+
+@app.command()
+def stats(top: int = typer.Option(10, min=1, help="Statements to list, by total time."),
+          reset: bool = typer.Option(False, help="Clear the aggregates after printing them.")) -> None:
+    """Show per-method and per-statement query latency, rows and lock waits."""
+    import os
+    from library.client import connect_server
+    from library.instrument import Histogram, load_stats, stats_path, summarize
+    server = connect_server()
+    if server is not None:
+        source = "the running server"
+        data = server.stats(reset)
+    else:
+        path = stats_path()
+        source = path or "this process (set LIBRARY_STATS_FILE to keep them between commands)"
+        data = load_stats(path) if path else {}
+        if reset and path and os.path.exists(path):
+            os.remove(path)
+    if not data.get("methods"):
+        typer.secho(f"No queries recorded yet in {source}.", fg=typer.colors.RED)
+        raise typer.Exit()
+
+    methods, statements = summarize(data, top)
+    typer.secho(f"Query statistics from {source}; times in ms.", fg=typer.colors.GREEN)
+    print_table("Database methods", methods, ["Method", "Calls", "p50", "p95", "p99", "Max", "Total", "Errors"])
+    print_table(f"Top {top} statements by total time", statements,
+                ["Statement", "Calls", "p50", "p95", "p99", "Max", "Total", "Rows", "Errors"])
+    waits = Histogram()
+    waits.merge(data["lock_waits"])
+    typer.echo(f"\nWrite lock waits: {waits.count} (p99 {waits.percentile(99) * 1000:.2f} ms, "
+               f"max {waits.max * 1000:.2f} ms), busy retries: {data['busy_retries']}")
+
+
+@app.command()
+def check_plans(update: bool = typer.Option(False, help="Accept the current plans as the new allowlist."),
+                allowlist: str = typer.Option("", help="Allowlist file; defaults to the one shipped with the library."),
+                books: int = typer.Option(2000, min=1, help="Books in the generated database the plans are taken on."),
+                verbose: bool = typer.Option(False, help="Print every statement's full plan.")) -> None:
+    """Fail if a database query plan gains a full table scan or temporary B-tree that isn't allowlisted."""
+    import sqlite3
+    from library.plancheck import ALLOWLIST, check_plans as run_check, save_allowlist
+    path = allowlist or ALLOWLIST
+    try:
+        report = run_check(path, books)
+    except sqlite3.Error as e:
+        typer.secho(f"Error while checking query plans: {e}.", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    if verbose:
+        for method, plans in report.statements.items():
+            for sql, plan in plans.items():
+                typer.secho(f"\n{method}: {sql}", fg=typer.colors.CYAN)
+                typer.echo("\n".join(f"    {line}" for line in plan))
+    if update:
+        save_allowlist(report.findings, path)
+        typer.secho(f"Saved {sum(len(lines) for lines in report.findings.values())} allowed scan(s) to {path}.",
+                    fg=typer.colors.GREEN)
+        return
+    for method, lines in report.stale.items():
+        for line in lines:
+            typer.secho(f"No longer happens, remove from the allowlist: {method}: {line}", fg=typer.colors.YELLOW)
+    for method in report.uncovered:
+        typer.secho(f"Not checked: add {method} to CALLS or SKIPPED in library/plancheck.py.", fg=typer.colors.RED)
+    for method, lines in report.regressions.items():
+        for line in lines:
+            typer.secho(f"New full scan or temporary B-tree: {method}: {line}", fg=typer.colors.RED)
+    if not report.ok:
+        raise typer.Exit(1)
+    typer.secho(f"Query plans match {path}.", fg=typer.colors.GREEN)
+
+
+@app.command()
+def generate(path: str = typer.Argument(..., help="New database file to create."),
+             books: int = typer.Option(100000, min=1),
+             authors: int = typer.Option(0, min=0, help="Defaults to one author per 20 books."),
+             users: int = typer.Option(0, min=0, help="Defaults to one user per 10 books."),
+             loans: int = typer.Option(0, min=0, help="Defaults to five loans per book."),
+             genres: int = typer.Option(40, min=1),
+             active: float = typer.Option(0.05, min=0, max=1, help="Share of loans still out and not yet due."),
+             overdue: float = typer.Option(0.02, min=0, max=1, help="Share of loans still out past their due date."),
+             start: str = typer.Option("", help="First loan date, YYYY-MM-DD; defaults to ten years before --end."),
+             end: str = typer.Option("", help="Date the loans are generated as of, YYYY-MM-DD; defaults to today."),
+             seed: int = typer.Option(0, help="The same seed and options always generate the same database.")) -> None:
+    """Fill a new database with realistic synthetic data for testing at scale."""
+    import os
+    import sqlite3
+    import time
+    from datetime import date
+    from library.generator import generate as generate_database
+    from library.library import to_day
+    if os.path.exists(path):
+        typer.secho(f"{path} already exists. Please choose a new file.", fg=typer.colors.RED)
+        raise typer.Exit()
+    if active + overdue > 1:
+        typer.secho("--active and --overdue can't add up to more than 1.", fg=typer.colors.RED)
+        raise typer.Exit()
+    try:
+        end_day = to_day(end) if end else to_day(date.today().isoformat())
+        start_day = to_day(start) if start else end_day - 3652
+    except ValueError:
+        typer.secho("Please enter dates as YYYY-MM-DD.", fg=typer.colors.RED)
+        raise typer.Exit()
+    if start_day >= end_day:
+        typer.secho("--start must be before --end.", fg=typer.colors.RED)
+        raise typer.Exit()
+
+    started = time.perf_counter()
+
+    current = []
+
+    def progress(name, count):
+        # One line per table, rewritten as batches go in, then one line per index built.
+        if current and current[-1] != name:
+            typer.echo()
+        current.append(name)
+        typer.echo(f"\rBuilt index {name}" if count is None else f"\r{name}: {count:,} rows", nl=False)
+
+    try:
+        counts = generate_database(path, genres, authors or max(books // 20, 1), books, users or max(books // 10, 1),
+                                   loans if loans else books * 5, active, overdue, start_day, end_day, seed, progress)
+    except sqlite3.Error as e:
+        typer.secho(f"\nError while generating the database: {e}.", fg=typer.colors.RED)
+        raise typer.Exit()
+    typer.echo()
+    typer.secho(f"Generated {', '.join(f'{count:,} {table}' for table, count in counts.items())} rows "
+                f"in {path} in {time.perf_counter() - started:.1f}s.", fg=typer.colors.GREEN)
+
+
+@app.command()
+def export(table: str = typer.Argument(..., help="genre, author, book, user, loan, book-view or loan-view."),
+           path: str = typer.Argument(..., help="File to write; replaced if it exists."),
+           file_format: str = typer.Option("csv", "--format", help="csv, ndjson or columnar."),
+           gzip: bool = typer.Option(False, "--gzip", help="Compress the output with gzip."),
+           since: int = typer.Option(0, help="Only export rows with a rowid above this (the cursor printed by the "
+                                             "previous export).")) -> None:
+    """Stream a table or joined view to a CSV, NDJSON or columnar file."""
+    import time
+    from library.exporter import EXPORT_FORMATS, export_rows
+    if file_format not in EXPORT_FORMATS:
+        typer.secho(f"Unknown format {file_format}. Please enter one of: {', '.join(EXPORT_FORMATS)}.",
+                    fg=typer.colors.RED)
+        raise typer.Exit()
+    try:
+        get_database(remote=False)
+        started = time.perf_counter()
+        rows, column_names = lib.export_rows(table.lower(), since)
+        count = export_rows(path, rows, column_names, file_format, gzip)
+        typer.secho(f"Exported {count} row(s) of {table} to {path} in {time.perf_counter() - started:.2f}s.",
+                    fg=typer.colors.GREEN)
+        typer.secho(f"Next incremental export: --since {rows.last_key if count else since}", fg=typer.colors.CYAN)
+    except OSError as e:
+        typer.secho(f"Error while exporting {table}: {e}.", fg=typer.colors.RED)
+        raise typer.Exit()
+
+
+BRANCH_REPORTS = ["list_all_book", "list_all_author", "list_all_genre", "list_all_user", "list_all_loan",
+                  "book_in_series", "book_not_in_series", "available_books_for_loan",
+                  "non_available_books_for_loan", "user_with_loan", "returned_loan", "overdue_loan"]
+
+
+@app.command()
+def branch_add(name: str = typer.Option(..., prompt="Branch name"),
+               path: str = typer.Option(..., prompt="Branch database path")) -> None:
+    """Register a branch database for cross-branch queries."""
+    from library.federation import load_branches, registry_path, save_branches
+    branches = load_branches()
+    branches[name] = path
+    save_branches(branches)
+    typer.secho(f"Branch {name} registered in {registry_path()}.", fg=typer.colors.GREEN)
+
+
+@app.command()
+def branch_remove(name: str = typer.Option(..., prompt="Branch name")) -> None:
+    """Remove a branch from the registry; its database is left alone."""
+    from library.federation import load_branches, save_branches
+    branches = load_branches()
+    if branches.pop(name, None) is None:
+        typer.secho(f"Branch {name} isn't registered.", fg=typer.colors.RED)
+        raise typer.Exit()
+    save_branches(branches)
+    typer.secho(f"Branch {name} removed.", fg=typer.colors.GREEN)
+
+
+@app.command()
+def branch_list() -> None:
+    """List the registered branches and their database paths."""
+    from library.federation import load_branches
+    print_table("Branches", [(name, path) for name, path in load_branches().items()], ["Branch", "Path"],
+                "No branches registered yet. Add one with branch-add.")
+
+
+def run_across_branches(title: str, method: str, *args, **kwargs):
+    """Fan a query out over every registered branch, print the merged rows, then each branch's latency."""
+    from library.federation import Federation, load_branches
+    branches = load_branches()
+    if not branches:
+        typer.secho("No branches registered yet. Add one with branch-add.", fg=typer.colors.RED)
+        raise typer.Exit()
+    federation = Federation(branches)
     try:
-        get_database()
-        book_list, column_names = lib.search_book_by_author(author)
-        print_table(f"Books under author {author} are:", book_list, column_names)
-    except sqlite3.Error as e:
-        typer.secho(f"Error while checking loan's status: {e}.", fg=typer.colors.RED)
+        rows, column_names, results = federation.query(method, *args, **kwargs)
+    except LibraryError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
         raise typer.Exit()
+    finally:
+        federation.close()
+    print_table(title, rows, column_names)
+    typer.echo("")
+    for result in results:
+        if result.error:
+            typer.secho(f"{result.branch}: {result.elapsed * 1000:.1f} ms, failed: {result.error}",
+                        fg=typer.colors.YELLOW)
+        else:
+            typer.secho(f"{result.branch}: {result.elapsed * 1000:.1f} ms, {len(result.rows)} row(s)")
+
+
+@app.command()
+def where_available(title: str = typer.Option(..., prompt="Title")) -> None:
+    """Show which branches have a book and whether their copy is available for loan."""
+    run_across_branches(f"Copies of {title}:", "check_if_available", title)
+
+
+@app.command()
+def branch_search_by_author(author: str = typer.Option(..., prompt="Author's name"),
+                            limit: int = typer.Option(-1, help="Maximum number of books per branch; -1 lists all.")) -> None:
+    """List an author's books in every branch."""
+    run_across_branches(f"Books by {author} across branches:", "search_book_by_author", author, limit=limit)
+
+
+@app.command()
+def branch_report(report: str = typer.Argument(..., help=f"One of: {', '.join(BRANCH_REPORTS)}."),
+                  limit: int = typer.Option(-1, help="Maximum number of rows per branch; -1 lists all.")) -> None:
+    """Run a list or report query on every branch and merge the results."""
+    if report not in BRANCH_REPORTS:
+        typer.secho(f"Unknown report {report}. Please enter one of: {', '.join(BRANCH_REPORTS)}.",
+                    fg=typer.colors.RED)
+        raise typer.Exit()
+    run_across_branches(f"{report} across branches:", report, limit=limit)
 
 
 def _version_callback(value: bool) -> None:
@@ -587,17 +915,44 @@ def main(
             help="Show the application's version and exit,",
             callback=_version_callback,
             is_eager=True,
-        )
+        ),
+        snapshot: Optional[str] = typer.Option(
+            None,
+            "--snapshot",
+            help="Read from this snapshot (see the snapshot command) instead of the live database; writes fail.",
+        ),
 ) -> None:
-    return
-
-
-def print_table(table_name: str, table_content, column_name):
-    column_width = [max(len(str(item[i])) for item in table_content) for i in range(len(column_name))]
+    global snapshot_path
+    snapshot_path = snapshot
+
+
+def print_next_page(rows, limit: int):
+    """Tell the user how to fetch the next page when a --limit page came back full."""
+    if isinstance(rows, list):
+        next_after = rows[-1][0] if 0 < limit == len(rows) else None
+    else:
+        next_after = rows.next_after
+    if next_after is not None:
+        typer.secho(f"\nMore results available: add --after {next_after} for the next page.", fg=typer.colors.CYAN)
+
+
+def print_table(table_name: str, table_content, column_name, empty_message: str = "No records found.") -> int:
+    """Print rows as they are fetched, sizing columns from the header and the first batch of rows."""
+    from library.importer import chunked
+    rows = iter(table_content)
+    sample = list(islice(rows, TABLE_BATCH))
+    if not sample:
+        typer.secho(empty_message, fg=typer.colors.RED)
+        return 0
+    column_width = [max([len(str(name))] + [len(str(row[i])) for row in sample]) for i, name in enumerate(column_name)]
     header = " | ".join(f"{column_name[i]:{column_width[i]}}" for i in range(len(column_name)))
 
     typer.secho(f"\n{table_name}\n", fg=typer.colors.CYAN, bold=True)
     typer.secho(header)
     typer.secho("-" * len(header))
-    for row in table_content:
-        typer.secho(" | ".join(f"{str(row[i]):{column_width[i]}}" for i in range(len(row))))
+    count = 0
+    for batch in chain([sample], chunked(rows, TABLE_BATCH)):
+        typer.echo("\n".join(" | ".join(f"{str(value):{width}}" for value, width in zip(row, column_width))
+                             for row in batch))
+        count += len(batch)
+    return count
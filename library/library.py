@@ -2,35 +2,103 @@
 # library.py
 
 import sqlite3
-from typing import List
+from datetime import date
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+from library.cache import ResolutionCache
+from library.database import BooksUnavailable, DatabaseHandler
+from library.errors import LibraryError
+from library.importer import ImportReport, chunked, numbered
+from library.metrics import METRICS, instrument_operations
+
+if TYPE_CHECKING:
+    from library.writequeue import WriteQueue
+
+# The trigram full-text index can't match anything shorter than this.
+MIN_SEARCH_TERM = 3
+EPOCH = date(1970, 1, 1)
+# Export sources: whole tables, or the joined views that list-all-book and list-all-loan print.
+EXPORT_TABLES = {"genre": "Genre", "author": "Author", "book": "Book", "user": "User", "loan": "Loan"}
+EXPORT_VIEWS = ("book-view", "loan-view")
+# Fields that updates and patch files may set, per table: field -> (column, kind of name or value to resolve).
+PATCH_FIELDS = {
+    "genre": {"name": ("GenreName", None)},
+    "author": {"first_name": ("FirstName", None), "last_name": ("LastName", None), "birthday": ("Birthday", None)},
+    "book": {"title": ("Title", None), "genre": ("Genre_ID", "genre"), "series": ("Series", None),
+             "author": ("Author_ID", "author"), "status": ("LoanStatus", None)},
+    "user": {"first_name": ("FirstName", None), "last_name": ("LastName", None), "address": ("Address", None),
+             "email": ("Email", None), "phone": ("PhoneNumber", None)},
+    "loan": {"title": ("Book_ID", "book"), "user": ("User_ID", "user"), "loan_day": ("LoanDate", "day"),
+             "due_day": ("DueDate", "day"), "return_day": ("DateReturn", "day"), "status": ("LoanStatus", None)},
+}
+
+
+def to_day(value: str) -> int:
+    """Turn a YYYY-MM-DD date into the day number (days since 1970-01-01) that the Loan table stores."""
+    return (date.fromisoformat(value) - EPOCH).days
+
+
+@instrument_operations
+class Library:
+    def __init__(self, concurrent: bool = False, path: Optional[str] = None, read_only: bool = False,
+                 write_queue: Optional["WriteQueue"] = None, immutable: bool = True):
+        try:
+            self._dbhandler = DatabaseHandler(concurrent, path, read_only, write_queue, immutable)
+            self._dbhandler.init_table()
+            self._id_cache = ResolutionCache()
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while connecting to database: {e}") from e
 
-import typer
+    @staticmethod
+    def _day(value: str) -> int:
+        try:
+            return to_day(value)
+        except ValueError:
+            raise LibraryError(f"Please enter dates as YYYY-MM-DD, not {value}.")
 
-from library.database import DatabaseHandler
+    def _cached_id(self, key: tuple):
+        self._id_cache.sync(self._dbhandler.data_version())
+        return self._id_cache.get(key)
 
+    def cache_stats(self) -> dict:
+        return self._id_cache.stats()
 
-class Library:
-    def __init__(self):
+    def snapshot(self, target_path: str, pages: int, sleep: float, progress=None):
+        self._dbhandler.snapshot(target_path, pages, sleep, progress)
+
+    def stats(self, reset: bool = False) -> dict:
+        """Return the query aggregates collected by this process, optionally starting them afresh."""
+        from library.instrument import STATS
+        data = STATS.as_dict()
+        if reset:
+            STATS.reset()
+        return data
+
+    def export_rows(self, source: str, since: int = 0):
+        """Stream a table or view for export, starting after rowid `since`; the first column is the rowid."""
         try:
-            self._dbhandler = DatabaseHandler()
-            self._dbhandler.init_table()
+            if source == "book-view":
+                return self._dbhandler.list_all_book(since)
+            if source == "loan-view":
+                return self._dbhandler.list_all_loan(since)
+            if source not in EXPORT_TABLES:
+                raise LibraryError(f"Unknown table {source}. Please enter one of: "
+                                   f"{', '.join(list(EXPORT_TABLES) + list(EXPORT_VIEWS))}.")
+            return self._dbhandler.export_table(EXPORT_TABLES[source], since)
         except sqlite3.Error as e:
-            typer.secho(f"Error while connecting to database: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def add_genre(self, genre: str):
         try:
             self._dbhandler.add_genre(genre)
         except sqlite3.Error as e:
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_author(self, first_name: str, last_name: str, birthday: str):
         try:
             self._dbhandler.add_author(first_name, last_name, birthday)
         except sqlite3.Error as e:
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_book(self, book_title: str, genre: str, series: str, author: str):
         try:
@@ -39,127 +107,366 @@ class Library:
             author_id = self.get_author_id(first_name, last_name)
             self._dbhandler.add_book(book_title, genre_id, series, author_id)
         except sqlite3.Error as e:
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_user(self, first_name: str, last_name: str, address: str, email: str, phone_num: str):
         try:
             self._dbhandler.add_user(first_name, last_name, address, email, phone_num)
         except sqlite3.Error as e:
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while adding information: {e}") from e
 
     def add_loan(self, book_title: str, user: str, loan_day: str, due_day: str):
         try:
             book_id = self.get_book_id(book_title)
             first_name, last_name = user.split(maxsplit=1)
             user_id = self.get_user_id(first_name, last_name)
-            self._dbhandler.add_loan(book_id, user_id, loan_day, due_day)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while adding information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            self._dbhandler.add_loan(book_id, user_id, self._day(loan_day), self._day(due_day))
+            METRICS.loan_created()
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while adding information: {e}") from e
+
+    def checkout(self, user: str, books: List[str], loan_day: str, due_day: str) -> List[str]:
+        """Lend every book in `books` to `user` in one transaction, or none of them if any is out.
+
+        `user` is a name or a User_ID and `books` are titles or Book_IDs. Returns the titles or
+        IDs as given, in order.
+        """
+        user_id = self._resolve_user(user)
+        book_ids = self._resolve_books(books)
+        try:
+            claimed = self._dbhandler.checkout(list(book_ids.values()), user_id, self._day(loan_day),
+                                               self._day(due_day))
+        except BooksUnavailable as e:
+            names = [book for book, book_id in book_ids.items() if book_id in e.book_ids]
+            raise LibraryError(f"Nothing was lent: {', '.join(names)} "
+                               f"{'is' if len(names) == 1 else 'are'} not available.")
+        METRICS.loan_created(len(claimed))
+        return list(book_ids)
+
+    def checkin(self, books: List[str], return_day: str, user: Optional[str] = None) -> tuple:
+        """Return a batch of books in one transaction; with `user`, only books lent to that user.
+
+        Returns (books returned, books that weren't out), as given.
+        """
+        user_id = self._resolve_user(user) if user else 0
+        book_ids = self._resolve_books(books)
+        returned = set(self._dbhandler.checkin(list(book_ids.values()), self._day(return_day), user_id))
+        METRICS.loan_returned(len(returned))
+        return ([book for book, book_id in book_ids.items() if book_id in returned],
+                [book for book, book_id in book_ids.items() if book_id not in returned])
+
+    def _resolve_user(self, user: str) -> int:
+        name = self._split_name(user)
+        if name is None and user.isdigit():
+            if not self._dbhandler.info_user(int(user)):
+                raise LibraryError(f"User {user} doesn't exist. Please enter another user.")
+            return int(user)
+        if name is None:
+            raise LibraryError("Please enter the user's first and last name, or their ID.")
+        return self.get_user_id(*name)
+
+    def _resolve_books(self, books: List[str]) -> dict:
+        """Map titles or Book_IDs to Book_IDs; a number is an ID unless a book has it as its title.
+
+        Titles are looked up in one query and the remaining IDs checked in another. A book given
+        more than once, by title or by ID, is kept under the first way it was given.
+        """
+        try:
+            by_title = self._dbhandler.get_book_ids(list(set(books)))
+            numbers = {int(book) for book in books if book not in by_title and book.isdigit()}
+            existing = {book_id for book_id, _ in self._dbhandler.get_names_by_id("Book", list(numbers))}
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking id: {e}") from e
+        book_ids, seen = {}, set()
+        for book in books:
+            if book in by_title:
+                book_id = by_title[book]
+            elif book.isdigit() and int(book) in existing:
+                book_id = int(book)
+            else:
+                raise LibraryError(f"Book {book} doesn't exist. Please enter another book's title or ID.")
+            if book_id not in seen:
+                seen.add(book_id)
+                book_ids[book] = book_id
+        return book_ids
+
+    def bulk_add_genres(self, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        return self._bulk_add("genre", records, self._genre_rows, self._dbhandler.bulk_add_genre, commit_every)
+
+    def bulk_add_authors(self, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        return self._bulk_add("author", records, self._author_rows, self._dbhandler.bulk_add_author, commit_every)
+
+    def bulk_add_books(self, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        return self._bulk_add("book", records, self._book_rows, self._dbhandler.bulk_add_book, commit_every)
+
+    def bulk_add_users(self, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        return self._bulk_add("user", records, self._user_rows, self._dbhandler.bulk_add_user, commit_every)
+
+    def bulk_add_loans(self, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        report = self._bulk_add("loan", records, self._loan_rows, self._dbhandler.bulk_add_loan, commit_every)
+        METRICS.loan_created(report.inserted)
+        return report
+
+    def _bulk_add(self, table: str, records: Iterable[dict], build_rows, insert, commit_every: int,
+                  skipped: str = "duplicate or constraint violation") -> ImportReport:
+        """Insert records chunk by chunk in one transaction, committing every `commit_every` rows if set."""
+        report = ImportReport(table)
+        pending = 0
+        try:
+            for chunk in chunked(numbered(records)):
+                rows = build_rows(chunk, report)
+                if rows:
+                    inserted = insert(rows)
+                    report.inserted += inserted
+                    if inserted < len(rows):
+                        report.reject_many(len(rows) - inserted, chunk[0][0], chunk[-1][0], skipped)
+                pending += len(chunk)
+                if commit_every and pending >= commit_every:
+                    self._dbhandler.commit()
+                    pending = 0
+            self._dbhandler.commit()
+        except (ValueError, OSError) as e:
+            self._dbhandler.rollback()
+            raise LibraryError(f"Error while reading import file: {e}") from e
+        except LibraryError:
+            # The database layer leaves the import's open transaction to us.
+            self._dbhandler.rollback()
+            raise
+        return report.finish()
+
+    @staticmethod
+    def _missing(record: dict, fields: tuple):
+        return [field for field in fields if not record.get(field)]
+
+    @staticmethod
+    def _split_name(name: str):
+        parts = name.split(maxsplit=1)
+        return tuple(parts) if len(parts) == 2 else None
+
+    def _genre_rows(self, chunk: list, report: ImportReport) -> List[tuple]:
+        rows = []
+        for line, record in chunk:
+            if self._missing(record, ("name",)):
+                report.reject(line, "missing name")
+                continue
+            rows.append((record["name"],))
+        return rows
+
+    def _author_rows(self, chunk: list, report: ImportReport) -> List[tuple]:
+        rows = []
+        for line, record in chunk:
+            missing = self._missing(record, ("first_name", "last_name"))
+            if missing:
+                report.reject(line, f"missing {', '.join(missing)}")
+                continue
+            rows.append((record["first_name"], record["last_name"], record.get("birthday") or None))
+        return rows
+
+    def _book_rows(self, chunk: list, report: ImportReport) -> List[tuple]:
+        valid = []
+        for line, record in chunk:
+            missing = self._missing(record, ("title", "genre", "author"))
+            author = self._split_name(record["author"]) if not missing else None
+            if missing or author is None:
+                report.reject(line, f"missing {', '.join(missing)}" if missing else "author needs a first and last name")
+                continue
+            valid.append((line, record, author))
+        genre_ids = self._dbhandler.get_genre_ids(list({record["genre"] for _, record, _ in valid}))
+        author_ids = self._dbhandler.get_author_ids(list({author for _, _, author in valid}))
+        rows = []
+        for line, record, author in valid:
+            if record["genre"] not in genre_ids:
+                report.reject(line, f"unknown genre {record['genre']}")
+            elif author not in author_ids:
+                report.reject(line, f"unknown author {record['author']}")
+            else:
+                rows.append((record["title"], genre_ids[record["genre"]], record.get("series") or None,
+                             author_ids[author]))
+        return rows
+
+    def _user_rows(self, chunk: list, report: ImportReport) -> List[tuple]:
+        rows = []
+        for line, record in chunk:
+            missing = self._missing(record, ("first_name", "last_name"))
+            if missing:
+                report.reject(line, f"missing {', '.join(missing)}")
+                continue
+            rows.append((record["first_name"], record["last_name"], record.get("address") or None,
+                         record.get("email") or None, record.get("phone") or None))
+        return rows
+
+    def _loan_rows(self, chunk: list, report: ImportReport) -> List[tuple]:
+        valid = []
+        for line, record in chunk:
+            missing = self._missing(record, ("title", "user", "loan_day", "due_day"))
+            user = self._split_name(record["user"]) if not missing else None
+            if missing or user is None:
+                report.reject(line, f"missing {', '.join(missing)}" if missing else "user needs a first and last name")
+                continue
+            valid.append((line, record, user))
+        book_ids = self._dbhandler.get_book_ids(list({record["title"] for _, record, _ in valid}))
+        user_ids = self._dbhandler.get_user_ids(list({user for _, _, user in valid}))
+        rows = []
+        for line, record, user in valid:
+            if record["title"] not in book_ids:
+                report.reject(line, f"unknown book {record['title']}")
+            elif user not in user_ids:
+                report.reject(line, f"unknown user {record['user']}")
+            else:
+                try:
+                    loan_day, due_day = to_day(record["loan_day"]), to_day(record["due_day"])
+                except ValueError:
+                    report.reject(line, "loan_day and due_day must be YYYY-MM-DD dates")
+                    continue
+                rows.append((book_ids[record["title"]], user_ids[user], loan_day, due_day))
+        return rows
+
+    def patch(self, table: str, row_id: int, fields: dict):
+        """Set only the given fields of one row, in a single UPDATE.
+
+        `table` and the field names are those of the import files (see PATCH_FIELDS); genres,
+        authors, books and users are given by name and dates as YYYY-MM-DD.
+        """
+        if table not in PATCH_FIELDS:
+            raise LibraryError(f"Unknown table {table}. Please enter genre, author, book, user or loan.")
+        report = ImportReport(table)
+        rows = self._patch_rows(table)([(0, dict(fields, id=row_id))], report)
+        if not rows:
+            reason = report.errors[0].split(": ", 1)[1]
+            raise LibraryError(f"Nothing was updated: {reason}.")
+        try:
+            if table != "loan":
+                self._id_cache.invalidate(table)
+            self._dbhandler.update_fields(EXPORT_TABLES[table], row_id, rows[0][1])
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while updating information: {e}") from e
+        if rows[0][1].get("LoanStatus") == "Returned":
+            METRICS.loan_returned()
+
+    def bulk_update(self, table: str, records: Iterable[dict], commit_every: int = 0) -> ImportReport:
+        """Apply patch records ({"id": ..., field: value, ...}) in one transaction; see `patch` for the fields.
+
+        Patches are grouped by the fields they set, and each group is applied with one executemany.
+        """
+        if table not in PATCH_FIELDS:
+            raise LibraryError(f"Unknown table {table}. Please enter genre, author, book, user or loan.")
+        build_rows = self._patch_rows(table)
+        returned = 0
+
+        def update(rows: List[tuple]) -> int:
+            nonlocal returned
+            returned += sum(1 for _, fields in rows if fields.get("LoanStatus") == "Returned")
+            return self._dbhandler.bulk_update(EXPORT_TABLES[table], rows)
+
+        if table != "loan":
+            self._id_cache.invalidate(table)
+        report = self._bulk_add(table, records, build_rows, update, commit_every, "unknown id or constraint violation")
+        METRICS.loan_returned(returned)
+        return report
+
+    def _patch_rows(self, table: str):
+        """Return a build_rows function that turns patch records into (row id, {column: value}) rows.
+
+        Empty values (blank CSV cells) leave a field unchanged; a JSON null clears it. Names are
+        resolved for the whole chunk in one lookup per kind, as in the imports.
+        """
+        fields = PATCH_FIELDS[table]
+
+        def build_rows(chunk: list, report: ImportReport) -> List[tuple]:
+            valid = []
+            for line, record in chunk:
+                row_id = str(record.get("id") or "")
+                patch = {field: value for field, value in record.items() if field != "id" and value != ""}
+                unknown = [field for field in patch if field not in fields]
+                if unknown:
+                    report.reject(line, f"unknown field {', '.join(unknown)}")
+                elif not row_id.isdigit():
+                    report.reject(line, "missing id")
+                elif not patch:
+                    report.reject(line, "nothing to update")
+                else:
+                    valid.append((line, int(row_id), patch))
+
+            names = {"genre": set(), "book": set(), "author": set(), "user": set()}
+            for _, _, patch in valid:
+                for field, value in patch.items():
+                    kind = fields[field][1]
+                    if kind in names and value is not None:
+                        names[kind].add(value if kind in ("genre", "book") else self._split_name(value))
+            names["author"].discard(None)
+            names["user"].discard(None)
+            ids = {"genre": self._dbhandler.get_genre_ids(list(names["genre"])),
+                   "book": self._dbhandler.get_book_ids(list(names["book"])),
+                   "author": self._dbhandler.get_author_ids(list(names["author"])),
+                   "user": self._dbhandler.get_user_ids(list(names["user"]))}
+
+            rows = {}
+            for line, row_id, patch in valid:
+                columns = {}
+                for field, value in patch.items():
+                    column, kind = fields[field]
+                    if kind is None or value is None:
+                        columns[column] = value
+                    elif kind == "day":
+                        try:
+                            columns[column] = to_day(value)
+                        except (TypeError, ValueError):
+                            break
+                    else:
+                        key = value if kind in ("genre", "book") else self._split_name(value)
+                        if key not in ids[kind]:
+                            break
+                        columns[column] = ids[kind][key]
+                else:
+                    # Patches to the same row are merged, later fields winning, as the groups
+                    # of columns aren't applied in file order.
+                    rows.setdefault(row_id, {}).update(columns)
+                    continue
+                report.reject(line, f"{field} must be a date as YYYY-MM-DD, not {value}" if kind == "day"
+                              else f"unknown {kind} {value}")
+            return list(rows.items())
+
+        return build_rows
+
+    @staticmethod
+    def _given(value: str) -> bool:
+        # The update commands take "null" (or "none") for a field that stays as it is.
+        return value not in ("null", "Null", "none", "None")
+
+    def _update(self, table: str, row_id: int, fields: dict):
+        # An update command with every field left as "null" changes nothing and says nothing.
+        if fields:
+            self.patch(table, row_id, fields)
 
     def update_genre(self, genre_id: int, new_genre: str):
-        try:
-            self._dbhandler.update_genre(genre_id, new_genre)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+        self.patch("genre", genre_id, {"name": new_genre})
 
     def update_author(self, author_id: int, new_name: str, new_birthday: str):
-        try:
-            if new_name == "null" or new_name == "Null" or new_name == "none" or new_name == "None":
-                new_firstname = "null"
-                new_lastname = "null"
-            else:
-                new_firstname, new_lastname = new_name.split(maxsplit=1)
-            if new_birthday == "null" or new_birthday == "Null" or new_birthday == "none" or new_birthday == "None":
-                new_birthday = "null"
-            self._dbhandler.update_author(author_id, new_firstname, new_lastname, new_birthday)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+        fields = {}
+        if self._given(new_name):
+            fields["first_name"], fields["last_name"] = new_name.split(maxsplit=1)
+        if self._given(new_birthday):
+            fields["birthday"] = new_birthday
+        self._update("author", author_id, fields)
 
     def update_book(self, book_id: int, new_title: str, new_genre: str, new_series: str, new_author: str,
                     new_status: str):
-        try:
-            if new_title == "null" or new_title == "Null" or new_title == "none" or new_title == "None":
-                new_title = "null"
-
-            if new_genre == "null" or new_genre == "Null" or new_genre == "none" or new_genre == "None":
-                new_genre_id = 0
-            else:
-                new_genre_id = self.get_genre_id(new_genre)
-
-            if new_series == "null" or new_series == "Null" or new_series == "none" or new_series == "None":
-                new_series = "null"
-
-            if new_author == "null" or new_author == "Null" or new_author == "none" or new_author == "None":
-                new_author_id = 0
-            else:
-                first_name, last_name = new_author.split(maxsplit=1)
-                new_author_id = self.get_author_id(first_name, last_name)
-
-            if new_status == "null" or new_status == "Null" or new_status == "none" or new_status == "None":
-                new_status = "null"
-
-            self._dbhandler.update_book(book_id, new_title, new_genre_id, new_series, new_author_id, new_status)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+        fields = {"title": new_title, "genre": new_genre, "series": new_series, "author": new_author,
+                  "status": new_status}
+        self._update("book", book_id, {field: value for field, value in fields.items() if self._given(value)})
 
     def update_user(self, user_id: int, new_name: str, new_address: str, new_email: str, new_phone: str):
-        try:
-            if new_name == "null" or new_name == "Null" or new_name == "none" or new_name == "None":
-                new_firstname = "null"
-                new_lastname = "null"
-            else:
-                new_firstname, new_lastname = new_name.split(maxsplit=1)
-
-            if new_address == "null" or new_address == "Null" or new_address == "none" or new_address == "None":
-                new_address = "null"
-
-            if new_email == "null" or new_email == "Null" or new_email == "none" or new_email == "None":
-                new_email = "null"
-
-            if new_phone == "null" or new_phone == "Null" or new_phone == "none" or new_phone == "None":
-                new_phone = "null"
-
-            self._dbhandler.update_user(user_id, new_firstname, new_lastname, new_address, new_email, new_phone)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+        fields = {"address": new_address, "email": new_email, "phone": new_phone}
+        fields = {field: value for field, value in fields.items() if self._given(value)}
+        if self._given(new_name):
+            fields["first_name"], fields["last_name"] = new_name.split(maxsplit=1)
+        self._update("user", user_id, fields)
 
     def update_loan(self, loan_id: int, new_book: str, new_user: str, new_loandate: str, new_duedate: str,
                     new_returndate: str, new_loanstatus: str):
-        try:
-            if new_book == "null" or new_book == "Null" or new_book == "none" or new_book == "None":
-                new_book_id = 0
-            else:
-                new_book_id = self.get_book_id(new_book)
-
-            if new_user == "null" or new_user == "Null" or new_user == "none" or new_user == "None":
-                new_user_id = 0
-            else:
-                new_user_id = self.get_book_id(new_book)
-
-            if new_loandate == "null" or new_loandate == "Null" or new_loandate == "none" or new_loandate == "None":
-                new_loandate = "null"
-
-            if new_duedate == "null" or new_duedate == "Null" or new_duedate == "none" or new_duedate == "None":
-                new_duedate = "null"
-
-            if new_returndate == "null" or new_returndate == "Null" or new_returndate == "none" or new_returndate == "None":
-                new_returndate = "null"
-
-            if new_loanstatus == "null" or new_loanstatus == "Null" or new_loanstatus == "none" or new_loanstatus == "None":
-                new_loanstatus = "null"
-
-            self._dbhandler.update_loan(loan_id, new_book_id, new_user_id, new_loandate, new_duedate, new_returndate,
-                                        new_loanstatus)
-        except sqlite3.Error as e:
-            typer.secho(f"Error while updating information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+        fields = {"title": new_book, "user": new_user, "loan_day": new_loandate, "due_day": new_duedate,
+                  "return_day": new_returndate, "status": new_loanstatus}
+        self._update("loan", loan_id, {field: value for field, value in fields.items() if self._given(value)})
 
     def info_genre(self, genre_id: int):
         try:
@@ -167,8 +474,7 @@ class Library:
             column_names = self._dbhandler.get_columns_name("Genre")
             return [genre, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_author(self, author_id: int):
         try:
@@ -176,16 +482,14 @@ class Library:
             column_names = self._dbhandler.get_columns_name("Author")
             return [author, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_book(self, book_id: int):
         try:
             book, column_names = self._dbhandler.info_book(book_id)
             return [book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_user(self, user_id: int):
         try:
@@ -193,143 +497,143 @@ class Library:
             column_names = self._dbhandler.get_columns_name("User")
             return [user, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def info_loan(self, loan_id: int):
         try:
             all_loan, column_names = self._dbhandler.info_loan(loan_id)
             return [all_loan, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_genre(self):
+    def list_all_genre(self, after: int = 0, limit: int = -1):
         try:
-            all_genre = self._dbhandler.list_all_genre()
-            column_names = self._dbhandler.get_columns_name("Genre")
+            all_genre, column_names = self._dbhandler.list_all_genre(after, limit)
             return [all_genre, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_author(self):
+    def list_all_author(self, after: int = 0, limit: int = -1):
         try:
-            all_author = self._dbhandler.list_all_author()
-            column_names = self._dbhandler.get_columns_name("Author")
+            all_author, column_names = self._dbhandler.list_all_author(after, limit)
             return [all_author, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_book(self):
+    def list_all_book(self, after: int = 0, limit: int = -1):
         try:
-            all_book, column_names = self._dbhandler.list_all_book()
+            all_book, column_names = self._dbhandler.list_all_book(after, limit)
             return [all_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_user(self):
+    def list_all_user(self, after: int = 0, limit: int = -1):
         try:
-            all_user = self._dbhandler.list_all_user()
-            column_names = self._dbhandler.get_columns_name("User")
+            all_user, column_names = self._dbhandler.list_all_user(after, limit)
             return [all_user, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def list_all_loan(self):
+    def list_all_loan(self, after: int = 0, limit: int = -1):
         try:
-            all_loan, column_names = self._dbhandler.list_all_loan()
+            all_loan, column_names = self._dbhandler.list_all_loan(after, limit)
             return [all_loan, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def genre_with_most_book(self):
         try:
             genre_max, genre_with_book, column_names = self._dbhandler.get_genre_with_book()
-            genre_name = genre_max[0][0]
+            if not genre_max:
+                raise LibraryError("There are no books in the library yet.")
+            # Several genres can share the top spot.
+            genre_name = ", ".join(genre for genre, _ in genre_max)
             book_number = genre_max[0][1]
             return [genre_name, book_number, genre_with_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def author_with_most_book(self):
         try:
             author_max, author_with_book, column_names = self._dbhandler.get_author_with_book()
-            author_name = author_max[0][0] + " " + author_max[0][1]
+            if not author_max:
+                raise LibraryError("There are no books in the library yet.")
+            author_name = ", ".join(first_name + " " + last_name for first_name, last_name, _ in author_max)
             book_number = author_max[0][2]
             return [author_name, book_number, author_with_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def top_genres(self, n: int):
+        try:
+            top_genre, column_names = self._dbhandler.get_top_genres(n)
+            return [top_genre, column_names]
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def book_in_series(self):
+    def top_authors(self, n: int):
         try:
-            series_book, column_names = self._dbhandler.get_series_book()
+            top_author, column_names = self._dbhandler.get_top_authors(n)
+            return [top_author, column_names]
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def book_in_series(self, after: int = 0, limit: int = -1):
+        try:
+            series_book, column_names = self._dbhandler.get_series_book(after, limit)
             return [series_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def book_not_in_series(self):
+    def book_not_in_series(self, after: int = 0, limit: int = -1):
         try:
-            non_series_book, column_names = self._dbhandler.get_non_series_book()
+            non_series_book, column_names = self._dbhandler.get_non_series_book(after, limit)
             return [non_series_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def available_books_for_loan(self):
+    def available_books_for_loan(self, after: int = 0, limit: int = -1):
         try:
-            available_book, column_names = self._dbhandler.get_available_book()
+            available_book, column_names = self._dbhandler.get_available_book(after, limit)
             return [available_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def non_available_books_for_loan(self):
+    def non_available_books_for_loan(self, after: int = 0, limit: int = -1):
         try:
-            non_available_book, column_names = self._dbhandler.get_non_available_book()
+            non_available_book, column_names = self._dbhandler.get_non_available_book(after, limit)
             return [non_available_book, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def check_if_available(self, book_title):
         try:
             book_status = self._dbhandler.check_if_available(book_title)
-            return book_status[0]
+            return book_status[0] if book_status else None
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def user_with_loan(self):
+    def user_with_loan(self, after: int = 0, limit: int = -1):
         try:
-            user_list, column_names = self._dbhandler.get_user_with_loan()
+            user_list, column_names = self._dbhandler.get_user_with_loan(after, limit)
             return [user_list, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def returned_loan(self):
+    def returned_loan(self, after: int = 0, limit: int = -1):
         try:
-            loan_list, column_names = self._dbhandler.get_returned_loan()
+            loan_list, column_names = self._dbhandler.get_returned_loan(after, limit)
             return [loan_list, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def overdue_loan(self):
+    def overdue_loan(self, as_of: Optional[str] = None, window: int = 0, after: int = 0, limit: int = -1):
         try:
-            loan_list, column_names = self._dbhandler.get_overdue_loan()
+            as_of_day = self._day(as_of) if as_of else (date.today() - EPOCH).days
+            loan_list, column_names = self._dbhandler.get_overdue_loan(as_of_day, window, after, limit)
             return [loan_list, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_genre(self, genre_name: str):
         try:
@@ -339,8 +643,7 @@ class Library:
             else:
                 return False
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_author(self, author_name: str):
         try:
@@ -351,8 +654,7 @@ class Library:
             else:
                 return False
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_book(self, book_title: str):
         try:
@@ -362,8 +664,7 @@ class Library:
             else:
                 return False
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_user(self, user_name):
         try:
@@ -374,8 +675,7 @@ class Library:
             else:
                 return False
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def search_loan(self, user_name, book_title):
         try:
@@ -388,72 +688,94 @@ class Library:
             else:
                 return False
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
+
+    def find_books(self, text: str, after: int = 0, limit: int = -1):
+        """Rank books whose title, series, author or genre contain every word of `text`."""
+        try:
+            # Quote each word so that punctuation in user input isn't read as FTS5 query syntax.
+            terms = [word for word in text.split() if len(word) >= MIN_SEARCH_TERM]
+            if not terms:
+                raise LibraryError(f"Please search for at least one word of {MIN_SEARCH_TERM} or more characters.")
+            match = " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            book_list, column_names = self._dbhandler.find_book(match, after, limit)
+            return [book_list, column_names]
+        except sqlite3.Error as e:
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def search_book_by_genre(self, genre_name: str):
+    def search_book_by_genre(self, genre_name: str, after: int = 0, limit: int = -1):
         try:
             genre_id = self.get_genre_id(genre_name)
-            book_list, column_names = self._dbhandler.search_book_by_genre(genre_id)
+            book_list, column_names = self._dbhandler.search_book_by_genre(genre_id, after, limit)
             return [book_list, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
-    def search_book_by_author(self, author_name: str):
+    def search_book_by_author(self, author_name: str, after: int = 0, limit: int = -1):
         try:
             first_name, last_name = author_name.split(maxsplit=1)
             author_id = self.get_author_id(first_name, last_name)
-            book_list, column_names = self._dbhandler.search_book_by_author(author_id)
+            book_list, column_names = self._dbhandler.search_book_by_author(author_id, after, limit)
             return [book_list, column_names]
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def get_genre_id(self, genre_name):
         try:
+            key = ("genre", genre_name)
+            cached = self._cached_id(key)
+            if cached is not None:
+                return cached
             genre_id = self._dbhandler.get_genre_id(genre_name)
             if genre_id:
+                self._id_cache.put(key, genre_id[0])
                 return genre_id[0]
             else:
-                typer.secho("Genre doesn't exist. Please enter another genre's name.", fg=typer.colors.RED)
-                raise typer.Exit()
+                raise LibraryError("Genre doesn't exist. Please enter another genre's name.")
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def get_author_id(self, first_name, last_name):
         try:
+            key = ("author", first_name, last_name)
+            cached = self._cached_id(key)
+            if cached is not None:
+                return cached
             author_id = self._dbhandler.get_author_id(first_name, last_name)
             if author_id:
+                self._id_cache.put(key, author_id[0])
                 return author_id[0]
             else:
-                typer.secho("Author doesn't exist. Please enter another author's name.", fg=typer.colors.RED)
-                raise typer.Exit()
+                raise LibraryError("Author doesn't exist. Please enter another author's name.")
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def get_book_id(self, book_name):
         try:
+            key = ("book", book_name)
+            cached = self._cached_id(key)
+            if cached is not None:
+                return cached
             book_id = self._dbhandler.get_book_id(book_name)
             if book_id:
+                self._id_cache.put(key, book_id[0])
                 return book_id[0]
             else:
-                typer.secho("Book doesn't exist. Please enter another book's title.", fg=typer.colors.RED)
-                raise typer.Exit()
+                raise LibraryError("Book doesn't exist. Please enter another book's title.")
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
 
     def get_user_id(self, first_name, last_name):
         try:
+            key = ("user", first_name, last_name)
+            cached = self._cached_id(key)
+            if cached is not None:
+                return cached
             user_id = self._dbhandler.get_user_id(first_name, last_name)
             if user_id:
+                self._id_cache.put(key, user_id[0])
                 return user_id[0]
             else:
-                typer.secho("User doesn't exist. Please enter another user's name.", fg=typer.colors.RED)
-                raise typer.Exit()
+                raise LibraryError("User doesn't exist. Please enter another user's name.")
         except sqlite3.Error as e:
-            typer.secho(f"Error while invoking information: {e}", fg=typer.colors.RED)
-            raise typer.Exit()
+            raise LibraryError(f"Error while invoking information: {e}") from e
@@ -0,0 +1,216 @@
+"""This module provides the Prometheus metrics for Library operations."""
+# metrics.py
+
+import functools
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+from library.instrument import STATS
+
+# Upper bounds, in seconds, of the operation latency histogram buckets.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    """Counters and latency histograms for every Library operation, kept in process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes: Dict[tuple, int] = {}
+        self.latency: Dict[str, List] = {}
+        self.loans_created = 0
+        self.loans_returned = 0
+
+    def observe(self, operation: str, seconds: float, failed: bool):
+        with self._lock:
+            key = (operation, "error" if failed else "ok")
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            # [per-bucket counts, sum, count]; the extra last bucket is +Inf.
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(BUCKETS)
+            histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def loan_created(self, count: int = 1):
+        with self._lock:
+            self.loans_created += count
+
+    def loan_returned(self, count: int = 1):
+        with self._lock:
+            self.loans_returned += count
+
+
+METRICS = Metrics()
+_current = threading.local()
+
+
+def timed(name: str, method):
+    """Count and time calls to a Library method; calls it makes to other Library methods aren't counted again."""
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if getattr(_current, "active", False):
+            return method(*args, **kwargs)
+        _current.active = True
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _current.active = False
+            METRICS.observe(name, time.perf_counter() - started, failed)
+
+    return wrapper
+
+
+def instrument_operations(cls):
+    for name, method in list(vars(cls).items()):
+        if callable(method) and not name.startswith("_"):
+            setattr(cls, name, timed(name, method))
+    return cls
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class LoanGauges:
+    """Open and overdue loan counts, read on their own connection and only re-read after the database changes.
+
+    Every scrape uses the same connection, whichever thread serves it: PRAGMA data_version
+    only tells that connection about commits made since its own last read.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._handler = None
+        self._lock = threading.Lock()
+        self._key = None
+        self._values = (0, 0)
+
+    def read(self) -> tuple:
+        from library.database import DatabaseHandler
+        from library.library import to_day
+        with self._lock:
+            if self._handler is None:
+                self._handler = DatabaseHandler(path=self._path)
+            # data_version changes whenever another connection commits; the day changes what is overdue.
+            key = (self._handler.data_version(), to_day(date.today().isoformat()))
+            if key != self._key:
+                self._values = self._handler.get_loan_counts(key[1])
+                self._key = key
+            return self._values
+
+
+def render(gauges: Optional[LoanGauges] = None) -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with METRICS._lock:
+        outcomes = dict(METRICS.outcomes)
+        latency = {operation: [list(h[0]), h[1], h[2]] for operation, h in METRICS.latency.items()}
+        created, returned = METRICS.loans_created, METRICS.loans_returned
+
+    metric("library_operations_total", "counter", "Library operations, by operation and outcome.")
+    for (operation, outcome), count in sorted(outcomes.items()):
+        lines.append(f"library_operations_total{_labels(operation=operation, outcome=outcome)} {count}")
+    metric("library_operation_duration_seconds", "histogram", "Latency of Library operations.")
+    for operation, (counts, total, count) in sorted(latency.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += bucket
+            lines.append(f"library_operation_duration_seconds_bucket{_labels(operation=operation, le=bound)} "
+                         f"{cumulative}")
+        lines.append(f"library_operation_duration_seconds_sum{_labels(operation=operation)} {total}")
+        lines.append(f"library_operation_duration_seconds_count{_labels(operation=operation)} {count}")
+    metric("library_loans_created_total", "counter", "Loans created.")
+    lines.append(f"library_loans_created_total {created}")
+    metric("library_loans_returned_total", "counter", "Loans marked returned.")
+    lines.append(f"library_loans_returned_total {returned}")
+
+    if gauges is not None:
+        open_loans, overdue_loans = gauges.read()
+        metric("library_open_loans", "gauge", "Loans not yet returned.")
+        lines.append(f"library_open_loans {open_loans}")
+        metric("library_overdue_loans", "gauge", "Loans not yet returned and past their due date.")
+        lines.append(f"library_overdue_loans {overdue_loans}")
+
+    waits = STATS.as_dict()
+    metric("library_sqlite_lock_wait_seconds", "histogram", "Time spent waiting for the write lock, and busy backoff.")
+    cumulative = 0
+    for i, bucket in enumerate(waits["lock_waits"]["buckets"]):
+        cumulative += bucket
+        if bucket or i == len(waits["lock_waits"]["buckets"]) - 1:
+            bound = "+Inf" if i == len(waits["lock_waits"]["buckets"]) - 1 else f"{2 ** i / 1e6:g}"
+            lines.append(f"library_sqlite_lock_wait_seconds_bucket{_labels(le=bound)} {cumulative}")
+    lines.append(f"library_sqlite_lock_wait_seconds_sum {waits['lock_waits']['total']}")
+    lines.append(f"library_sqlite_lock_wait_seconds_count {waits['lock_waits']['count']}")
+    metric("library_sqlite_busy_retries_total", "counter", "Writes retried because the database was busy.")
+    lines.append(f"library_sqlite_busy_retries_total {waits['busy_retries']}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port: int, database_path: str):
+    """Serve GET /metrics on the loopback interface from a daemon thread and return the server."""
+    # Imported here so that importing Library doesn't pull in the HTTP server.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            payload = render(self.server.gauges).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.gauges = LoanGauges(database_path)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def write_textfile(path: str, gauges: LoanGauges):
+    # Written under a temporary name and renamed, so a collector never reads half a file.
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(render(gauges))
+    os.replace(path + ".tmp", path)
+
+
+def start_textfile(path: str, interval: float, database_path: str) -> threading.Event:
+    """Rewrite `path` every `interval` seconds from a daemon thread until the returned event is set."""
+    stop = threading.Event()
+    gauges = LoanGauges(database_path)
+
+    def run():
+        while True:
+            write_textfile(path, gauges)
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=run, name="metrics-textfile", daemon=True).start()
+    return stop
@@ -0,0 +1,201 @@
+"""This module provides the query plan regression checker."""
+# plancheck.py
+
+import json
+import os
+import sqlite3
+import tempfile
+from typing import Dict, List
+
+from library.database import DatabaseHandler, Page
+from library.generator import generate
+
+ALLOWLIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_allowlist.json")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# Methods that don't run queries worth checking: schema setup, transactions, backups and pragmas.
+SKIPPED = {"init_table", "schema_version", "migrate", "snapshot", "rollback", "commit", "data_version",
+           "get_columns_name"}
+# Arguments for every other public DatabaseHandler method, given a sample of existing rows.
+CALLS = [
+    ("info_genre", lambda s: (1,)),
+    ("info_author", lambda s: (1,)),
+    ("info_book", lambda s: (1,)),
+    ("info_user", lambda s: (1,)),
+    ("info_loan", lambda s: (1,)),
+    ("list_all_genre", lambda s: (0, 50)),
+    ("list_all_author", lambda s: (0, 50)),
+    ("list_all_book", lambda s: (0, 50)),
+    ("list_all_user", lambda s: (0, 50)),
+    ("list_all_loan", lambda s: (0, 50)),
+    ("export_table", lambda s: ("Loan",)),
+    ("get_top_genres", lambda s: (10,)),
+    ("get_top_authors", lambda s: (10,)),
+    ("get_genre_with_book", lambda s: ()),
+    ("get_author_with_book", lambda s: ()),
+    ("get_series_book", lambda s: (0, 50)),
+    ("get_non_series_book", lambda s: (0, 50)),
+    ("get_available_book", lambda s: (0, 50)),
+    ("get_non_available_book", lambda s: (0, 50)),
+    ("check_if_available", lambda s: (s["title"],)),
+    ("get_user_with_loan", lambda s: (0, 50)),
+    ("get_returned_loan", lambda s: (0, 50)),
+    ("get_overdue_loan", lambda s: (s["today"],)),
+    ("get_overdue_loan", lambda s: (s["today"], 30)),
+    ("get_loan_counts", lambda s: (s["today"],)),
+    ("search_genre", lambda s: (s["genre"],)),
+    ("search_author", lambda s: s["author"]),
+    ("search_book", lambda s: (s["title"],)),
+    ("find_book", lambda s: ('"Kingdom"', 0, 20)),
+    ("search_user", lambda s: s["user"]),
+    ("search_loan", lambda s: (1, 1)),
+    ("search_book_by_genre", lambda s: (1, 0, 50)),
+    ("search_book_by_author", lambda s: (1, 0, 50)),
+    ("get_genre_id", lambda s: (s["genre"],)),
+    ("get_author_id", lambda s: s["author"]),
+    ("get_book_id", lambda s: (s["title"],)),
+    ("get_user_id", lambda s: s["user"]),
+    ("get_genre_ids", lambda s: ([s["genre"], "Missing"],)),
+    ("get_author_ids", lambda s: ([s["author"], ("No", "One")],)),
+    ("get_book_ids", lambda s: ([s["title"], "Missing"],)),
+    ("get_user_ids", lambda s: ([s["user"], ("No", "One")],)),
+    ("add_genre", lambda s: ("Plan Check",)),
+    ("add_author", lambda s: ("Plan", "Check", "1970-01-01")),
+    ("add_book", lambda s: ("Plan Check", 1, "Plan Check, #1", 1)),
+    ("add_user", lambda s: ("Plan", "Check", "1 Main Street", "plan@example.org", "555-plan")),
+    ("add_loan", lambda s: (1, 1, s["today"], s["today"] + 21)),
+    ("bulk_add_genre", lambda s: ([("Plan Bulk",)],)),
+    ("bulk_add_author", lambda s: ([("Plan", "Bulk", "1970-01-01")],)),
+    ("bulk_add_book", lambda s: ([("Plan Bulk", 1, None, 1)],)),
+    ("bulk_add_user", lambda s: ([("Plan", "Bulk", "2 Main Street", "bulk@example.org", "555-bulk")],)),
+    ("bulk_add_loan", lambda s: ([(2, 1, s["today"], s["today"] + 21)],)),
+    # Returned first, so that they are available to check out again.
+    ("checkin", lambda s: ([3, 4], s["today"])),
+    ("checkout", lambda s: ([3, 4], 1, s["today"], s["today"] + 21)),
+    ("checkin", lambda s: ([3, 4], s["today"], 1)),
+    ("update_fields", lambda s: ("Genre", 1, {"GenreName": "Plan Genre"})),
+    ("update_fields", lambda s: ("Author", 1, {"FirstName": "Plan", "LastName": "Author", "Birthday": "1971-01-01"})),
+    ("update_fields", lambda s: ("Book", 1, {"Title": "Plan Title", "Genre_ID": 2, "Series": "Plan Series, #1",
+                                             "Author_ID": 2, "LoanStatus": "Available"})),
+    ("update_fields", lambda s: ("User", 1, {"FirstName": "Plan", "LastName": "User", "Address": "3 Main Street",
+                                             "Email": "user@example.org", "PhoneNumber": "555-user"})),
+    ("update_fields", lambda s: ("Loan", 1, {"Book_ID": 2, "User_ID": 2, "LoanDate": s["today"],
+                                             "DueDate": s["today"] + 21, "DateReturn": s["today"] + 1,
+                                             "LoanStatus": "Returned"})),
+    ("update_fields", lambda s: ("Book", 2, {"Series": "Plan Series, #2", "LoanStatus": "Available"})),
+    ("bulk_update", lambda s: ("User", [(2, {"Address": "4 Main Street"}), (3, {"Address": "5 Main Street"}),
+                                        (4, {"Email": "patch@example.org"})])),
+    # After the updates above, so that the name change log has entries.
+    ("get_names", lambda s: ("Book", 100)),
+    ("get_names", lambda s: ("User", 100)),
+    ("get_names_by_id", lambda s: ("Author", [1, 2])),
+    ("get_name_changes", lambda s: (0,)),
+]
+
+
+def flagged(plan: List[str]) -> List[str]:
+    """Return the plan lines that are full scans or temporary B-trees.
+
+    Scans of subquery results (including named ones the plan materializes first), VALUES
+    lists and full-text index lookups are not table scans.
+    """
+    materialized = {line.split()[1] for line in plan if line.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    return [line for line in plan
+            if "TEMP B-TREE" in line
+            or (line.startswith("SCAN ") and not line.startswith("SCAN (")
+                and line.split()[1] not in materialized
+                and "CONSTANT ROW" not in line and "VIRTUAL TABLE INDEX" not in line)]
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    return [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def collect_plans(handler: DatabaseHandler, sample: dict) -> Dict[str, Dict[str, List[str]]]:
+    """Call every method in CALLS and return {method: {statement: plan lines}} for the statements it ran."""
+    conn = handler._conn
+    plans = {}
+    for name, make_args in CALLS:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            result = getattr(handler, name)(*make_args(sample))
+            if isinstance(result, list) and result and isinstance(result[0], Page):
+                for _ in result[0]:
+                    pass
+            handler.commit()
+        finally:
+            conn.set_trace_callback(None)
+        for sql in statements:
+            # The trace also reports the statements triggers run, prefixed with "--".
+            if sql.lstrip().upper().startswith(EXPLAINABLE):
+                plans.setdefault(name, {})[" ".join(sql.split())] = explain(conn, sql)
+    return plans
+
+
+def build_database(directory: str, books: int) -> str:
+    path = os.path.join(directory, "plans.db")
+    generate(path, genres=40, authors=max(books // 20, 1), books=books, users=max(books // 10, 1), loans=books * 5,
+             active=0.05, overdue=0.02, start_day=16071, end_day=19723)
+    return path
+
+
+def load_allowlist(path: str = ALLOWLIST) -> Dict[str, List[str]]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_allowlist(findings: Dict[str, List[str]], path: str = ALLOWLIST):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(findings, file, indent=2, sort_keys=True)
+        file.write("\n")
+    os.replace(path + ".tmp", path)
+
+
+class PlanReport:
+    def __init__(self, findings: Dict[str, List[str]], allowlist: Dict[str, List[str]], uncovered: List[str],
+                 statements: Dict[str, Dict[str, List[str]]]):
+        self.findings = findings
+        self.statements = statements
+        self.uncovered = uncovered
+        self.regressions = {method: [line for line in lines if line not in allowlist.get(method, [])]
+                            for method, lines in findings.items()}
+        self.regressions = {method: lines for method, lines in self.regressions.items() if lines}
+        self.stale = {method: [line for line in lines if line not in findings.get(method, [])]
+                      for method, lines in allowlist.items()}
+        self.stale = {method: lines for method, lines in self.stale.items() if lines}
+
+    @property
+    def ok(self) -> bool:
+        return not self.regressions and not self.uncovered
+
+
+def check_plans(allowlist_path: str = ALLOWLIST, books: int = 2000) -> PlanReport:
+    """Explain every statement DatabaseHandler issues against a generated database and compare with the allowlist.
+
+    The report's `regressions` are full scans and temporary B-trees that the allowlist
+    doesn't expect, `stale` are allowlisted ones that no longer happen, and `uncovered` are
+    public methods missing from CALLS. Use `report.ok` from tests.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        handler = DatabaseHandler(path=build_database(directory, books))
+        try:
+            sample = {
+                "genre": handler._conn.execute('SELECT GenreName FROM Genre WHERE Genre_ID = 1').fetchone()[0],
+                "author": handler._conn.execute('SELECT FirstName, LastName FROM Author WHERE Author_ID = 1').fetchone(),
+                "title": handler._conn.execute('SELECT Title FROM Book WHERE Book_ID = 1').fetchone()[0],
+                "user": handler._conn.execute('SELECT FirstName, LastName FROM User WHERE User_ID = 1').fetchone(),
+                "today": 19723,
+            }
+            statements = collect_plans(handler, sample)
+        finally:
+            handler._conn.close()
+    findings = {method: sorted({line for plan in plans.values() for line in flagged(plan)})
+                for method, plans in statements.items()}
+    findings = {method: lines for method, lines in findings.items() if lines}
+    covered = {name for name, _ in CALLS} | SKIPPED
+    uncovered = sorted(name for name, value in vars(DatabaseHandler).items()
+                       if callable(value) and not name.startswith("_") and name not in covered)
+    return PlanReport(findings, load_allowlist(allowlist_path), uncovered, statements)
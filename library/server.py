@@ -0,0 +1,120 @@
+"""This module provides the long-running library server."""
+# server.py
+
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from typing import Iterator
+
+from library.errors import LibraryError
+from library.library import Library
+
+
+class LibraryRequestHandler(BaseHTTPRequestHandler):
+    """Answer `POST /call` requests of the form {"method": ..., "args": [...]} against one warm Library."""
+
+    def do_POST(self):
+        if self.path != "/call":
+            self._reply(404, {"error": f"Unknown path {self.path}."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            method = request["method"]
+            args = request.get("args", [])
+            kwargs = request.get("kwargs", {})
+        except (ValueError, KeyError, TypeError):
+            self._reply(400, {"error": "Malformed request."})
+            return
+        if not is_remote_method(method):
+            self._reply(404, {"error": f"Unknown operation {method}."})
+            return
+
+        try:
+            result = materialize(getattr(self.server.library, method)(*args, **kwargs))
+        except LibraryError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except (TypeError, ValueError) as e:
+            self._reply(400, {"error": f"Invalid arguments for {method}: {e}"})
+            return
+        self._reply(200, {"result": result})
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        return
+
+
+def materialize(value):
+    """Turn the row streams returned by list and report methods into JSON-serializable lists."""
+    if isinstance(value, (list, tuple)):
+        return [materialize(item) for item in value]
+    if isinstance(value, Iterator):
+        return list(value)
+    return value
+
+
+# The queries and single-row writes the thin client sends. Anything else stays in-process: bulk
+# operations take streams of records, and snapshot and export write files on the server host.
+REMOTE_METHODS = frozenset({
+    "add_genre", "add_author", "add_book", "add_user", "add_loan", "checkout", "checkin",
+    "update_genre", "update_author", "update_book", "update_user", "update_loan",
+    "info_genre", "info_author", "info_book", "info_user", "info_loan",
+    "list_all_genre", "list_all_author", "list_all_book", "list_all_user", "list_all_loan",
+    "genre_with_most_book", "author_with_most_book", "top_genres", "top_authors",
+    "book_in_series", "book_not_in_series", "available_books_for_loan", "non_available_books_for_loan",
+    "check_if_available", "user_with_loan", "returned_loan", "overdue_loan",
+    "search_genre", "search_author", "search_book", "search_user", "search_loan",
+    "find_books", "search_book_by_genre", "search_book_by_author", "stats",
+})
+
+
+def is_remote_method(method: str) -> bool:
+    return method in REMOTE_METHODS
+
+
+def serve(host: str, port: int, concurrent: bool = False, metrics_port: int = 0, metrics_file: str = None,
+          metrics_interval: float = 15.0, group_commit: bool = False, commit_delay: float = 0.001,
+          commit_batch: int = 256):
+    """Serve requests with a single Library until interrupted.
+
+    By default requests are answered one at a time over a single connection. With `concurrent`,
+    each request gets its own thread: reads run in parallel and writes queue on the one writer.
+    Metrics are served on 127.0.0.1:`metrics_port` and/or written to `metrics_file` if given.
+    With `group_commit`, adds and updates from concurrent requests are committed together in
+    batches of up to `commit_batch`, waiting at most `commit_delay` seconds for a batch to fill.
+    """
+    server_class = ThreadingHTTPServer if concurrent else HTTPServer
+    server = server_class((host, port), LibraryRequestHandler)
+    write_queue = None
+    if group_commit:
+        from library.database import DatabaseHandler
+        from library.writequeue import WriteQueue
+        write_queue = WriteQueue(DatabaseHandler.my_library, commit_delay, commit_batch)
+    server.library = Library(concurrent, write_queue=write_queue)
+    metrics_server = stop_textfile = None
+    if metrics_port or metrics_file:
+        from library import metrics
+        database_path = server.library._dbhandler.path
+        if metrics_port:
+            metrics_server = metrics.serve_metrics(metrics_port, database_path)
+        if metrics_file:
+            stop_textfile = metrics.start_textfile(metrics_file, metrics_interval, database_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if stop_textfile is not None:
+            stop_textfile.set()
+        if write_queue is not None:
+            write_queue.close()
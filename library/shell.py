@@ -0,0 +1,260 @@
+"""This module provides the interactive shell."""
+# shell.py
+
+import shlex
+import sys
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import click
+import typer
+
+from library.database import DatabaseHandler
+
+try:
+    import readline
+except ImportError:  # e.g. Windows without pyreadline: the shell works, without completion.
+    readline = None
+
+PROMPT = "library> "
+COMPLETIONS_SHOWN = 100
+# Parameters whose values are names, by parameter name with any "new_" prefix removed.
+NAME_PARAMS = {"title": "Book", "book_title": "Book", "book": "Book", "books": "Book",
+               "genre": "Genre", "author": "Author", "user": "User"}
+BUILTINS = ["exit", "help", "quit"]
+
+
+class PrefixIndex:
+    """The names of one table, sorted case-insensitively so that a prefix is found by binary search."""
+
+    def __init__(self, rows: List[tuple]):
+        self.entries = sorted((name.casefold(), name, row_id) for row_id, name in rows if name is not None)
+        self.names = {row_id: name for _, name, row_id in self.entries}
+        self.high = rows[-1][0] if rows else 0
+
+    def add(self, row_id: int, name: Optional[str]):
+        self.remove(row_id)
+        self.high = max(self.high, row_id)
+        if name is not None:
+            self.names[row_id] = name
+            insort(self.entries, (name.casefold(), name, row_id))
+
+    def remove(self, row_id: int):
+        name = self.names.pop(row_id, None)
+        if name is not None:
+            del self.entries[bisect_left(self.entries, (name.casefold(), name, row_id))]
+
+    def complete(self, prefix: str, limit: int = COMPLETIONS_SHOWN) -> List[str]:
+        """Return up to `limit` distinct names starting with `prefix`, ignoring case, in order."""
+        folded = prefix.casefold()
+        names = []
+        i = bisect_left(self.entries, (folded,))
+        while i < len(self.entries) and self.entries[i][0].startswith(folded) and len(names) < limit:
+            name = self.entries[i][1]
+            if not names or names[-1] != name:
+                names.append(name)
+            i += 1
+        return names
+
+
+class NameIndex:
+    """Prefix indexes of titles, authors, genres and user names, kept in step with the database.
+
+    A table's index is read in full the first time one of its names is completed. After
+    that, whenever PRAGMA data_version shows another connection has committed, or `changed`
+    says this one has, only the rows added since and the rows in the NameChange log of
+    renames and deletes are read again.
+    """
+
+    def __init__(self, handler: DatabaseHandler):
+        self._handler = handler
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self._seq: Optional[int] = None
+        self._version: Optional[int] = None
+
+    def changed(self):
+        """Catch up at the next completion; data_version doesn't count this connection's own commits."""
+        self._version = None
+
+    def complete(self, table: str, prefix: str) -> List[str]:
+        self.refresh()
+        if table not in self._indexes:
+            self._indexes[table] = PrefixIndex(self._handler.get_names(table))
+        return self._indexes[table].complete(prefix)
+
+    def refresh(self):
+        version = self._handler.data_version()
+        if version == self._version:
+            return
+        self._version = version
+        oldest, changes = self._handler.get_name_changes(self._seq or 0)
+        if self._seq is not None and oldest is not None and oldest > self._seq + 1:
+            # Changes we haven't seen were dropped from the log: start again from scratch.
+            self._indexes.clear()
+        elif self._seq is not None:
+            changed = defaultdict(set)
+            for _, table, row_id in changes:
+                changed[table].add(row_id)
+            for table, index in self._indexes.items():
+                for row_id in changed[table]:
+                    index.remove(row_id)
+                for row_id, name in self._handler.get_names_by_id(table, list(changed[table])):
+                    index.add(row_id, name)
+        if changes or self._seq is None:
+            self._seq = changes[-1][0] if changes else 0
+        for table, index in self._indexes.items():
+            for row_id, name in self._handler.get_names(table, index.high):
+                index.add(row_id, name)
+
+
+def split_partial(line: str) -> tuple:
+    """Split a line being typed into (finished words, the word at the end, where it starts, its open quote)."""
+    words, word, start, quote = [], None, len(line), ""
+    for i, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = ""
+            else:
+                word += char
+        elif char in "'\"":
+            if word is None:
+                word, start = "", i
+            quote = char
+        elif char.isspace():
+            if word is not None:
+                words.append(word)
+                word, start = None, len(line)
+        else:
+            if word is None:
+                word, start = "", i
+            word += char
+    return words, word or "", start, quote
+
+
+def quoted(name: str, quote: str) -> str:
+    if quote and quote not in name:
+        return quote + name + quote
+    return shlex.quote(name)
+
+
+def name_table(param: click.Parameter) -> Optional[str]:
+    """Return the table whose names `param` takes, if any."""
+    if not isinstance(param.type, click.types.StringParamType):
+        return None
+    name = param.name[len("new_"):] if param.name.startswith("new_") else param.name
+    return NAME_PARAMS.get(name)
+
+
+class Completer:
+    """Readline completion of command names, option names and the names that options and arguments take."""
+
+    def __init__(self, group: click.Group, names: NameIndex):
+        self._group = group
+        self._names = names
+        self._matches: List[str] = []
+        self._shown: List[str] = []
+
+    def install(self):
+        # Complete the whole line, so that names with spaces complete inside quotes.
+        readline.set_completer_delims("")
+        readline.set_completer(self.complete)
+        readline.set_completion_display_matches_hook(self.display)
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+
+    def complete(self, text: str, state: int) -> Optional[str]:
+        if state == 0:
+            words, word, start, quote = split_partial(text)
+            self._shown = self.candidates(words, word)
+            self._matches = [text[:start] + quoted(name, quote) for name in self._shown]
+        return self._matches[state] if state < len(self._matches) else None
+
+    def display(self, substitution: str, matches: List[str], longest: int):
+        typer.echo("\n" + "\n".join(self._shown))
+        typer.echo(PROMPT + readline.get_line_buffer(), nl=False)
+
+    def candidates(self, words: List[str], word: str) -> List[str]:
+        if not words:
+            return sorted(name for name in list(self._group.commands) + BUILTINS if name.startswith(word))
+        command = self._group.commands.get(words[0])
+        if words[0] == "help" and len(words) == 1:
+            return sorted(name for name in self._group.commands if name.startswith(word))
+        if command is None:
+            return []
+        options = {opt: param for param in command.params if isinstance(param, click.Option)
+                   for opt in param.opts + param.secondary_opts}
+        arguments = [param for param in command.params if isinstance(param, click.Argument)]
+        position, param = 0, None
+        for finished in words[1:]:
+            if param is not None:
+                param = None
+            elif finished.startswith("-") and finished != "-":
+                option = options.get(finished)
+                param = option if option is not None and not option.is_flag else None
+            else:
+                position += 1
+        if param is None and word.startswith("-"):
+            return sorted(opt for opt in list(options) + ["--help"] if opt.startswith(word))
+        if param is None and arguments:
+            if position < len(arguments):
+                param = arguments[position]
+            elif arguments[-1].nargs == -1:
+                param = arguments[-1]
+        table = name_table(param) if param is not None else None
+        return self._names.complete(table, word) if table else []
+
+
+def run_command(group: click.Group, args: List[str], prog_name: str):
+    try:
+        group.main(args, prog_name=prog_name, standalone_mode=False)
+    except click.ClickException as e:
+        e.show()
+    except click.Abort:
+        typer.secho("Aborted.", fg=typer.colors.RED)
+    except Exception as e:
+        # A command that fails in a way it doesn't report itself mustn't end the shell.
+        typer.secho(f"Error while running {args[0]}: {e}.", fg=typer.colors.RED)
+
+
+def run_shell(group: click.Group, handler: DatabaseHandler, prog_name: str = "library"):
+    """Read commands, one per line, and run them until exit, quit or the end of input.
+
+    Completion needs readline and a terminal; piped input runs the same way without prompts.
+    """
+    names = NameIndex(handler)
+    interactive = sys.stdin.isatty()
+    if interactive:
+        typer.secho("Type a command as you would after 'python -m library', 'help' to list them or 'exit' "
+                    "to leave." + (" Tab completes commands, options and names." if readline else ""),
+                    fg=typer.colors.CYAN)
+        if readline is not None:
+            Completer(group, names).install()
+    while True:
+        try:
+            line = input(PROMPT if interactive else "")
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            typer.echo()
+            continue
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            typer.secho(f"Error reading the command: {e}.", fg=typer.colors.RED)
+            continue
+        if not args:
+            continue
+        if args[0] in ("exit", "quit"):
+            break
+        if args[0] == "help":
+            args = args[1:] + ["--help"]
+        if args[0] == "shell":
+            typer.secho("Already in the shell.", fg=typer.colors.RED)
+            continue
+        run_command(group, args, prog_name)
+        names.changed()
+    if interactive:
+        typer.echo()
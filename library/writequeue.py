@@ -0,0 +1,141 @@
+"""This module provides the group-commit write queue."""
+# writequeue.py
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Sequence
+
+from library.database import BUSY_BACKOFF, BUSY_RETRIES, BUSY_TIMEOUT, is_busy
+from library.instrument import STATS, connection_factory
+
+# Defaults: commit at most 1 ms after the first pending write, or as soon as 256 are pending.
+MAX_DELAY = 0.001
+MAX_OPS = 256
+
+
+class WriteQueue:
+    """Coalesce small writes from many threads into one transaction per batch.
+
+    A writer thread with its own connection waits for a write, collects more until `max_ops`
+    are pending or `max_delay` seconds have passed since the first one, and commits them
+    together, so the whole batch pays for one fsync. A longer delay or a bigger batch trades
+    latency for throughput. Each write runs in a savepoint of its own, so one that fails
+    doesn't undo the rest of its batch.
+
+        writes = WriteQueue("library.db")
+        future = writes.submit([('INSERT INTO Genre (GenreName) VALUES (?)', ("Poetry",))])
+        future.result()  # returns once the batch holding the insert is on disk
+    """
+
+    def __init__(self, path: str, max_delay: float = MAX_DELAY, max_ops: int = MAX_OPS):
+        self.path = path
+        self.max_delay = max_delay
+        self.max_ops = max_ops
+        self.batches = 0
+        self.writes = 0
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False,
+                                     factory=connection_factory())
+        # A commit only resolves futures once it is on disk, in WAL mode too.
+        self._conn.execute('PRAGMA synchronous = FULL')
+        self._thread = threading.Thread(target=self._run, name="library-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, statements: Sequence[tuple]) -> Future:
+        """Queue (query, params) statements to run together; the future resolves once they are committed."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write queue is closed.")
+            if not self._thread.is_alive():
+                raise RuntimeError("The write queue's writer thread has stopped.")
+            self._pending.put((list(statements), future))
+        return future
+
+    def close(self):
+        """Commit what is pending, then stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_ops:
+                try:
+                    item = self._pending.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch: List[tuple]):
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                errors = self._apply(batch)
+                break
+            except Exception as e:
+                # Anything, not just sqlite3.Error: an exception that escaped would stop the
+                # writer thread and leave every future, this batch's and later ones, unresolved.
+                try:
+                    if self._conn.in_transaction:
+                        self._conn.execute('ROLLBACK')
+                except sqlite3.Error:
+                    pass
+                if isinstance(e, sqlite3.OperationalError) and is_busy(e) and attempt < BUSY_RETRIES:
+                    STATS.record_lock_wait(delay, retried=True)
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _apply(self, batch: List[tuple]) -> list:
+        """Run the batch in one transaction and return, per write, the error that rolled it back or None."""
+        errors = []
+        waiting = time.perf_counter()
+        self._conn.execute('BEGIN IMMEDIATE')
+        STATS.record_lock_wait(time.perf_counter() - waiting)
+        for statements, _ in batch:
+            self._conn.execute('SAVEPOINT write')
+            try:
+                for query, params in statements:
+                    self._conn.execute(query, params)
+                errors.append(None)
+            except Exception as e:
+                # A bad parameter (e.g. an int too big for SQLite) fails only its own write.
+                if isinstance(e, sqlite3.OperationalError) and is_busy(e):
+                    raise
+                self._conn.execute('ROLLBACK TO write')
+                errors.append(e)
+            self._conn.execute('RELEASE write')
+        self._conn.execute('COMMIT')
+        return errors
@@ -0,0 +1,65 @@
+"""Awaiting pages and streaming rows through AsyncLibrary's thread pool."""
+# test_aio.py
+
+import asyncio
+
+import pytest
+
+from library.aio import READ_AHEAD, AsyncLibrary
+from library.database import FETCH_SIZE, DatabaseHandler
+
+BOOKS = (READ_AHEAD + 2) * FETCH_SIZE
+
+
+@pytest.fixture(autouse=True)
+def books(tmp_path, monkeypatch):
+    # AsyncLibrary opens the default database, in the working directory.
+    monkeypatch.chdir(tmp_path)
+    handler = DatabaseHandler(concurrent=True)
+    handler.init_table()
+    with handler._conn as conn:
+        conn.execute("INSERT INTO Genre (GenreName) VALUES ('Fantasy')")
+        conn.execute("INSERT INTO Author (FirstName, LastName, Birthday) VALUES ('Jane', 'Doe', '1970-01-01')")
+        conn.executemany("INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?, 1, NULL, 1)",
+                         [(f"Title {i}",) for i in range(BOOKS)])
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+def test_awaited_page_carries_its_cursor():
+    async def pages():
+        async with AsyncLibrary(max_workers=2) as library:
+            first, _ = await library.list_all_book(limit=10)
+            second, _ = await library.list_all_book(after=first.next_after, limit=10)
+            return first, second
+
+    first, second = run(pages())
+    assert first.next_after == 10
+    assert [row[0] for row in second] == list(range(11, 21))
+
+
+def test_stream_reads_every_row():
+    async def stream():
+        async with AsyncLibrary(max_workers=2) as library:
+            rows = await library.stream("list_all_book", limit=BOOKS - 1)
+            return [row[0] async for row in rows], rows.next_after
+
+    ids, next_after = run(stream())
+    assert ids == list(range(1, BOOKS))
+    assert next_after == BOOKS - 1
+
+
+def test_idle_streams_hold_no_worker():
+    async def idle_streams():
+        async with AsyncLibrary(max_workers=2) as library:
+            # More streams than workers, none of them read: the pool must stay free for other calls.
+            streams = [await library.stream("list_all_book") for _ in range(4)]
+            await asyncio.sleep(0.2)
+            rows, _ = await asyncio.wait_for(library.info_genre(1), 2)
+            for stream in streams:
+                await stream.aclose()
+            return rows
+
+    assert run(idle_streams()) == [(1, "Fantasy")]
@@ -0,0 +1,40 @@
+"""Checking out and returning batches of books given by title or ID."""
+# test_checkout.py
+
+import pytest
+
+from library.errors import LibraryError
+from library.library import Library
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(path=str(tmp_path / "library.db"))
+    library.add_genre("Fantasy")
+    library.add_author("Jane", "Doe", "1970-01-01")
+    library.add_book("The Hobbit", "Fantasy", "null", "Jane Doe")
+    library.add_book("1984", "Fantasy", "null", "Jane Doe")
+    library.add_user("John", "Roe", "Main Street", "john@example.com", "555-1")
+    return library
+
+
+def test_book_given_by_title_and_id_is_lent_once(library):
+    assert library.checkout("1", ["The Hobbit", "1"], "2024-01-01", "2024-01-22") == ["The Hobbit"]
+    assert library.checkin(["1", "The Hobbit"], "2024-01-10") == (["1"], [])
+
+
+def test_number_that_is_a_title_is_the_title(library):
+    assert library.checkout("1", ["1984"], "2024-01-01", "2024-01-22") == ["1984"]
+    assert library.checkin(["2"], "2024-01-10") == (["2"], [])
+
+
+def test_unknown_id_is_no_such_book(library):
+    with pytest.raises(LibraryError, match="Book 99 doesn't exist"):
+        library.checkout("1", ["The Hobbit", "99"], "2024-01-01", "2024-01-22")
+    assert library.checkout("1", ["The Hobbit"], "2024-01-01", "2024-01-22") == ["The Hobbit"]
+
+
+def test_book_out_is_not_available(library):
+    library.checkout("1", ["The Hobbit"], "2024-01-01", "2024-01-22")
+    with pytest.raises(LibraryError, match="Nothing was lent: 1 is not available"):
+        library.checkout("1", ["1984", "1"], "2024-01-02", "2024-01-23")
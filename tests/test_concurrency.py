@@ -0,0 +1,106 @@
+"""Reads in concurrent (WAL) mode while the write connection is busy."""
+# test_concurrency.py
+
+import sqlite3
+import threading
+
+import pytest
+
+from library.database import READER_POOL, DatabaseHandler
+
+BOOKS = 200
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = DatabaseHandler(concurrent=True, path=str(tmp_path / "library.db"))
+    handler.init_table()
+    with handler._conn as conn:
+        conn.execute("INSERT INTO Genre (GenreName) VALUES ('Fantasy')")
+        conn.execute("INSERT INTO Author (FirstName, LastName, Birthday) VALUES ('Jane', 'Doe', '1970-01-01')")
+        conn.executemany("INSERT INTO Book (Title, Genre_ID, Series, Author_ID) VALUES (?, 1, NULL, 1)",
+                         [(f"Title {i}",) for i in range(BOOKS)])
+        conn.execute("INSERT INTO User (FirstName, LastName) VALUES ('John', 'Roe')")
+    return handler
+
+
+def in_threads(target, count: int):
+    """Run target() in `count` short-lived threads, one after another, and return any errors raised."""
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as e:  # noqa: BLE001 - reported by the test
+            errors.append(e)
+
+    for _ in range(count):
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    return errors
+
+
+def test_reads_proceed_during_open_write_transaction(handler):
+    handler._conn.execute("BEGIN IMMEDIATE")
+    handler._conn.execute("UPDATE Book SET LoanStatus = 'Not Available' WHERE Book_ID = 1")
+    try:
+        rows, _ = handler.list_all_book(0, 10)
+        assert len(list(rows)) == 10
+        assert handler.get_book_ids(["Title 0"]) == {"Title 0": 1}
+        assert handler.check_if_available("Title 0")[0] == "Available"
+    finally:
+        handler._conn.rollback()
+
+
+def test_reads_alongside_writer_are_never_locked(handler):
+    stop = threading.Event()
+    write_errors = []
+
+    def write_loop():
+        day = 0
+        try:
+            while not stop.is_set():
+                day += 1
+                book = day % BOOKS + 1
+                handler.checkout([book], 1, day, day + 21)
+                handler.checkin([book], day + 1)
+        except Exception as e:  # noqa: BLE001 - reported by the test
+            write_errors.append(e)
+
+    def read():
+        rows, _ = handler.get_user_with_loan(0, 50)
+        list(rows)
+        handler.get_book_ids([f"Title {i}" for i in range(20)])
+        handler.get_loan_counts(0)
+
+    writer = threading.Thread(target=write_loop)
+    writer.start()
+    try:
+        errors = in_threads(read, 200)
+    finally:
+        stop.set()
+        writer.join()
+    assert errors == []
+    assert write_errors == []
+    assert handler._conn.execute("SELECT COUNT(*) FROM Loan").fetchone()[0] > 0
+
+
+def test_readers_are_reused_across_threads(handler, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite3, "connect", counting_connect)
+    assert in_threads(lambda: handler.info_book(1), 50) == []
+    assert len(opened) == 1
+    assert handler._readers.qsize() <= READER_POOL
+
+
+def test_unread_page_returns_its_connection(handler):
+    for _ in range(READER_POOL + 2):
+        handler.list_all_book(0, 10)
+    assert 0 < handler._readers.qsize() <= READER_POOL
@@ -0,0 +1,87 @@
+"""Federated queries read branches without changing them, and report a failing branch on its own."""
+# test_federation.py
+
+import sqlite3
+
+import pytest
+
+from library.database import MIGRATIONS
+from library.federation import Federation
+from library.library import Library
+
+
+@pytest.fixture
+def current(tmp_path):
+    path = str(tmp_path / "current.db")
+    library = Library(concurrent=True, path=path)
+    library.add_genre("Fantasy")
+    library.add_author("Jane", "Doe", "1970-01-01")
+    library.add_book("The Hobbit", "Fantasy", "null", "Jane Doe")
+    return path
+
+
+@pytest.fixture
+def old(tmp_path):
+    # A branch last opened by a version of the program at schema version 3.
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        for migration in MIGRATIONS[:3]:
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute("PRAGMA user_version = 3")
+    conn.close()
+    return path
+
+
+def schema(path: str) -> tuple:
+    conn = sqlite3.connect(path)
+    try:
+        return (conn.execute("PRAGMA user_version").fetchone()[0],
+                conn.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall())
+    finally:
+        conn.close()
+
+
+def query(branches: dict, method: str, *args) -> tuple:
+    federation = Federation(branches)
+    try:
+        rows, _, results = federation.query(method, *args)
+    finally:
+        federation.close()
+    return rows, {result.branch: result.error for result in results}
+
+
+def test_old_branch_is_reported_not_migrated(current, old):
+    before = schema(old)
+    rows, errors = query({"main": current, "old": old}, "list_all_book")
+    assert [row[:3] for row in rows] == [("main", 1, "The Hobbit")]
+    assert errors["main"] is None
+    assert "schema version 3" in errors["old"]
+    assert schema(old) == before
+
+
+def test_branch_being_written_is_still_read(current):
+    writer = sqlite3.connect(current)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        rows, errors = query({"main": current}, "list_all_book")
+    finally:
+        writer.rollback()
+        writer.close()
+    assert len(rows) == 1 and errors == {"main": None}
+
+
+def test_sqlite_error_fails_only_its_branch(current, tmp_path, monkeypatch):
+    other = str(tmp_path / "other.db")
+    Library(path=other)
+    list_all_book = Library.list_all_book
+
+    def failing(self, *args):
+        if self._dbhandler.path == other:
+            raise sqlite3.OperationalError("disk I/O error")
+        return list_all_book(self, *args)
+
+    monkeypatch.setattr(Library, "list_all_book", failing)
+    rows, errors = query({"main": current, "other": other}, "list_all_book")
+    assert len(rows) == 1
+    assert errors == {"main": None, "other": "Error: disk I/O error."}
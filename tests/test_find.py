@@ -0,0 +1,43 @@
+"""Paging through full-text search results, keyed on (rank, Book_ID)."""
+# test_find.py
+
+import pytest
+
+from library.library import Library
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(path=str(tmp_path / "library.db"))
+    library.add_genre("Fantasy")
+    library.add_author("Jane", "Doe", "1970-01-01")
+    # Titles of the same length rank equally, so most pages start and end inside a tie.
+    for i in range(30):
+        library.add_book(f"Dune {i}" if i % 3 else f"Dune Chronicles {i}", "Fantasy", "null", "Jane Doe")
+    library.add_book("Emma", "Fantasy", "null", "Jane Doe")
+    return library
+
+
+def ids(page) -> list:
+    return [row[0] for row in page]
+
+
+def test_pages_cover_every_hit_once(library):
+    everything = ids(library.find_books("dune")[0])
+    assert len(everything) == 30
+    paged, after = [], 0
+    while True:
+        page, _ = library.find_books("dune", after, 4)
+        paged += ids(page)
+        after = page.next_after
+        if after is None:
+            break
+    assert paged == everything
+
+
+def test_ties_are_in_book_id_order(library):
+    everything = ids(library.find_books("dune")[0])
+    # The shorter titles rank first, then the longer ones, each tie in Book_ID order.
+    shorter = [book_id for book_id in range(1, 31) if (book_id - 1) % 3]
+    longer = [book_id for book_id in range(1, 31) if not (book_id - 1) % 3]
+    assert everything == shorter + longer
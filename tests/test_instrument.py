@@ -0,0 +1,42 @@
+"""Statement keys and opt-in persistence of the query statistics."""
+# test_instrument.py
+
+from library import instrument
+from library.instrument import Stats, statement_key
+
+
+def test_placeholder_lists_share_one_key():
+    assert (statement_key("SELECT Book_ID FROM Book WHERE Book_ID IN (?,?,?)")
+            == statement_key("SELECT Book_ID FROM Book WHERE Book_ID IN (?, ?)")
+            == "SELECT Book_ID FROM Book WHERE Book_ID IN (?, ...)")
+    assert (statement_key("SELECT 1 FROM (VALUES (?,?), (?,?), (?,?)) AS v")
+            == statement_key("SELECT 1 FROM (VALUES (?,?),(?,?)) AS v")
+            == "SELECT 1 FROM (VALUES (?,?), ...) AS v")
+
+
+def test_single_row_of_values_is_kept():
+    sql = "INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate) VALUES (?,?,?,?)"
+    assert statement_key(sql) == sql
+
+
+def test_statements_are_recorded_under_their_key():
+    stats = Stats()
+    for size in range(1, 50):
+        stats.record_statement(f"SELECT * FROM Genre WHERE GenreName IN (VALUES {', '.join(['(?)'] * size)})",
+                               0.001, size, False)
+    assert len(stats.statements) == 2
+
+
+def test_nothing_is_written_unless_asked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("LIBRARY_STATS_FILE", raising=False)
+    monkeypatch.delenv("LIBRARY_SLOW_LOG", raising=False)
+    monkeypatch.setattr(instrument, "STATS", Stats())
+    instrument.STATS.record_method("info_book", 0.001, False)
+    instrument.save_stats()
+    assert instrument.slow_log_path() is None
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setenv("LIBRARY_STATS_FILE", str(tmp_path / "stats.json"))
+    instrument.save_stats()
+    assert instrument.load_stats(str(tmp_path / "stats.json"))["methods"]["info_book"]["count"] == 1
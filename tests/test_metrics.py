@@ -0,0 +1,42 @@
+"""The /metrics endpoint's loan gauges follow writes made on other connections."""
+# test_metrics.py
+
+import re
+import urllib.request
+
+import pytest
+
+from library.library import Library
+from library.metrics import serve_metrics
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(path=str(tmp_path / "library.db"))
+    library.add_genre("Fantasy")
+    library.add_author("Jane", "Doe", "1970-01-01")
+    library.add_book("The Hobbit", "Fantasy", "null", "Jane Doe")
+    library.add_book("Dune", "Fantasy", "null", "Jane Doe")
+    library.add_user("John", "Roe", "Main Street", "john@example.com", "555-1")
+    return library
+
+
+def gauge(url: str, name: str) -> int:
+    with urllib.request.urlopen(url) as response:
+        return int(re.search(rf"^{name} (\d+)$", response.read().decode("utf-8"), re.MULTILINE).group(1))
+
+
+def test_scrapes_see_new_loans(library, tmp_path):
+    server = serve_metrics(0, str(tmp_path / "library.db"))
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    try:
+        assert gauge(url, "library_open_loans") == 0
+        library.checkout("1", ["The Hobbit"], "2024-01-01", "2024-01-22")
+        assert gauge(url, "library_open_loans") == 1
+        assert gauge(url, "library_overdue_loans") == 1
+        library.checkout("1", ["Dune"], "2024-01-01", "2024-01-22")
+        library.checkin(["The Hobbit"], "2024-01-10")
+        assert gauge(url, "library_open_loans") == 1
+    finally:
+        server.shutdown()
+        server.server_close()
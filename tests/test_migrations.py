@@ -0,0 +1,55 @@
+"""Upgrading a database from an older schema version to the current one."""
+# test_migrations.py
+
+import sqlite3
+
+import pytest
+
+from library.database import MIGRATIONS, SCHEMA_VERSION
+from library.library import Library, to_day
+
+
+@pytest.fixture
+def old_path(tmp_path):
+    # A database at schema version 3, from before loan dates were stored as day numbers.
+    path = str(tmp_path / "library.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        for migration in MIGRATIONS[:3]:
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute("PRAGMA user_version = 3")
+        conn.execute("INSERT INTO Genre (GenreName) VALUES ('Fantasy')")
+        conn.execute("INSERT INTO Author (FirstName, LastName, Birthday) VALUES ('Jane', 'Doe', '1970-01-01')")
+        conn.executemany("INSERT INTO Book (Title, Genre_ID, Author_ID) VALUES (?, 1, 1)",
+                         [("The Hobbit",), ("Dune",), ("Emma",)])
+        conn.execute("INSERT INTO User (FirstName, LastName) VALUES ('John', 'Roe')")
+        conn.executemany("INSERT INTO Loan (Book_ID, User_ID, LoanDate, DueDate, DateReturn, LoanStatus) "
+                         "VALUES (?, 1, ?, ?, ?, ?)",
+                         [(1, "2024-01-01", "2024-01-22", None, "Not Return"),
+                          (2, "2024-01-05", "2024-01-26", "2024-01-20", "Returned"),
+                          (3, "someday", "2024-02-01", None, "Not Return")])
+    conn.close()
+    return path
+
+
+def test_old_database_is_brought_up_to_date(old_path):
+    library = Library(path=old_path)
+    conn = library._dbhandler._conn
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION == 8
+    assert conn.execute("SELECT LoanDate, DueDate, DateReturn FROM Loan ORDER BY Loan_ID").fetchall() == [
+        (to_day("2024-01-01"), to_day("2024-01-22"), None),
+        (to_day("2024-01-05"), to_day("2024-01-26"), to_day("2024-01-20")),
+        (None, to_day("2024-02-01"), None),
+    ]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_loan_user_book", "idx_loan_open_due", "idx_loan_open_book", "idx_loan_open_id"} <= indexes
+    assert library._dbhandler.get_loan_counts(to_day("2024-01-25")) == (2, 1)
+
+
+def test_upgraded_loans_are_still_usable(old_path):
+    library = Library(path=old_path)
+    overdue, _ = library.overdue_loan("2024-01-25")
+    assert [row[0] for row in overdue] == [1]
+    assert library.checkin(["The Hobbit"], "2024-01-30") == (["The Hobbit"], [])
+    assert library._dbhandler.get_loan_counts(to_day("2024-01-25")) == (1, 0)
@@ -0,0 +1,31 @@
+"""Query plans of every DatabaseHandler statement against library/plan_allowlist.json."""
+# test_plancheck.py
+
+import json
+
+import pytest
+
+from library.plancheck import check_plans
+
+
+@pytest.fixture(scope="module")
+def report():
+    return check_plans()
+
+
+def test_no_plan_regressions(report):
+    assert report.regressions == {}
+    assert report.uncovered == []
+    assert report.ok
+
+
+def test_allowlist_has_no_stale_entries(report):
+    assert report.stale == {}
+
+
+def test_unlisted_scan_is_a_regression(tmp_path):
+    allowlist = tmp_path / "allowlist.json"
+    allowlist.write_text(json.dumps({}))
+    report = check_plans(str(allowlist), books=200)
+    assert not report.ok
+    assert "USE TEMP B-TREE FOR ORDER BY" in report.regressions["get_top_genres"]
@@ -0,0 +1,35 @@
+"""The server answers the thin client's queries and writes, and nothing else."""
+# test_server.py
+
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+from library.client import RemoteLibrary
+from library.errors import LibraryError
+from library.library import Library
+from library.server import LibraryRequestHandler
+
+
+@pytest.fixture
+def remote(tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), LibraryRequestHandler)
+    server.library = Library(path=str(tmp_path / "library.db"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield RemoteLibrary("127.0.0.1", server.server_address[1], timeout=5)
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_operations_are_served(remote):
+    remote.add_genre("Poetry")
+    assert remote.list_all_genre() == [[[1, "Poetry"]], ["Genre_ID", "GenreName"]]
+
+
+@pytest.mark.parametrize("method", ["snapshot", "export_rows", "bulk_add_genres"])
+def test_other_methods_are_refused(remote, tmp_path, method):
+    with pytest.raises(LibraryError, match=f"Unknown operation {method}"):
+        getattr(remote, method)(str(tmp_path / "copy.db"))
+    assert not (tmp_path / "copy.db").exists()
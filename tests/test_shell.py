@@ -0,0 +1,66 @@
+"""Name completion indexes, splitting partial lines and running piped commands in the shell."""
+# test_shell.py
+
+import io
+
+import click
+import pytest
+from typer.main import get_command
+
+from library import lib
+from library.library import Library
+from library.shell import PrefixIndex, run_shell, split_partial
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    library = Library(path=str(tmp_path / "library.db"))
+    monkeypatch.setattr(lib, "shell_library", library)
+    return library
+
+
+def pipe(monkeypatch, *lines: str):
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(line + "\n" for line in lines)))
+
+
+def test_prefix_index_completes_ignoring_case():
+    index = PrefixIndex([(1, "Dune"), (2, "dune messiah"), (3, "Emma"), (4, None)])
+    assert index.complete("DU") == ["Dune", "dune messiah"]
+    index.add(2, "Children of Dune")
+    index.remove(1)
+    assert index.complete("d") == []
+    assert index.complete("c") == ["Children of Dune"]
+    assert index.high == 4
+
+
+def test_split_partial_keeps_the_open_quote():
+    assert split_partial('checkout 1 "The Ho') == (["checkout", "1"], "The Ho", 11, '"')
+    assert split_partial("find dune ") == (["find", "dune"], "", 10, "")
+
+
+def test_shell_keeps_going_after_a_command_fails(monkeypatch, capsys):
+    @click.group()
+    def group():
+        pass
+
+    @group.command()
+    def broken():
+        raise ValueError("something went wrong")
+
+    @group.command()
+    def hello():
+        click.echo("hello")
+
+    pipe(monkeypatch, "broken", "hello")
+    run_shell(group, handler=None)
+    assert capsys.readouterr().out.splitlines() == ["Error while running broken: something went wrong.", "hello"]
+
+
+def test_shell_runs_library_commands_after_an_error(library, monkeypatch, capsys):
+    pipe(monkeypatch, "add-genre --genre Poetry", "add-genre --genre Poetry", "add-genre --genre Drama",
+         "list-all-genre")
+    run_shell(get_command(lib.app), library._dbhandler)
+    out = capsys.readouterr().out
+    assert out.count("successfully added") == 2
+    assert "UNIQUE" in out
+    assert [name for _, name in library._dbhandler.get_names("Genre")] == ["Poetry", "Drama"]
@@ -0,0 +1,25 @@
+"""The update commands' Library methods, where "null" leaves a field as it is."""
+# test_update.py
+
+import pytest
+
+from library.library import Library
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(path=str(tmp_path / "library.db"))
+    library.add_author("Jane", "Doe", "1970-01-01")
+    return library
+
+
+def test_all_null_update_is_a_no_op(library):
+    library.update_author(1, "null", "null")
+    rows, _ = library.info_author(1)
+    assert rows == [(1, "Jane", "Doe", "1970-01-01")]
+
+
+def test_only_given_fields_change(library):
+    library.update_author(1, "null", "1971-02-03")
+    rows, _ = library.info_author(1)
+    assert rows == [(1, "Jane", "Doe", "1971-02-03")]
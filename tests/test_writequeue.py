@@ -0,0 +1,62 @@
+"""Group commit: failed writes, savepoint isolation and the writer thread's health."""
+# test_writequeue.py
+
+import sqlite3
+
+import pytest
+
+from library.database import DatabaseHandler
+from library.writequeue import WriteQueue
+
+INSERT_GENRE = 'INSERT INTO Genre (GenreName) VALUES (?)'
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "library.db")
+    DatabaseHandler(concurrent=True, path=path).init_table()
+    return path
+
+
+@pytest.fixture
+def writes(path):
+    # A long delay, so that writes submitted together land in one batch.
+    writes = WriteQueue(path, max_delay=0.2)
+    yield writes
+    writes.close()
+
+
+def genres(path: str) -> list:
+    return [row[0] for row in DatabaseHandler(path=path)._conn.execute('SELECT GenreName FROM Genre ORDER BY 1')]
+
+
+def test_bad_parameter_fails_only_its_write(path, writes):
+    bad = writes.submit([('UPDATE Genre SET GenreName = ? WHERE Genre_ID = 1', (10 ** 30,))])
+    good = writes.submit([(INSERT_GENRE, ("Poetry",))])
+    with pytest.raises(OverflowError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5) is None
+    assert writes._thread.is_alive()
+    writes.submit([(INSERT_GENRE, ("Drama",))]).result(timeout=5)
+    assert genres(path) == ["Drama", "Poetry"]
+
+
+def test_failed_write_is_rolled_back_to_its_savepoint(path, writes):
+    first = writes.submit([(INSERT_GENRE, ("Poetry",))])
+    # Both statements of a write go together: the duplicate undoes the insert before it.
+    duplicate = writes.submit([(INSERT_GENRE, ("Drama",)), (INSERT_GENRE, ("Poetry",))])
+    last = writes.submit([(INSERT_GENRE, ("Horror",))])
+    first.result(timeout=5)
+    last.result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError, match="UNIQUE"):
+        duplicate.result(timeout=5)
+    assert writes.batches == 1
+    assert genres(path) == ["Horror", "Poetry"]
+
+
+def test_submit_fails_once_the_writer_has_stopped(writes):
+    # Stop the writer behind the queue's back, as an uncaught error would.
+    writes._pending.put(None)
+    writes._thread.join(timeout=5)
+    with pytest.raises(RuntimeError, match="writer thread has stopped"):
+        writes.submit([(INSERT_GENRE, ("Poetry",))])